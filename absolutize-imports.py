@@ -4,6 +4,7 @@ from argparse_compat import argparse
 from import_util import get_file, sort_files_by_dependency, IMPORT_ABSOLUTIZE_TUPLE, ALL_ABSOLUTIZE_TUPLE
 from custom_arguments import add_libname_arguments, update_env_with_libnames, add_logging_arguments, process_logging_arguments
 from file_util import write_to_file
+from probe_cache import set_probe_cache_file
 
 SCRIPT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
 
@@ -24,6 +25,21 @@ parser.add_argument('--coqc', metavar='COQC', dest='coqc', type=str, default='co
                     help='The path to the coqc program.')
 parser.add_argument('--coq_makefile', metavar='COQ_MAKEFILE', dest='coq_makefile', type=str, default='coq_makefile',
                     help='The path to the coq_makefile program.')
+parser.add_argument('--glob-jobs', metavar='N', dest='glob_jobs', type=int, default=None,
+                    help=("The maximum number of coqc jobs to run at once when generating .glob files " +
+                          "(Default: the number of CPUs)."))
+parser.add_argument('--persist-glob-index', dest='persist_glob_index', action='store_const', const=True, default=False,
+                    help=("Store the parsed references of each .glob file next to it (in a .glob.idx file), " +
+                          "so that later runs need not re-parse unchanged .glob files."))
+parser.add_argument('--project-index', metavar='FILE', dest='project_index', type=str, default=None,
+                    help=("An sqlite database in which to store parsed .glob files and absolutized " +
+                          "file contents, keyed on the digests of the files they come from, so that " +
+                          "they can be reused across runs (and across scripts)."))
+parser.add_argument('--probe-cache', metavar='FILE', dest='probe_cache', type=str, default=None,
+                    help=("A file in which to cache what we learn by probing the Coq binaries " +
+                          "(versions, supported options, etc.) across runs; the results are keyed on " +
+                          "the path, size, modification time, and inode of each binary " +
+                          "(Default: the value of the environment variable COQ_TOOLS_PROBE_CACHE, if set)."))
 add_libname_arguments(parser)
 add_logging_arguments(parser)
 
@@ -39,6 +55,7 @@ def absolutize_imports(filename, **kwargs):
 
 if __name__ == '__main__':
     args = process_logging_arguments(parser.parse_args())
+    set_probe_cache_file(args.probe_cache)
     def prepend_coqbin(prog):
         if args.coqbin != '':
             return os.path.join(args.coqbin, prog)
@@ -52,6 +69,9 @@ if __name__ == '__main__':
         'suffix': args.suffix,
         'absolutize': args.absolutize,
         'coq_makefile': prepend_coqbin(args.coq_makefile),
+        'glob_jobs': args.glob_jobs,
+        'persist_glob_index': args.persist_glob_index,
+        'project_index': args.project_index,
         'input_files': tuple(f.name for f in args.input_files),
         }
     update_env_with_libnames(env, args)
@@ -0,0 +1,108 @@
+from __future__ import with_statement
+import os, sys, glob, json, time, signal, subprocess, tempfile, threading
+from fake_coq import MODEL_ENV_VAR
+SCRIPT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIRECTORY = os.path.dirname(SCRIPT_DIRECTORY)
+sys.path.insert(0, ROOT_DIRECTORY)
+from oracle_trace import ORACLE_TRACE_ENV_VAR, read_trace
+
+__all__ = ["ROOT_DIRECTORY", "example_cases", "fake_case", "fake_cases", "run_case"]
+
+# The cases which the benchmarks run find-bug.py on, and how to run
+# them.  A case is a dict with the command to run ('cmds'), the
+# directory to run it in ('cwd'), the environment variables to add
+# ('env'), the commands to run before it, untimed ('setup'), and the
+# patterns of the files it and its setup leave behind ('clean').
+#
+# A case for the fake Coq may have a case.json next to its model.json,
+# with the extra arguments to pass to find-bug.py ("args", e.g., the
+# -R binding of the libraries which bug.v [Require]s) and the files
+# to compile, in order, with those arguments before running it
+# ("build").
+#
+# The oracle calls are counted with an oracle trace (see
+# oracle_trace.py), given by the environment variable, so that the
+# examples which run find-bug.py several times, or which do not pass
+# their arguments on to it, are counted in full.
+
+EXAMPLES_DIRECTORY = os.path.join(ROOT_DIRECTORY, 'examples')
+FIND_BUG = os.path.join(ROOT_DIRECTORY, 'find-bug.py')
+
+def example_cases():
+    cases = []
+    for script in sorted(glob.glob(os.path.join(EXAMPLES_DIRECTORY, 'run-example-*.sh'))):
+        name = os.path.basename(script)[len('run-example-'):-len('.sh')]
+        cases.append((name, {'cmds': ['bash', script], 'cwd': EXAMPLES_DIRECTORY, 'env': {}, 'clean': []}))
+    return cases
+
+def fake_case(directory, args=(), build=()):
+    """The case of minimizing directory/bug.v into bug_min.v with the
+    fake Coq, following directory/model.json, and with the extra
+    arguments args to find-bug.py, after compiling the files build"""
+    coqc = os.path.join(SCRIPT_DIRECTORY, 'fake-coqc')
+    cmds = [sys.executable, FIND_BUG, 'bug.v', 'bug_min.v', '-y',
+            '--coqc', coqc,
+            '--coqtop', os.path.join(SCRIPT_DIRECTORY, 'fake-coqtop'),
+            '--coq_makefile', os.path.join(SCRIPT_DIRECTORY, 'fake-coq_makefile')] + list(args)
+    built = [os.path.splitext(name)[0] + ext for name in build for ext in ('.vo', '.glob')]
+    return {'cmds': cmds, 'cwd': directory, 'env': {MODEL_ENV_VAR: os.path.join(directory, 'model.json')},
+            'setup': [[coqc, '-q'] + list(args) + [name] for name in build],
+            'clean': ['bug_min.*', 'bug.glob'] + built}
+
+def fake_cases():
+    cases = []
+    for model in sorted(glob.glob(os.path.join(SCRIPT_DIRECTORY, '*', 'model.json'))):
+        directory = os.path.dirname(model)
+        config = {}
+        if os.path.exists(os.path.join(directory, 'case.json')):
+            with open(os.path.join(directory, 'case.json'), 'r') as f:
+                config = json.load(f)
+        cases.append((os.path.basename(directory), fake_case(directory, args=config.get('args', ()), build=config.get('build', ()))))
+    return cases
+
+def run_case(case, timeout=None, log_file=None):
+    """Runs the case, and returns its metrics"""
+    trace = tempfile.NamedTemporaryFile(suffix='.jsonl', prefix='oracle-trace', delete=False)
+    trace.close()
+    env = dict(os.environ)
+    env.update(case['env'])
+    env[ORACLE_TRACE_ENV_VAR] = trace.name
+    env['PYTHON'] = sys.executable
+    timed_out = [False]
+    try:
+        with open(os.devnull, 'rb') as null, open(log_file or os.devnull, 'ab') as log:
+            for cmds in case.get('setup', []):
+                if subprocess.call(cmds, stdin=null, stdout=log, stderr=subprocess.STDOUT, cwd=case['cwd'], env=env) != 0:
+                    raise ValueError('Could not set up the case: "%s" failed' % '" "'.join(cmds))
+            start = time.time()
+            # in its own process group, so that a timeout kills coqc too
+            p = subprocess.Popen(case['cmds'], stdin=null, stdout=log, stderr=subprocess.STDOUT,
+                                 cwd=case['cwd'], env=env, preexec_fn=os.setsid)
+            def kill():
+                timed_out[0] = True
+                try:
+                    os.killpg(p.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            timer = threading.Timer(timeout, kill) if timeout else None
+            if timer is not None: timer.start()
+            # wait4 gives the peak RSS of the process tree of the case
+            # (in kilobytes on Linux, in bytes on macOS)
+            pid, status, rusage = os.wait4(p.pid, 0)
+            p.returncode = (os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status))
+            wall = time.time() - start
+            if timer is not None: timer.cancel()
+        records = read_trace(trace.name)
+    finally:
+        os.remove(trace.name)
+        for pattern in case['clean']:
+            for name in glob.glob(os.path.join(case['cwd'], pattern)):
+                os.remove(name)
+    runs = [record for record in records if record['kind'] == 'run']
+    misses = [record for record in runs if record['cache'] == 'miss']
+    coq_time = sum(record['wall'] or 0.0 for record in misses)
+    return {'returncode': p.returncode, 'timed_out': timed_out[0], 'wall': wall,
+            'oracle_calls': len(runs), 'coq_runs': len(misses),
+            'cache_hit_rate': (float(len(runs) - len(misses)) / len(runs) if runs else 0.0),
+            'coq_time': coq_time, 'python_time': max(0.0, wall - coq_time),
+            'peak_rss_kb': rusage.ru_maxrss}
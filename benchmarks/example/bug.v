@@ -0,0 +1,11 @@
+(* comment. *)
+Definition foo := 1.
+Definition unused := 2.
+Lemma bar : True.
+Proof.
+  exact I.
+Qed.
+Lemma slow_one : True. Proof. exact I. Qed.
+Goal True.
+  pose bar. bug_here.
+Qed.
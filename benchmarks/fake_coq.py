@@ -0,0 +1,481 @@
+from __future__ import with_statement, print_function
+import os, sys, re, json, time
+
+__all__ = ["MODEL_ENV_VAR", "load_model", "split_sentences", "FakeCoq", "main", "coq_makefile_main"]
+
+# A stand-in for coqc and coqtop, which behaves just enough like them
+# for the probes and the outputs that coq-tools relies on, so that
+# the minimizer can be benchmarked and regression-tested without Coq,
+# and without Coq's variance in timing.
+#
+# It does not check anything.  Instead, it splits its input into
+# sentences, tracks which names each sentence defines, and fails
+# according to a declarative model, read from the JSON file named by
+# the environment variable below.  The model is a dict with the
+# following (optional) keys:
+#
+#  - "version": the version of Coq to claim to be (default 8.13.2);
+#
+#  - "error": {"at": REGEX, "message": MESSAGE, "requires": [NAME...]}:
+#    the first sentence matching REGEX fails with MESSAGE (default
+#    "Error: Fake error."), provided that all of the NAMEs have been
+#    defined by earlier sentences;
+#
+#  - "depends": {NAME: [NAME...]}: the sentence defining each key
+#    fails unless the names it depends on have been defined by
+#    earlier sentences;
+#
+#  - "names": [NAME...]: names which, like the names in "depends",
+#    are known to the model; any sentence which mentions a known name
+#    which has not been defined yet fails with "The reference NAME
+#    was not found in the current environment.";
+#
+#  - "latency": {"startup": SECONDS, "default": SECONDS,
+#    "sentences": [{"match": REGEX, "seconds": SECONDS}...]}: how long
+#    to take (by sleeping), once per run and per sentence.  Sentences
+#    inside of proofs are free when proofs are skipped (-vos, -quick).
+#
+# Compiled files (.vo, .vos, .vio) record the names they define, so
+# that [Require]s of files bound with -Q or -R bring those names into
+# scope; [Require]s of other libraries are ignored.  The .glob files
+# are written before checking anything, like coqc's, and record only
+# the name of the file and its [Require]s of bound libraries, which is
+# all that inlining needs.  There is also a fake coq_makefile, which writes
+# a Makefile that builds .vo and .glob files with the fake coqc.
+
+MODEL_ENV_VAR = 'FAKE_COQ_MODEL'
+DEFAULT_VERSION = '8.13.2'
+FAKE_COQLIB = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fake-coqlib')
+
+# options which take this many arguments; all other options take none
+OPTION_ARITY = {'-Q': 2, '-R': 2, '-I': 1, '-top': 1, '-topfile': 1, '-w': 1, '-native-compiler': 1,
+                '-load-vernac-source': 1, '-l': 1, '-load-vernac-object': 1, '-o': 1, '-coqlib': 1,
+                '-set': 1, '-unset': 1, '-require': 1, '-require-import': 1, '-ri': 1, '-rifrom': 2,
+                '-arg': 1, '-dump-glob': 1, '-type-in-type': 0}
+HELP_OPTIONS = (('-I dir', 'look for ML files in dir'),
+                ('-Q dir coqdir', 'map physical dir to logical coqdir'),
+                ('-R dir coqdir', 'recursively map physical dir to logical coqdir'),
+                ('-top coqdir', 'set the toplevel name to be coqdir instead of Top'),
+                ('-coqlib dir', 'set the coq standard library directory'),
+                ('-load-vernac-source f', 'load Coq file f.v (Load "f".)'),
+                ('-l f', 'load Coq file f.v (Load "f".)'),
+                ('-o f.vo', 'use f.vo as the output file name'),
+                ('-w (w1,..,wn)', 'configure display of warnings'),
+                ('-native-compiler (yes|no|ondemand)', 'enable the native compiler'),
+                ('-nois', 'start with an empty state'),
+                ('-noinit', 'start with an empty state'),
+                ('-q', 'skip loading of rcfile'),
+                ('-v', 'print Coq version and exit'),
+                ('-config', 'print Coq configuration information and exit'),
+                ('-where', 'print Coq\'s standard library location and exit'),
+                ('-time', 'display the time taken by each command'),
+                ('-emacs', 'tells Coq it is executed under Emacs'),
+                ('-quick', 'quickly compile .v files to .vio files (skip proofs)'),
+                ('-vos', 'compile .v files to .vos files (skip proofs)'),
+                ('-indices-matter', 'levels of indices (and nonuniform parameters) contribute to the level of inductives'),
+                ('-impredicative-set', 'set sort Set impredicative'),
+                ('-batch', 'batch mode (exits just after argument parsing)'))
+
+BEGIN_PROOF_REG = re.compile(r'^\s*(?:#\[[^\]]*\]\s*)?(?:(?:Local|Global|Polymorphic|Monomorphic|Program)\s+)*(?:Lemma|Theorem|Fact|Remark|Corollary|Proposition|Example|Definition|Instance|Fixpoint|Goal)\b')
+END_PROOF_REG = re.compile(r'^\s*(?:Qed|Defined|Admitted|Abort(?:\s+All)?|Save(?:\s+\S+)?)\s*\.\s*$')
+PROOF_TERM_REG = re.compile(r'^\s*Proof\s+\S')
+DEFINE_REG = re.compile(r'^\s*(?:#\[[^\]]*\]\s*)?(?:(?:Local|Global|Polymorphic|Monomorphic|Program|Private|Cumulative|NonCumulative)\s+)*'
+                        r'(?:Definition|Lemma|Theorem|Fact|Remark|Corollary|Proposition|Example|Fixpoint|CoFixpoint|'
+                        r'Inductive|CoInductive|Variant|Record|Structure|Class|Instance|Axiom|Parameter|Variable|'
+                        r'Hypothesis|Conjecture|Ltac|Let)\s+([A-Za-z_][\w\']*)')
+ASSUME_REG = re.compile(r'^\s*(?:(?:Local|Global|Polymorphic|Monomorphic)\s+)*(?:Axiom|Parameter|Variable|Hypothesis|Conjecture)\b')
+REQUIRE_REG = re.compile(r'^\s*(?:From\s+(\S+)\s+)?Require\s+(?:(?:Import|Export)\s+)?(.*?)\s*\.\s*$', re.DOTALL)
+IDENT_REG = re.compile(r'[A-Za-z_][\w\']*')
+
+def load_model():
+    path = os.environ.get(MODEL_ENV_VAR)
+    if not path: return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def split_sentences(text):
+    """Returns a list of (start, end) byte offsets of the sentences of
+    text (a bytes object); each sentence ends just after its period,
+    and starts just after the end of the previous one"""
+    sentences = []
+    i, start, depth, in_string = 0, 0, 0, False
+    n = len(text)
+    while i < n:
+        c = text[i:i + 1]
+        if in_string:
+            if c == b'"': in_string = False
+        elif c == b'"':
+            # strings are lexed inside of comments, too
+            in_string = True
+        elif text[i:i + 2] == b'(*':
+            depth += 1
+            i += 1
+        elif depth > 0 and text[i:i + 2] == b'*)':
+            depth -= 1
+            i += 1
+        elif depth == 0 and c == b'.' and (i + 1 == n or text[i + 1:i + 2].isspace()) and text[start:i].strip():
+            sentences.append((start, i + 1))
+            start = i + 1
+        i += 1
+    return sentences
+
+def chars_header(data, start, end, seconds):
+    """The header which -time prints for the sentence data[start:end]"""
+    return 'Chars %d - %d [%s] %.3f secs (%.3fu,0.s)\n' % (start, end, re.sub(r'\s', '~', data[start:end].decode('utf-8').strip()), seconds, seconds)
+
+def strip_comments(sentence):
+    """Replaces each (possibly nested) comment of sentence by a space"""
+    pieces, depth, in_string, i = [], 0, False, 0
+    while i < len(sentence):
+        c = sentence[i]
+        if c == '"':
+            in_string = not in_string
+        elif not in_string and sentence[i:i + 2] == '(*':
+            if depth == 0: pieces.append(' ')
+            depth += 1
+            i += 2
+            continue
+        elif not in_string and depth > 0 and sentence[i:i + 2] == '*)':
+            depth -= 1
+            i += 2
+            continue
+        if depth == 0: pieces.append(c)
+        i += 1
+    return ''.join(pieces)
+
+class FakeCoqError(Exception):
+    pass
+
+class FakeCoq(object):
+    def __init__(self, model, args):
+        self.model = model
+        self.args = args
+        self.flags = set()
+        self.options = []
+        self.files = []
+        self.bindings = [] # (logical prefix, physical dir)
+        self.parse_args(args)
+        self.skip_proofs = bool(self.flags & set(['-vos', '-quick']))
+        self.defined = set()
+        self.in_proof = None
+        self.depends = dict(model.get('depends', {}))
+        self.known_names = set(model.get('names', [])) | set(self.depends.keys())
+        for deps in self.depends.values(): self.known_names |= set(deps)
+        self.error = model.get('error')
+        self.error_reg = re.compile(self.error['at']) if self.error else None
+        latency = model.get('latency', {})
+        self.default_latency = latency.get('default', 0.0)
+        self.sentence_latencies = [(re.compile(entry['match']), entry['seconds']) for entry in latency.get('sentences', [])]
+        self.startup_latency = latency.get('startup', 0.0)
+
+    def parse_args(self, args):
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg.startswith('-'):
+                arity = OPTION_ARITY.get(arg, 0)
+                self.options.append((arg, tuple(args[i + 1:i + 1 + arity])))
+                if arg in ('-Q', '-R') and i + 2 < len(args):
+                    self.bindings.append((args[i + 2], args[i + 1]))
+                if arity == 0: self.flags.add(arg)
+                i += 1 + arity
+            else:
+                self.files.append(arg)
+                i += 1
+
+    def option_values(self, name):
+        return [values for option, values in self.options if option == name]
+
+    def version(self):
+        return self.model.get('version', DEFAULT_VERSION)
+
+    def sleep_for(self, sentence):
+        for reg, seconds in self.sentence_latencies:
+            if reg.search(sentence): return seconds
+        return self.default_latency
+
+    def find_library(self, name, from_prefix=None):
+        """Returns the compiled file which [Require]ing name loads, or
+        None if name is not bound by -Q or -R"""
+        if from_prefix: name = from_prefix + '.' + name
+        for prefix, directory in self.bindings:
+            if name == prefix or not name.startswith(prefix + '.'): continue
+            base = os.path.join(directory, *name[len(prefix) + 1:].split('.'))
+            for ext in ('.vo', '.vos', '.vio'):
+                if os.path.exists(base + ext): return base + ext
+            raise FakeCoqError('Error: Cannot find a physical path bound to logical path %s.' % name)
+        return None
+
+    def is_bound(self, name):
+        return any(name.startswith(prefix + '.') for prefix, directory in self.bindings)
+
+    def require_references(self, data):
+        """Returns the (inclusive) byte ranges and the full names of the
+        libraries bound by -Q or -R which data [Require]s"""
+        references = []
+        for start, end in split_sentences(data):
+            sentence = data[start:end].decode('utf-8')
+            match = REQUIRE_REG.match(strip_comments(sentence))
+            if not match: continue
+            from_prefix, names = match.groups()
+            offset = sentence.index('Require') + len('Require')
+            for name in names.split():
+                name = name.strip('"')
+                full_name = from_prefix + '.' + name if from_prefix else name
+                position = sentence.find(name, offset)
+                if position < 0 or not self.is_bound(full_name): continue
+                name_start = start + len(sentence[:position].encode('utf-8'))
+                references.append((name_start, name_start + len(name.encode('utf-8')) - 1, full_name))
+                offset = position + len(name)
+        return references
+
+    def require(self, sentence):
+        match = REQUIRE_REG.match(sentence)
+        if not match: return
+        from_prefix, names = match.groups()
+        for name in names.split():
+            path = self.find_library(name.strip('"'), from_prefix)
+            if path is None: continue
+            try:
+                with open(path, 'r') as f:
+                    self.defined |= set(json.load(f)['names'])
+            except (IOError, OSError, ValueError, KeyError):
+                raise FakeCoqError('Error: The file %s contains library %s and not library %s' % (path, 'Top', name))
+
+    def check_sentence(self, sentence):
+        """Updates the state with sentence, returning the list of
+        messages it produces, or raising FakeCoqError if it fails"""
+        code = strip_comments(sentence)
+        in_proof = self.in_proof is not None
+        if in_proof and self.skip_proofs and not END_PROOF_REG.match(code):
+            return []
+        if self.error_reg is not None and self.error_reg.search(sentence) and all(name in self.defined for name in self.error.get('requires', [])):
+            raise FakeCoqError(self.error.get('message', 'Error: Fake error.'))
+        match = DEFINE_REG.match(code)
+        name = match.group(1) if match else None
+        for dep in self.depends.get(name, []):
+            if dep not in self.defined:
+                raise FakeCoqError('Error: The reference %s was not found in the current environment.' % dep)
+        for ident in IDENT_REG.findall(code):
+            if ident != name and ident in self.known_names and ident not in self.defined:
+                raise FakeCoqError('Error: The reference %s was not found in the current environment.' % ident)
+        self.require(code)
+        messages = []
+        if in_proof:
+            if END_PROOF_REG.match(code) or PROOF_TERM_REG.match(code):
+                proof_name, self.in_proof = self.in_proof, None
+                if proof_name and not re.match(r'^\s*Abort', code):
+                    self.defined.add(proof_name)
+                    messages.append('%s is defined' % proof_name)
+        elif name is not None or re.match(r'^\s*Goal\b', code):
+            if BEGIN_PROOF_REG.match(code) and ':=' not in code:
+                self.in_proof = name or 'Unnamed_thm'
+            else:
+                self.defined.add(name)
+                messages.append('%s is %s' % (name, 'assumed' if ASSUME_REG.match(code) else 'defined'))
+        return messages
+
+    def run_sentences(self, data, on_sentence, begin=0):
+        """Checks each sentence of data (bytes) which starts at or
+        after begin, calling on_sentence with its offsets, its
+        messages, and the time it took; returns the error and the
+        offsets of the sentence which failed, or None"""
+        for start, end in split_sentences(data):
+            if start < begin: continue
+            sentence = data[start:end].decode('utf-8')
+            seconds = 0.0 if (self.in_proof is not None and self.skip_proofs) else self.sleep_for(sentence)
+            if seconds > 0: time.sleep(seconds)
+            try:
+                messages = self.check_sentence(sentence)
+            except FakeCoqError as e:
+                return (str(e), start, end)
+            on_sentence(start, end, messages, seconds)
+        return None
+
+    def error_location(self, data, start, end):
+        """Returns the line number, and the byte offsets within the
+        line, of the part of data[start:end] after leading whitespace"""
+        while start < end and data[start:start + 1].isspace(): start += 1
+        line_start = data.rfind(b'\n', 0, start) + 1
+        return data.count(b'\n', 0, start) + 1, start - line_start, end - line_start
+
+    def compile_file(self, file_name, out):
+        with open(file_name, 'rb') as f:
+            data = f.read()
+        ext = '.vos' if '-vos' in self.flags else '.vio' if '-quick' in self.flags else '.vo'
+        globs = self.option_values('-dump-glob')
+        glob_name = globs[-1][0] if globs else (os.path.splitext(file_name)[0] + '.glob' if ext == '.vo' else None)
+        if glob_name is not None:
+            with open(glob_name, 'w') as f:
+                f.write('DIGEST NO\nF%s\n' % os.path.splitext(os.path.basename(file_name))[0])
+                f.write(''.join('R%d:%d %s <> <> lib\n' % reference for reference in self.require_references(data)))
+        def on_sentence(start, end, messages, seconds):
+            if '-time' in self.flags:
+                out.write(chars_header(data, start, end, seconds))
+        error = self.run_sentences(data, on_sentence)
+        if error is not None:
+            message, start, end = error
+            line, char_start, char_end = self.error_location(data, start, end)
+            out.write('File "%s", line %d, characters %d-%d:\n%s\n' % (file_name, line, char_start, char_end, message))
+            return 1
+        if self.in_proof is not None:
+            out.write('File "%s", line %d, characters 0-0:\nError: There are pending proofs in file %s: %s.\n'
+                      % (file_name, data.count(b'\n') + 1, file_name, self.in_proof))
+            return 1
+        outputs = self.option_values('-o')
+        out_name = outputs[-1][0] if outputs else os.path.splitext(file_name)[0] + ext
+        with open(out_name, 'w') as f:
+            json.dump({'fake_coq': 1, 'names': sorted(self.defined)}, f)
+        return 0
+
+    def run_emacs_toplevel(self, data, out, err):
+        """Mimics coqtop -emacs: each sentence gets its (-time) Chars
+        header and its messages on stdout, followed by a prompt (on
+        stderr) naming the proof in progress, if any"""
+        state_number = [1]
+        def prompt():
+            proof = self.in_proof
+            return '<prompt>%s < %d |%s| %d < </prompt>' % (proof or 'Coq', state_number[0], proof or '', 0)
+        def on_sentence(start, end, messages, seconds):
+            state_number[0] += 1
+            if '-time' in self.flags:
+                out.write(chars_header(data, start, end, seconds))
+            for message in messages:
+                out.write(message + '\n')
+            out.flush()
+            err.write(prompt())
+            err.flush()
+        err.write(prompt())
+        err.flush()
+        begin = 0
+        while True:
+            error = self.run_sentences(data, on_sentence, begin=begin)
+            if error is None: break
+            message, start, end = error
+            if '-time' in self.flags:
+                out.write(chars_header(data, start, end, 0.0))
+            out.write('Toplevel input, characters %d-%d:\n%s\n' % (start, end, message))
+            out.flush()
+            err.write(prompt())
+            err.flush()
+            # coqtop carries on with the next sentence
+            begin = end
+        return 0
+
+    def run(self, is_coqtop, stdin, out, err):
+        if '-v' in self.flags or '--version' in self.flags:
+            out.write('The Coq Proof Assistant, version %s (January 2021)\ncompiled on Jan 1 2021 0:00:00 with OCaml 4.07.1\n' % self.version())
+            return 0
+        if '--help' in self.flags or '-help' in self.flags or '-h' in self.flags:
+            out.write('Usage: %s <options> <Coq options> file...\n\n' % ('coqtop' if is_coqtop else 'coqc'))
+            for option, description in HELP_OPTIONS:
+                out.write('  %s\t%s\n' % (option, description))
+            return 0
+        if '-config' in self.flags:
+            coqlib = self.model.get('coqlib', FAKE_COQLIB)
+            out.write('COQLIB=%s/\nCOQCORELIB=%s/../coq-core/\nDOCDIR=%s/../doc/\nOCAMLFIND=ocamlfind\nCAMLFLAGS=\nWARN=\n'
+                      'HASNATDYNLINK=true\nCOQ_SRC_SUBDIRS=\nNATIVE_COMPILER_DEFAULT=no\n' % (coqlib, coqlib, coqlib))
+            return 0
+        if '-where' in self.flags:
+            out.write('%s\n' % self.model.get('coqlib', FAKE_COQLIB))
+            return 0
+        if self.startup_latency > 0: time.sleep(self.startup_latency)
+        sources = [values[0] for values in self.option_values('-load-vernac-source') + self.option_values('-l')]
+        if is_coqtop and sources:
+            # like coqc, but without output files
+            name = sources[-1] if sources[-1].endswith('.v') else sources[-1] + '.v'
+            with open(name, 'rb') as f:
+                data = f.read()
+            error = self.run_sentences(data, (lambda *args: None))
+            if error is not None:
+                message, start, end = error
+                line, char_start, char_end = self.error_location(data, start, end)
+                out.write('File "%s", line %d, characters %d-%d:\n%s\n' % (name, line, char_start, char_end, message))
+                return 1
+            return 0
+        if is_coqtop and self.files:
+            out.write("Don't know what to do with %s\n" % self.files[0])
+            return 1
+        if is_coqtop:
+            data = stdin.read()
+            if '-emacs' in self.flags:
+                return self.run_emacs_toplevel(data, out, err)
+            out.write('Welcome to Coq %s\n' % self.version())
+            error = self.run_sentences(data, (lambda start, end, messages, seconds: out.write(''.join(message + '\n' for message in messages))))
+            if error is not None:
+                message, start, end = error
+                out.write('Toplevel input, characters %d-%d:\n%s\n' % (start, end, message))
+                return 1
+            return 0
+        for file_name in self.files:
+            if not os.path.exists(file_name):
+                out.write('Error: Can\'t find file %s\n' % file_name)
+                return 1
+            returncode = self.compile_file(file_name, out)
+            if returncode != 0: return returncode
+        return 0
+
+def main(is_coqtop, argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    stdin = sys.stdin.buffer if hasattr(sys.stdin, 'buffer') else sys.stdin
+    try:
+        fake = FakeCoq(load_model(), argv)
+    except (IOError, OSError, ValueError) as e:
+        sys.stderr.write('fake coq: could not load the model from $%s: %s\n' % (MODEL_ENV_VAR, e))
+        return 2
+    returncode = fake.run(is_coqtop, stdin, sys.stdout, sys.stderr)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return returncode
+
+MAKEFILE_TEMPLATE = """COQC ?= %(coqc)s
+COQFLAGS = %(flags)s
+
+all: %(vo_files)s
+
+%%.vo %%.glob: %%.v
+\t$(COQC) $(COQFLAGS) -dump-glob $*.glob $<
+
+.PHONY: all
+"""
+
+def coq_makefile_main(argv=None):
+    """Mimics coq_makefile, for the arguments which coq-tools passes
+    it: COQC = PROG, -o MAKEFILE, -R/-Q/-I bindings, -arg ARG, and
+    the .v files"""
+    argv = sys.argv[1:] if argv is None else argv
+    if '--help' in argv or '-help' in argv or '-h' in argv:
+        sys.stdout.write('Usage: coq_makefile [options] file...\n\n'
+                         '  -Q physicalpath logicalpath\tmap physicalpath to logicalpath\n'
+                         '  -R physicalpath logicalpath\trecursively map physicalpath to logicalpath\n'
+                         '  -I dir\tlook for ML files in dir\n'
+                         '  -arg opt\tpass opt to coqc\n'
+                         '  -o filename\toutput filename\n')
+        return 0
+    coqc, output, flags, v_files = 'coqc', None, [], []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == 'COQC' and argv[i + 1:i + 2] == ['=']:
+            coqc = argv[i + 2]
+            i += 3
+        elif arg == '-o':
+            output = argv[i + 1]
+            i += 2
+        elif arg in ('-Q', '-R'):
+            flags += argv[i:i + 3]
+            i += 3
+        elif arg in ('-I', '-arg'):
+            flags += argv[i + 1:i + 2] if arg == '-arg' else argv[i:i + 2]
+            i += 2
+        else:
+            if arg.endswith('.v'): v_files.append(arg)
+            i += 1
+    contents = MAKEFILE_TEMPLATE % {'coqc': coqc, 'flags': ' '.join(flags),
+                                    'vo_files': ' '.join(os.path.splitext(name)[0] + '.vo' for name in v_files)}
+    if output is None:
+        sys.stdout.write(contents)
+    else:
+        with open(output, 'w') as f:
+            f.write(contents)
+    return 0
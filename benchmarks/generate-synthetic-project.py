@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+from __future__ import print_function
+import os, sys
+from benchmark_cases import ROOT_DIRECTORY
+from synthetic_project import generate_project, write_project, build_project, add_generator_arguments, generator_kwargs
+sys.path.insert(0, ROOT_DIRECTORY)
+from argparse_compat import argparse
+
+parser = argparse.ArgumentParser(description=('Generate a synthetic Coq project, with a planted error in bug.v (or in ' +
+                                              'the file given by --error-file), and a model of it for the fake Coq.'))
+parser.add_argument('directory', metavar='DIR', type=str,
+                    help='The directory to write the project to.')
+add_generator_arguments(parser)
+parser.add_argument('--build-with', metavar='COQC', dest='build_with', type=str, default=None,
+                    help=('Compile the files which bug.v needs with COQC (e.g., benchmarks/fake-coqc), so that ' +
+                          'find-bug.py can be run on bug.v right away.'))
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    project = generate_project(files=args.files, **generator_kwargs(args))
+    write_project(project, args.directory)
+    if args.build_with:
+        try:
+            build_project(project, args.directory, os.path.abspath(args.build_with) if os.path.dirname(args.build_with) else args.build_with)
+        except (OSError, ValueError) as e:
+            print('Error: %s' % e, file=sys.stderr)
+            sys.exit(1)
+    print('Wrote %d files (%d bytes); the error in %s is about %s.'
+          % (len(project['contents']), sum(len(contents) for contents in project['contents'].values()),
+             ('bug.v' if args.error_file is None else 'F%03d.v' % args.error_file), project['target']))
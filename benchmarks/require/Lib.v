@@ -0,0 +1,8 @@
+(* a library which bug.v needs only part of *)
+Definition foo := 1.
+Definition unused_lib := 2.
+Lemma bar : True.
+Proof.
+  exact I.
+Qed.
+Lemma slow_lib : True. Proof. exact I. Qed.
@@ -0,0 +1,5 @@
+Require Import Example.Lib.
+Definition unused := 3.
+Goal True.
+  pose bar. bug_here.
+Qed.
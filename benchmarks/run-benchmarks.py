@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+from __future__ import print_function
+import os, sys, json
+from benchmark_cases import ROOT_DIRECTORY, example_cases, fake_cases, run_case
+sys.path.insert(0, ROOT_DIRECTORY)
+from argparse_compat import argparse
+
+# Runs find-bug.py end-to-end on a set of cases, and records, for
+# each, how many oracle calls it made, how many of them were answered
+# from the cache, how much time went to coq and how much to everything
+# else, and the peak RSS of the processes involved.  The results can
+# be saved as a baseline, and later runs compared against it.
+#
+# There are two kinds of cases:
+#
+#  - the examples, examples/run-example-*.sh, which need a real Coq;
+#
+#  - with --fake, the directories under benchmarks/ which have a
+#    model.json, which are minimized (bug.v into bug_min.v) with the
+#    fake Coq of fake_coq.py.  Their oracle calls are deterministic,
+#    which makes them suitable for catching regressions in pass
+#    ordering and in the drivers.
+
+BASELINE_VERSION = 1
+
+# (metric, format, whether higher values are better)
+METRICS = (('oracle_calls', '%d', False), ('coq_runs', '%d', False), ('cache_hit_rate', '%.2f', True),
+           ('coq_time', '%.1f', False), ('python_time', '%.1f', False), ('peak_rss_kb', '%d', False))
+# a metric regresses when it gets worse than the baseline by more than
+# both the relative and the absolute tolerance
+DEFAULT_THRESHOLDS = {'oracle_calls': {'relative': 0.10, 'absolute': 0},
+                      'coq_runs': {'relative': 0.10, 'absolute': 0},
+                      'cache_hit_rate': {'relative': 0.0, 'absolute': 0.05},
+                      'coq_time': {'relative': 0.25, 'absolute': 1.0},
+                      'python_time': {'relative': 0.25, 'absolute': 1.0},
+                      'peak_rss_kb': {'relative': 0.25, 'absolute': 10240}}
+
+def compare(metrics, baseline, thresholds):
+    """Returns a list of descriptions of how metrics regressed from
+    baseline"""
+    regressions = []
+    if baseline.get('returncode') == 0 and metrics['returncode'] != 0:
+        regressions.append('returncode %d (was 0)' % metrics['returncode'])
+    for metric, fmt, higher_is_better in METRICS:
+        if metric not in baseline: continue
+        threshold = thresholds.get(metric, DEFAULT_THRESHOLDS[metric])
+        worse_by = (baseline[metric] - metrics[metric]) if higher_is_better else (metrics[metric] - baseline[metric])
+        if worse_by > max(threshold.get('relative', 0.0) * abs(baseline[metric]), threshold.get('absolute', 0)):
+            regressions.append(('%s ' + fmt + ' (was ' + fmt + ')') % (metric, metrics[metric], baseline[metric]))
+    return regressions
+
+def format_row(name, metrics, regressions=None):
+    cells = ['%-12s' % name, '%4d' % metrics['returncode']]
+    cells += [(fmt % metrics[metric]).rjust(max(len(metric), 8)) for metric, fmt, higher_is_better in METRICS]
+    row = '  '.join(cells)
+    if metrics['timed_out']: row += '  TIMED OUT'
+    if regressions: row += '  REGRESSED: ' + '; '.join(regressions)
+    return row
+
+def format_header():
+    return '  '.join(['%-12s' % 'case', '  rc'] + [metric.rjust(max(len(metric), 8)) for metric, fmt, higher_is_better in METRICS])
+
+parser = argparse.ArgumentParser(description=('Run find-bug.py end-to-end on the examples (or, with --fake, on the cases ' +
+                                              'for the fake Coq), record oracle calls, cache hit rate, time in coq and ' +
+                                              'elsewhere, and peak RSS, and compare them against a baseline.'))
+parser.add_argument('cases', metavar='CASE', type=str, nargs='*',
+                    help='The cases to run, e.g., 03 for examples/run-example-03.sh (Default: all of them).')
+parser.add_argument('--fake', dest='fake', action='store_const', const=True, default=False,
+                    help=('Run the cases for the fake Coq (the directories under benchmarks/ with a model.json), ' +
+                          'rather than the examples.'))
+parser.add_argument('--baseline', metavar='FILE', dest='baseline', type=str, default=None,
+                    help='Compare against the baseline in FILE, and exit with an error if anything regressed.')
+parser.add_argument('--write-baseline', metavar='FILE', dest='write_baseline', type=str, default=None,
+                    help=('Save the results as a baseline to FILE, keeping the thresholds already in FILE, ' +
+                          'and the results of the cases which were not run.'))
+parser.add_argument('--timeout', metavar='SECONDS', dest='timeout', type=float, default=None,
+                    help='Kill each case after SECONDS seconds.')
+parser.add_argument('--log-dir', metavar='DIR', dest='log_dir', type=str, default=None,
+                    help='Save the output of each case to DIR/CASE.log (Default: discard it).')
+parser.add_argument('--json', dest='json', action='store_const', const=True, default=False,
+                    help='Print the results as JSON, rather than as a table.')
+
+def load_baseline(path):
+    if path is None or not os.path.exists(path):
+        return {'version': BASELINE_VERSION, 'thresholds': DEFAULT_THRESHOLDS, 'cases': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    cases = fake_cases() if args.fake else example_cases()
+    if args.cases:
+        unknown = sorted(set(args.cases) - set(name for name, case in cases))
+        if unknown: parser.error('unknown cases: %s' % ', '.join(unknown))
+        cases = [(name, case) for name, case in cases if name in args.cases]
+    if args.log_dir and not os.path.isdir(args.log_dir): os.makedirs(args.log_dir)
+    baseline = load_baseline(args.baseline)
+    thresholds = baseline.get('thresholds', DEFAULT_THRESHOLDS)
+    results, any_regressed = {}, False
+    if not args.json: print(format_header())
+    for name, case in cases:
+        metrics = run_case(case, timeout=args.timeout,
+                           log_file=(os.path.join(args.log_dir, name + '.log') if args.log_dir else None))
+        regressions = compare(metrics, baseline['cases'][name], thresholds) if name in baseline['cases'] else []
+        if regressions: any_regressed = True
+        results[name] = dict(metrics, regressions=regressions)
+        if not args.json:
+            print(format_row(name, metrics, regressions))
+            sys.stdout.flush()
+    if args.json:
+        print(json.dumps(results, sort_keys=True, indent=2))
+    if args.write_baseline:
+        new_baseline = load_baseline(args.write_baseline)
+        new_baseline['version'] = BASELINE_VERSION
+        new_baseline['mode'] = 'fake' if args.fake else 'coq'
+        for name, metrics in results.items():
+            new_baseline['cases'][name] = dict((key, value) for key, value in metrics.items() if key != 'regressions')
+        with open(args.write_baseline, 'w') as f:
+            json.dump(new_baseline, f, sort_keys=True, indent=2)
+            f.write('\n')
+    sys.exit(1 if any_regressed else 0)
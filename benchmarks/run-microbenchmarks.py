@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+from __future__ import print_function
+import os, re, sys, json, math, time, hashlib
+from benchmark_cases import ROOT_DIRECTORY
+from synthetic_project import generate_project, flatten_project, coqc_time_output, LOGICAL_PREFIX
+sys.path.insert(0, ROOT_DIRECTORY)
+from argparse_compat import argparse
+from strip_comments import strip_comments
+from split_file import split_coq_file_contents, split_coq_file_contents_with_comments, merge_quotations
+from split_definitions import join_definitions
+from admit_abstract import transform_abstract_to_admit
+from import_util import get_references_from_globs, update_with_glob, ALL_ABSOLUTIZE_TUPLE
+import diagnose_error
+
+# Micro-benchmarks of the parsing and regular expression functions
+# which find-bug.py runs on the whole file, thousands of times per
+# minimization, on fixed inputs of growing sizes.  The inputs are
+# derived from a synthetic project (see synthetic_project.py), with a
+# fixed seed, cut to the given size at a sentence boundary; their
+# digests are recorded in the baseline, so that a baseline is only
+# compared against times on the same inputs.
+#
+# Two things are flagged: a time which is slower than the baseline by
+# more than the thresholds (which only makes sense on the machine the
+# baseline was recorded on), and, on any machine, a function whose
+# time grows faster than linearly with the size of its input (by an
+# exponent above --max-exponent, between consecutive sizes at which it
+# takes long enough to be measured reliably).
+
+DEFAULT_SIZES = '1K,10K,100K,1M,10M'
+BASELINE_VERSION = 1
+DEFAULT_THRESHOLDS = {'relative': 0.5, 'absolute': 0.005}
+# times below this are too noisy for computing growth exponents
+MIN_EXPONENT_TIME = 0.01
+# rerun functions which take less than this, to get a stable time
+MIN_REPEAT_TIME = 0.1
+
+def parse_size(size):
+    match = re.match(r'^([0-9]+)([KM]?)$', size.strip().upper())
+    if not match: raise ValueError('Invalid size: %s' % size)
+    return int(match.group(1)) * {'': 1, 'K': 1024, 'M': 1024 * 1024}[match.group(2)]
+
+def format_size(size):
+    for unit, factor in (('M', 1024 * 1024), ('K', 1024)):
+        if size >= factor and size % factor == 0: return '%d%s' % (size // factor, unit)
+    return '%d' % size
+
+def make_contents(size):
+    """Returns Coq source of about size bytes, ending at a sentence
+    boundary"""
+    definitions = 100
+    files = max(1, size // (80 * definitions) + 1)
+    contents = flatten_project(generate_project(seed=0, files=files, definitions=definitions, require_shape='star',
+                                                comment_density=0.2, string_density=0.05))
+    while len(contents) < size:
+        contents += contents
+    end = contents.rfind('.\n', 0, size)
+    return contents[:end + 2] if end >= 0 else contents[:size]
+
+def make_globs(contents):
+    """Returns a .glob file with a reference for each use of each
+    definition of contents, other than the definition itself"""
+    lines = ['DIGEST NO', 'F%s.bug' % LOGICAL_PREFIX]
+    data = contents.encode('utf-8')
+    for match in re.finditer(br'\b(d([0-9]+)_[0-9]+)\b', data):
+        if data[max(0, match.start() - len(b'Definition ')):match.start()] == b'Definition ': continue
+        lines.append('R%d:%d %s.F%s <> %s def' % (match.start(), match.end() - 1, LOGICAL_PREFIX,
+                                                  match.group(2).decode('utf-8'), match.group(1).decode('utf-8')))
+    return '\n'.join(lines) + '\n'
+
+def make_proof(size):
+    """Returns a definition (as split_definitions makes them) of a
+    proof of about size bytes which uses abstract, with and without
+    parentheses"""
+    tactics = ['abstract (idtac; exact I).', 'abstract exact I.', 'idtac.', 'try abstract (exact I; idtac).', 'abstract (exact (I)).']
+    statements, length, i = ['Lemma big : True.', 'Proof.'], 0, 0
+    while length < size:
+        statements.append('  ' + tactics[i % len(tactics)])
+        length += len(statements[-1]) + 1
+        i += 1
+    statements.append('Qed.')
+    return {'statements': tuple(statements), 'statement': '\n'.join(statements), 'terms_defined': ('big',)}
+
+def make_inputs(size):
+    contents = make_contents(size)
+    statements = re.split(r'(?<=[^\.]\.\.\.)\s|(?<=[^\.]\.)\s', strip_comments(contents))
+    output = coqc_time_output(contents)
+    return {'contents': contents,
+            'statements': statements,
+            'definitions': [{'statement': statement} for statement in statements],
+            'output': output,
+            'globs': make_globs(contents),
+            'proof': make_proof(size),
+            'digest': hashlib.sha256(contents.encode('utf-8')).hexdigest()}
+
+def uncached(f):
+    """Clears the memo tables of diagnose_error, which would otherwise
+    answer repeated runs on the same input"""
+    def run(inputs):
+        for name in ('get_error_match', 'get_error_string', 'make_reg_string'):
+            getattr(diagnose_error, name).__self__.clear()
+        return f(inputs)
+    return run
+
+FUNCTIONS = (('strip_comments', (lambda inputs: strip_comments(inputs['contents']))),
+             ('split_coq_file_contents', (lambda inputs: split_coq_file_contents(inputs['contents']))),
+             ('split_coq_file_contents_with_comments', (lambda inputs: split_coq_file_contents_with_comments(inputs['contents']))),
+             ('merge_quotations', (lambda inputs: list(merge_quotations(inputs['statements'])))),
+             ('get_error_match', uncached(lambda inputs: diagnose_error.get_error_match(inputs['output']))),
+             ('make_reg_string', uncached(lambda inputs: diagnose_error.make_reg_string(inputs['output']))),
+             ('get_references_from_globs', (lambda inputs: get_references_from_globs(inputs['globs']))),
+             ('update_with_glob', (lambda inputs: update_with_glob(inputs['contents'].encode('utf-8'), inputs['globs'],
+                                                                   ALL_ABSOLUTIZE_TUPLE, '%s.bug' % LOGICAL_PREFIX, verbose=0))),
+             ('transform_abstract_to_admit', (lambda inputs: transform_abstract_to_admit(inputs['proof'], [], verbose=0))),
+             ('join_definitions', (lambda inputs: join_definitions(inputs['definitions']))))
+
+def time_function(f, inputs, repeat):
+    """Returns the best time of running f on inputs, up to repeat
+    times, stopping early once a run is slow enough to be stable"""
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        f(inputs)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+        if elapsed >= MIN_REPEAT_TIME: break
+    return best
+
+def growth_exponents(times, sizes):
+    """Returns, for each size after the first, the exponent of the
+    growth of the time since the previous size, or None if either
+    time is too small to tell"""
+    exponents = [None]
+    for i in range(1, len(sizes)):
+        if times[i - 1] is None or times[i] is None or min(times[i - 1], times[i]) < MIN_EXPONENT_TIME:
+            exponents.append(None)
+        else:
+            exponents.append(math.log(times[i] / times[i - 1]) / math.log(float(sizes[i]) / sizes[i - 1]))
+    return exponents
+
+parser = argparse.ArgumentParser(description=('Run micro-benchmarks of the parsing and regular expression functions of ' +
+                                              'find-bug.py on fixed inputs of growing sizes, and flag the ones which ' +
+                                              'got slower than a baseline, or which grow faster than linearly.'))
+parser.add_argument('functions', metavar='FUNCTION', type=str, nargs='*',
+                    help='The functions to benchmark (Default: all of them: %s).' % ', '.join(name for name, f in FUNCTIONS))
+parser.add_argument('--sizes', metavar='SIZE,SIZE,...', dest='sizes', type=str, default=DEFAULT_SIZES,
+                    help='The sizes of the inputs, in bytes, with an optional K or M suffix (Default: %s).' % DEFAULT_SIZES)
+parser.add_argument('--repeat', metavar='N', dest='repeat', type=int, default=5,
+                    help='Run each function up to N times on each input, and keep the best time (Default: 5).')
+parser.add_argument('--max-exponent', metavar='X', dest='max_exponent', type=float, default=1.5,
+                    help='Flag the functions whose time grows with the size of the input with an exponent above X (Default: 1.5).')
+parser.add_argument('--baseline', metavar='FILE', dest='baseline', type=str, default=None,
+                    help='Compare against the baseline in FILE.')
+parser.add_argument('--write-baseline', metavar='FILE', dest='write_baseline', type=str, default=None,
+                    help='Save the times as a baseline to FILE, keeping the thresholds already in FILE.')
+parser.add_argument('--json', dest='json', action='store_const', const=True, default=False,
+                    help='Print the results as JSON, rather than as a table.')
+
+def load_baseline(path):
+    if path is None or not os.path.exists(path):
+        return {'version': BASELINE_VERSION, 'thresholds': DEFAULT_THRESHOLDS, 'inputs': {}, 'times': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    functions = FUNCTIONS
+    if args.functions:
+        unknown = sorted(set(args.functions) - set(name for name, f in FUNCTIONS))
+        if unknown: parser.error('unknown functions: %s' % ', '.join(unknown))
+        functions = [(name, f) for name, f in FUNCTIONS if name in args.functions]
+    try:
+        sizes = [parse_size(size) for size in args.sizes.split(',')]
+    except ValueError as e:
+        parser.error(str(e))
+    baseline = load_baseline(args.baseline)
+    thresholds = baseline.get('thresholds', DEFAULT_THRESHOLDS)
+    times = dict((name, {}) for name, f in functions)
+    digests = {}
+    for size in sizes:
+        inputs = make_inputs(size)
+        digests[format_size(size)] = inputs['digest']
+        for name, f in functions:
+            times[name][format_size(size)] = time_function(f, inputs, args.repeat)
+    problems = {}
+    for name, f in functions:
+        problems[name] = []
+        column = [times[name][format_size(size)] for size in sizes]
+        for size, exponent in zip(sizes, growth_exponents(column, sizes)):
+            if exponent is not None and exponent > args.max_exponent:
+                problems[name].append('grows with exponent %.2f up to %s' % (exponent, format_size(size)))
+        for size in sizes:
+            key = format_size(size)
+            old = baseline['times'].get(name, {}).get(key)
+            if old is None or baseline['inputs'].get(key) != digests[key]: continue
+            new = times[name][key]
+            if new - old > max(thresholds['relative'] * old, thresholds['absolute']):
+                problems[name].append('%.4fs at %s (was %.4fs)' % (new, key, old))
+    if args.json:
+        print(json.dumps({'times': times, 'problems': problems}, sort_keys=True, indent=2))
+    else:
+        width = max(len(name) for name, f in functions)
+        print('  '.join(['%-*s' % (width, 'function')] + ['%10s' % format_size(size) for size in sizes]))
+        for name, f in functions:
+            row = '  '.join(['%-*s' % (width, name)] + ['%10.4f' % times[name][format_size(size)] for size in sizes])
+            if problems[name]: row += '  SLOW: ' + '; '.join(problems[name])
+            print(row)
+    if args.write_baseline:
+        new_baseline = load_baseline(args.write_baseline)
+        new_baseline['version'] = BASELINE_VERSION
+        new_baseline['inputs'].update(digests)
+        for name, by_size in times.items():
+            new_baseline['times'].setdefault(name, {}).update(by_size)
+        with open(args.write_baseline, 'w') as f:
+            json.dump(new_baseline, f, sort_keys=True, indent=2)
+            f.write('\n')
+    sys.exit(1 if any(problems.values()) else 0)
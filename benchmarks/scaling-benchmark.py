@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+from __future__ import print_function
+import os, sys, json, math, time, shutil, tempfile
+from benchmark_cases import ROOT_DIRECTORY, fake_case, run_case
+from synthetic_project import (generate_project, flatten_project, write_project, build_project, coqc_time_output,
+                               LOGICAL_PREFIX, add_generator_arguments, generator_kwargs)
+sys.path.insert(0, ROOT_DIRECTORY)
+from argparse_compat import argparse
+from split_file import split_coq_file_contents
+from strip_comments import strip_comments
+from diagnose_error import get_error_match
+from import_util import transitively_close
+
+# Measures how the parsing functions which find-bug.py runs on the
+# whole file, and (with --minimize) find-bug.py itself, scale with the
+# size of the input, on synthetic projects (see synthetic_project.py)
+# of growing numbers of files.  The parsing functions are run on the
+# project flattened into a single file, as after inlining its
+# [Require]s, and get_error_match on what coqc -time prints for that
+# file; transitively_close is run on the graph of dependencies between
+# the definitions.
+#
+# For each step up in size, the exponent of the growth in time with
+# the size in bytes is printed, so that a function which goes
+# quadratic stands out with an exponent near 2.
+
+def best_time(f, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        f()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def uncached_get_error_match(output):
+    # get_error_match is memoized
+    get_error_match.__self__.clear()
+    return get_error_match(output)
+
+FUNCTIONS = (('split_coq_file_contents', (lambda inputs: split_coq_file_contents(inputs['contents']))),
+             ('strip_comments', (lambda inputs: strip_comments(inputs['contents']))),
+             ('get_error_match', (lambda inputs: uncached_get_error_match(inputs['output']))),
+             ('transitively_close', (lambda inputs: transitively_close(dict(inputs['depends'])))))
+
+def measure(files, args):
+    project = generate_project(files=files, **generator_kwargs(args))
+    contents = flatten_project(project)
+    inputs = {'contents': contents, 'output': coqc_time_output(contents),
+              'depends': dict((name, tuple(refs)) for name, refs in project['depends'].items())}
+    result = {'files': files, 'definitions': len(project['depends']), 'bytes': len(contents.encode('utf-8')),
+              'lines': contents.count('\n')}
+    for name, f in FUNCTIONS:
+        result[name] = best_time((lambda: f(inputs)), args.repeat)
+    if args.minimize:
+        directory = tempfile.mkdtemp(prefix='synthetic-project')
+        try:
+            write_project(project, directory)
+            build_project(project, directory, os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fake-coqc'))
+            metrics = run_case(fake_case(directory, args=['-R', '.', LOGICAL_PREFIX]), timeout=args.timeout)
+            result.update(('find-bug %s' % key, metrics[key]) for key in ('returncode', 'wall', 'oracle_calls', 'coq_runs'))
+        finally:
+            shutil.rmtree(directory)
+    return result
+
+def format_header(columns):
+    return '  '.join(['%8s' % 'files', '%12s' % 'bytes'] + ['%24s' % column for column in columns])
+
+def format_row(results, i, columns):
+    """Formats results[i], with the exponent of the growth of each time
+    since results[i - 1]"""
+    result, previous = results[i], (results[i - 1] if i > 0 else None)
+    cells = ['%8d' % result['files'], '%12d' % result['bytes']]
+    for column in columns:
+        value = result.get(column)
+        if isinstance(value, float) and previous is not None and previous.get(column) and value > 0 and result['bytes'] > previous['bytes']:
+            exponent = math.log(value / previous[column]) / math.log(float(result['bytes']) / previous['bytes'])
+            cells.append('%24s' % ('%.4f (^%.2f)' % (value, exponent)))
+        elif isinstance(value, float):
+            cells.append('%24s' % ('%.4f' % value))
+        else:
+            cells.append('%24s' % value)
+    return '  '.join(cells)
+
+parser = argparse.ArgumentParser(description=('Measure how the parsing functions of find-bug.py (and, with --minimize, ' +
+                                              'find-bug.py with the fake Coq) scale with the size of synthetic projects.'))
+parser.add_argument('--sizes', metavar='N,N,...', dest='sizes', type=str, default='1,4,16,64',
+                    help='The numbers of files of the projects to measure (Default: 1,4,16,64).')
+parser.add_argument('--repeat', metavar='N', dest='repeat', type=int, default=3,
+                    help='Time each function N times, and keep the best time (Default: 3).')
+parser.add_argument('--minimize', dest='minimize', action='store_const', const=True, default=False,
+                    help='Also run find-bug.py on each project, with the fake Coq, and record its time and oracle calls.')
+parser.add_argument('--timeout', metavar='SECONDS', dest='timeout', type=float, default=None,
+                    help='With --minimize, kill find-bug.py after SECONDS seconds.')
+parser.add_argument('--json', dest='json', action='store_const', const=True, default=False,
+                    help='Print the results as JSON, rather than as a table.')
+add_generator_arguments(parser, files=False)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+    columns = [name for name, f in FUNCTIONS]
+    if args.minimize: columns += ['find-bug wall', 'find-bug oracle_calls']
+    results = []
+    if not args.json: print(format_header(columns))
+    for files in sizes:
+        results.append(measure(files, args))
+        if not args.json:
+            print(format_row(results, len(results) - 1, columns))
+            sys.stdout.flush()
+    if args.json:
+        print(json.dumps(results, sort_keys=True, indent=2))
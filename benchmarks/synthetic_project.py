@@ -0,0 +1,255 @@
+from __future__ import with_statement
+import os, re, json, random, subprocess
+from collections import OrderedDict
+from fake_coq import MODEL_ENV_VAR, split_sentences, chars_header
+
+__all__ = ["REQUIRE_SHAPES", "LOGICAL_PREFIX", "generate_project", "flatten_project", "write_project", "build_order",
+           "build_project", "coqc_time_output", "add_generator_arguments", "generator_kwargs"]
+
+# Generates synthetic Coq projects, for measuring how the minimizer
+# and its parsing scale with the size and shape of the input.  A
+# project is a set of files F000.v, F001.v, ... (bound to the logical
+# prefix below), each of which [Require Export]s some of the files
+# before it, and a top file, bug.v, with a planted error.  Every file
+# is a sequence of definitions of natural numbers, each of which
+# refers to some of the definitions visible to it, optionally with
+# lemmas about them (with proofs of a given length), string
+# definitions, comments, and nested modules.
+#
+# The error is a [Check (NAME : bool).] right after the definition of
+# NAME, which fails with real Coq (NAME is a nat) and, with the model
+# that is generated alongside the project, with the fake Coq of
+# fake_coq.py.  The model also records which definitions each
+# definition needs, so that the fake Coq rejects the same removals
+# that real Coq would.
+
+REQUIRE_SHAPES = ('chain', 'star', 'tree', 'random')
+LOGICAL_PREFIX = 'Synth'
+ERROR_REG_STRING = r'Check \(\w+ : bool\)'
+
+def file_name(index):
+    return 'F%03d' % index
+
+def make_requires(files, require_shape, require_fan_out, rng):
+    """Returns a dict mapping each file index to the indices of the
+    files it [Require]s directly"""
+    requires = {}
+    for i in range(files):
+        if i == 0: requires[i] = []
+        elif require_shape == 'chain': requires[i] = [i - 1]
+        elif require_shape == 'star': requires[i] = [0]
+        elif require_shape == 'tree': requires[i] = [(i - 1) // 2]
+        else: requires[i] = sorted(rng.sample(range(i), min(i, require_fan_out)))
+    return requires
+
+def ancestors(requires, i):
+    seen, todo = set(), list(requires[i])
+    while todo:
+        j = todo.pop()
+        if j not in seen:
+            seen.add(j)
+            todo.extend(requires[j])
+    return seen
+
+def comment(rng, index):
+    """A comment with the things which make comments hard to strip:
+    nesting, strings containing comment delimiters, and periods"""
+    kinds = ['(* Note %d. This is a comment. *)',
+             '(* Nested %d: (* inner. *) still a comment. *)',
+             '(* String %d: "not a *) comment end." done. *)',
+             '(** Documentation %d, with [code.] in it. *)']
+    return rng.choice(kinds) % index
+
+def generate_project(seed=0, files=10, definitions=100, fan_in=2, fan_out_skew=1.0,
+                     require_shape='chain', require_fan_out=2, module_depth=0, module_size=10,
+                     comment_density=0.1, string_density=0.05, lemma_density=0.3, proof_length=3,
+                     error_file=None, error_position=1.0, latency=0.0):
+    """Returns a dict with the contents of each file of the project
+    (in an OrderedDict, in dependency order, with bug.v last), the
+    direct [Require]s of each file, the dependencies of each
+    definition, the name of the definition that the planted error is
+    about, and the model of the project for the fake Coq.
+
+    definitions is the number of definitions per file; each
+    definition refers to fan_in earlier definitions, chosen uniformly
+    when fan_out_skew is 1, and increasingly among the earliest ones
+    as it grows, so that a few definitions are needed by many.  The
+    error is planted in file error_file (an index, or None for
+    bug.v), after the definition at error_position (a fraction) of
+    it."""
+    if require_shape not in REQUIRE_SHAPES:
+        raise ValueError('Unknown require shape %s (expected one of %s)' % (require_shape, ', '.join(REQUIRE_SHAPES)))
+    if error_file is not None and not 0 <= error_file < files:
+        raise ValueError('error_file must be between 0 and %d' % (files - 1))
+    rng = random.Random(seed)
+    requires = make_requires(files, require_shape, require_fan_out, rng)
+    file_definitions = {}
+    depends = OrderedDict()
+    contents = OrderedDict()
+    target = None
+    for i in range(files):
+        visible = [name for j in sorted(ancestors(requires, i)) for name in file_definitions[j]]
+        names = []
+        lines = []
+        uses_strings = string_density > 0
+        if uses_strings:
+            lines += ['Require Import Coq.Strings.String.', 'Local Open Scope string_scope.']
+        lines += ['Require Export %s.%s.' % (LOGICAL_PREFIX, file_name(j)) for j in requires[i]]
+        lines.append('')
+        error_index = (int(round(error_position * (definitions - 1))) if error_file == i else None)
+        open_modules = []
+        for k in range(definitions):
+            if module_depth > 0 and k % module_size == 0:
+                while open_modules:
+                    module = open_modules.pop()
+                    lines += ['%sEnd %s.' % ('  ' * len(open_modules), module), '%sExport %s.' % ('  ' * len(open_modules), module)]
+                for depth in range(module_depth):
+                    module = 'M%03d_%d_%d' % (i, k // module_size, depth)
+                    lines.append('%sModule %s.' % ('  ' * len(open_modules), module))
+                    open_modules.append(module)
+            indent = '  ' * len(open_modules)
+            name = 'd%03d_%d' % (i, k)
+            if rng.random() < comment_density:
+                lines.append(indent + comment(rng, k))
+            candidates = visible + names
+            refs = []
+            if candidates:
+                for n in range(min(fan_in, len(candidates))):
+                    refs.append(candidates[int(len(candidates) * rng.random() ** fan_out_skew)])
+                refs = sorted(set(refs))
+            depends[name] = refs
+            lines.append('%sDefinition %s : nat := %s.' % (indent, name, ' + '.join(['%d' % k] + refs)))
+            names.append(name)
+            if uses_strings and rng.random() < string_density:
+                lines.append('%sDefinition s%03d_%d : string := "%s. (* not a comment" .' % (indent, i, k, name))
+            if proof_length > 0 and rng.random() < lemma_density:
+                lemma = 'l%03d_%d' % (i, k)
+                lines.append('%sLemma %s : %s = %s.' % (indent, lemma, name, name))
+                lines.append('%sProof.' % indent)
+                lines += ['%s  idtac.' % indent] * (proof_length - 1)
+                lines += ['%s  reflexivity.' % indent, '%sQed.' % indent]
+                depends[lemma] = [name]
+            if k == error_index:
+                lines.append('%sCheck (%s : bool).' % (indent, name))
+                target = name
+        while open_modules:
+            module = open_modules.pop()
+            lines += ['%sEnd %s.' % ('  ' * len(open_modules), module), '%sExport %s.' % ('  ' * len(open_modules), module)]
+        file_definitions[i] = names
+        contents[file_name(i) + '.v'] = '\n'.join(lines) + '\n'
+    if error_file is None:
+        required = set(range(files)) - set(j for i in range(files) for j in requires[i])
+        lines = ['Require Import %s.%s.' % (LOGICAL_PREFIX, file_name(j)) for j in sorted(required)]
+        target = file_definitions[files - 1][-1] if files > 0 and definitions > 0 else None
+        if target is not None: lines.append('Check (%s : bool).' % target)
+    else:
+        lines = ['Require Import %s.%s.' % (LOGICAL_PREFIX, file_name(error_file))]
+    contents['bug.v'] = '\n'.join(lines) + '\n'
+    model = {'error': {'at': ERROR_REG_STRING, 'message': 'Error: The term has type nat while it is expected to have type bool.',
+                       'requires': ([target] if target is not None else [])},
+             'depends': depends,
+             'latency': {'default': latency}}
+    return {'contents': contents, 'requires': dict((file_name(i), [file_name(j) for j in requires[i]]) for i in range(files)),
+            'depends': depends, 'target': target, 'model': model}
+
+def flatten_project(project):
+    """Returns the project as a single file, as inlining all of its
+    [Require]s would"""
+    require_reg = re.compile(r'^Require (?:Import|Export) %s\.\w+\.\n' % LOGICAL_PREFIX, re.MULTILINE)
+    return ''.join(require_reg.sub('', contents) for contents in project['contents'].values())
+
+def coqc_time_output(contents):
+    """What coqc -time prints for contents, when the last sentence
+    fails"""
+    data = contents.encode('utf-8')
+    sentences = split_sentences(data)
+    lines = [chars_header(data, start, end, 0.001) for start, end in sentences]
+    if sentences:
+        start, end = sentences[-1]
+        line = data.count(b'\n', 0, start) + 1
+        lines.append('File "./bug.v", line %d, characters 0-%d:\nError: The term has type nat while it is expected to have type bool.\n'
+                     % (line, end - start))
+    return ''.join(lines)
+
+def build_order(project):
+    """Returns the names of the files which bug.v needs compiled, in
+    dependency order, without the file with the error, if any"""
+    needed = set()
+    todo = re.findall(r'%s\.(\w+)' % LOGICAL_PREFIX, project['contents']['bug.v'])
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo.extend(project['requires'][name])
+    return [name + '.v' for name in sorted(needed)
+            if not re.search(ERROR_REG_STRING, project['contents'][name + '.v'])]
+
+def write_project(project, directory):
+    """Writes the files of the project, a _CoqProject, and the model
+    for the fake Coq (model.json) to directory"""
+    if not os.path.isdir(directory): os.makedirs(directory)
+    for name, contents in project['contents'].items():
+        with open(os.path.join(directory, name), 'w') as f:
+            f.write(contents)
+    with open(os.path.join(directory, '_CoqProject'), 'w') as f:
+        f.write('-R . %s\n\n' % LOGICAL_PREFIX)
+        f.write(''.join(name + '\n' for name in project['contents'].keys()))
+    with open(os.path.join(directory, 'model.json'), 'w') as f:
+        json.dump(project['model'], f, sort_keys=True, indent=2)
+        f.write('\n')
+
+def build_project(project, directory, coqc):
+    """Compiles the files of the project written to directory which
+    bug.v needs, with coqc (following the model of the project, if
+    coqc is the fake one)"""
+    env = dict(os.environ)
+    env[MODEL_ENV_VAR] = os.path.join(os.path.abspath(directory), 'model.json')
+    for name in build_order(project):
+        p = subprocess.Popen([coqc, '-q', '-R', '.', LOGICAL_PREFIX, name], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             cwd=directory, env=env)
+        (stdout, stderr) = p.communicate()
+        if p.returncode != 0:
+            raise ValueError('Could not compile %s:\n%s' % (name, stdout.decode('utf-8', 'replace')))
+
+def add_generator_arguments(parser, files=True):
+    parser.add_argument('--seed', metavar='N', dest='seed', type=int, default=0,
+                        help='The seed of the random choices (Default: 0).')
+    if files:
+        parser.add_argument('--files', metavar='N', dest='files', type=int, default=10,
+                            help='The number of files, besides bug.v (Default: 10).')
+    parser.add_argument('--definitions', metavar='N', dest='definitions', type=int, default=100,
+                        help='The number of definitions per file (Default: 100).')
+    parser.add_argument('--fan-in', metavar='N', dest='fan_in', type=int, default=2,
+                        help='The number of definitions each definition refers to (Default: 2).')
+    parser.add_argument('--fan-out-skew', metavar='X', dest='fan_out_skew', type=float, default=1.0,
+                        help=('How strongly definitions prefer to refer to the earliest definitions; 1 is uniform, ' +
+                              'and larger values make a few definitions needed by many (Default: 1).'))
+    parser.add_argument('--require-shape', metavar='SHAPE', dest='require_shape', choices=REQUIRE_SHAPES, default='chain',
+                        help='The shape of the graph of [Require]s: %s (Default: chain).' % ', '.join(REQUIRE_SHAPES))
+    parser.add_argument('--require-fan-out', metavar='N', dest='require_fan_out', type=int, default=2,
+                        help='With --require-shape random, the number of files each file requires (Default: 2).')
+    parser.add_argument('--module-depth', metavar='N', dest='module_depth', type=int, default=0,
+                        help='How deeply to nest the modules around groups of definitions (Default: 0, no modules).')
+    parser.add_argument('--module-size', metavar='N', dest='module_size', type=int, default=10,
+                        help='The number of definitions in each group of modules (Default: 10).')
+    parser.add_argument('--comment-density', metavar='P', dest='comment_density', type=float, default=0.1,
+                        help='The probability of a comment before each definition (Default: 0.1).')
+    parser.add_argument('--string-density', metavar='P', dest='string_density', type=float, default=0.05,
+                        help='The probability of a string definition after each definition (Default: 0.05).')
+    parser.add_argument('--lemma-density', metavar='P', dest='lemma_density', type=float, default=0.3,
+                        help='The probability of a lemma after each definition (Default: 0.3).')
+    parser.add_argument('--proof-length', metavar='N', dest='proof_length', type=int, default=3,
+                        help='The number of tactics in the proof of each lemma (Default: 3).')
+    parser.add_argument('--error-file', metavar='N', dest='error_file', type=int, default=None,
+                        help='The index of the file to plant the error in (Default: plant it in bug.v).')
+    parser.add_argument('--error-position', metavar='X', dest='error_position', type=float, default=1.0,
+                        help=('With --error-file, where in the file to plant the error, as a fraction of its ' +
+                              'definitions (Default: 1, at the end).'))
+    parser.add_argument('--latency', metavar='SECONDS', dest='latency', type=float, default=0.0,
+                        help='The time the fake Coq takes per sentence, in the generated model (Default: 0).')
+
+def generator_kwargs(args):
+    return dict((key, getattr(args, key)) for key in
+                ('seed', 'definitions', 'fan_in', 'fan_out_skew', 'require_shape', 'require_fan_out',
+                 'module_depth', 'module_size', 'comment_density', 'string_density', 'lemma_density', 'proof_length',
+                 'error_file', 'error_position', 'latency'))
@@ -1,6 +1,6 @@
 from __future__ import print_function
 import os
-from coq_version import group_coq_args
+from coq_version import get_coq_option_table
 from custom_arguments import DEFAULT_LOG, DEFAULT_VERBOSITY
 
 __all__ = ["has_dir_binding", "deduplicate_trailing_dir_bindings", "process_maybe_list"]
@@ -11,13 +11,13 @@ def topname_of_filename(file_name):
 def has_dir_binding(args, coqc_help, file_name=None):
     kwargs = dict()
     if file_name is not None: kwargs['topname'] = topname_of_filename(file_name)
-    bindings = group_coq_args(args, coqc_help, **kwargs)
+    bindings = get_coq_option_table(coqc_help).group_args(args, **kwargs)
     return any(i[0] in ('-R', '-Q') for i in bindings)
 
 def deduplicate_trailing_dir_bindings(args, coqc_help, coq_accepts_top, file_name=None):
     kwargs = dict()
     if file_name is not None: kwargs['topname'] = topname_of_filename(file_name)
-    bindings = group_coq_args(args, coqc_help, **kwargs)
+    bindings = get_coq_option_table(coqc_help).group_args(args, **kwargs)
     ret = []
     for binding in bindings:
         if coq_accepts_top or binding[0] != '-top':
@@ -1,17 +1,21 @@
 from __future__ import with_statement
 import subprocess, tempfile, re
-from diagnose_error import get_coq_output
+from diagnose_error import get_coq_output, get_coq_accepts_fine_grained_debug
 from file_util import clean_v_file
 from memoize import memoize
+from parallel_util import run_dag_in_parallel
+from probe_cache import cached_probe
 import util
 
-__all__ = ["get_coqc_version", "get_coqtop_version", "get_coqc_help", "get_coqc_coqlib", "get_coq_accepts_top", "get_coq_accepts_time", "get_coq_accepts_o", "get_coq_native_compiler_ondemand_fragment", "group_coq_args_split_recognized", "group_coq_args", "coq_makefile_supports_arg", "get_proof_term_works_with_time", "get_ltac_support_snippet"]
+__all__ = ["get_coqc_version", "get_coqtop_version", "get_coqc_help", "get_coqc_coqlib", "get_coq_accepts_top", "get_coq_accepts_time", "get_coq_accepts_o", "get_coq_proof_skipping_args", "get_coq_native_compiler_ondemand_fragment", "group_coq_args_split_recognized", "group_coq_args", "coq_makefile_supports_arg", "get_proof_term_works_with_time", "get_ltac_support_snippet", "prefetch_coq_probes", "CoqOptionTable", "get_coq_option_table"]
 
 @memoize
 def get_coqc_version_helper(coqc):
-    p = subprocess.Popen([coqc, "-q", "-v"], stderr=subprocess.STDOUT, stdout=subprocess.PIPE, stdin=subprocess.PIPE)
-    (stdout, stderr) = p.communicate()
-    return util.normalize_newlines(util.s(stdout).replace('The Coq Proof Assistant, version ', '')).replace('\n', ' ').strip()
+    def probe():
+        p = subprocess.Popen([coqc, "-q", "-v"], stderr=subprocess.STDOUT, stdout=subprocess.PIPE, stdin=subprocess.PIPE)
+        (stdout, stderr) = p.communicate()
+        return util.normalize_newlines(util.s(stdout).replace('The Coq Proof Assistant, version ', '')).replace('\n', ' ').strip()
+    return cached_probe('coqc-version', coqc, (), probe)
 
 def get_coqc_version(coqc_prog, **kwargs):
     if kwargs['verbose'] >= 2:
@@ -20,9 +24,11 @@ def get_coqc_version(coqc_prog, **kwargs):
 
 @memoize
 def get_coqc_config_helper(coqc):
-    p = subprocess.Popen([coqc, "-q", "-config"], stderr=subprocess.STDOUT, stdout=subprocess.PIPE, stdin=subprocess.PIPE)
-    (stdout, stderr) = p.communicate()
-    return util.normalize_newlines(util.s(stdout)).strip()
+    def probe():
+        p = subprocess.Popen([coqc, "-q", "-config"], stderr=subprocess.STDOUT, stdout=subprocess.PIPE, stdin=subprocess.PIPE)
+        (stdout, stderr) = p.communicate()
+        return util.normalize_newlines(util.s(stdout)).strip()
+    return cached_probe('coqc-config', coqc, (), probe)
 
 def get_coqc_config(coqc_prog, **kwargs):
     if kwargs['verbose'] >= 2:
@@ -34,9 +40,11 @@ def get_coqc_coqlib(coqc_prog, **kwargs):
 
 @memoize
 def get_coqc_help_helper(coqc):
-    p = subprocess.Popen([coqc, "-q", "--help"], stderr=subprocess.STDOUT, stdout=subprocess.PIPE, stdin=subprocess.PIPE)
-    (stdout, stderr) = p.communicate()
-    return util.s(stdout).strip()
+    def probe():
+        p = subprocess.Popen([coqc, "-q", "--help"], stderr=subprocess.STDOUT, stdout=subprocess.PIPE, stdin=subprocess.PIPE)
+        (stdout, stderr) = p.communicate()
+        return util.s(stdout).strip()
+    return cached_probe('coqc-help', coqc, (), probe)
 
 def get_coqc_help(coqc_prog, **kwargs):
     if kwargs['verbose'] >= 2:
@@ -45,9 +53,11 @@ def get_coqc_help(coqc_prog, **kwargs):
 
 @memoize
 def get_coqtop_version_helper(coqtop):
-    p = subprocess.Popen([coqtop, "-q"], stderr=subprocess.PIPE, stdout=subprocess.PIPE, stdin=subprocess.PIPE)
-    (stdout, stderr) = p.communicate()
-    return util.normalize_newlines(util.s(stdout).replace('Welcome to Coq ', '').replace('Skipping rcfile loading.', '')).replace('\n', ' ').strip()
+    def probe():
+        p = subprocess.Popen([coqtop, "-q"], stderr=subprocess.PIPE, stdout=subprocess.PIPE, stdin=subprocess.PIPE)
+        (stdout, stderr) = p.communicate()
+        return util.normalize_newlines(util.s(stdout).replace('Welcome to Coq ', '').replace('Skipping rcfile loading.', '')).replace('\n', ' ').strip()
+    return cached_probe('coqtop-version', coqtop, (), probe)
 
 def get_coqtop_version(coqtop_prog, **kwargs):
     if kwargs['verbose'] >= 2:
@@ -56,17 +66,18 @@ def get_coqtop_version(coqtop_prog, **kwargs):
 
 @memoize
 def get_coq_accepts_top(coqc):
-    temp_file = tempfile.NamedTemporaryFile(suffix='.v', dir='.', delete=True)
-    temp_file_name = temp_file.name
-    p = subprocess.Popen([coqc, "-q", "-top", "Top", temp_file_name], stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
-    (stdout, stderr) = p.communicate()
-    temp_file.close()
-    clean_v_file(temp_file_name)
-    return '-top: no such file or directory' not in util.s(stdout)
+    def probe():
+        temp_file = tempfile.NamedTemporaryFile(suffix='.v', dir='.', delete=True)
+        temp_file_name = temp_file.name
+        p = subprocess.Popen([coqc, "-q", "-top", "Top", temp_file_name], stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
+        (stdout, stderr) = p.communicate()
+        temp_file.close()
+        clean_v_file(temp_file_name)
+        return '-top: no such file or directory' not in util.s(stdout)
+    return cached_probe('coq-accepts-top', coqc, (), probe)
 
 def get_coq_accepts_option(coqc_prog, option, **kwargs):
-    help_text = get_coqc_help(coqc_prog, **kwargs)
-    return any((option + sep) in help_text for sep in '\t ')
+    return get_coq_option_table(get_coqc_help(coqc_prog, **kwargs)).accepts(option)
 
 def get_coq_accepts_o(coqc_prog, **kwargs):
     return get_coq_accepts_option(coqc_prog, '-o', **kwargs)
@@ -77,15 +88,26 @@ def get_coq_accepts_time(coqc_prog, **kwargs):
 def get_coq_accepts_w(coqc_prog, **kwargs):
     return get_coq_accepts_option(coqc_prog, '-w', **kwargs)
 
+def get_coq_proof_skipping_args(coqc_prog, **kwargs):
+    """Returns the arguments which make coqc_prog skip checking
+    opaque proofs (-vos on Coq >= 8.11, -quick on Coq 8.5 to 8.10), or
+    an empty tuple if it has no such mode"""
+    for option in ('-vos', '-quick'):
+        if get_coq_accepts_option(coqc_prog, option, **kwargs):
+            return (option,)
+    return tuple()
+
 @memoize
 def get_coqc_native_compiler_ondemand_errors(coqc):
-    temp_file = tempfile.NamedTemporaryFile(suffix='.v', dir='.', delete=True)
-    temp_file_name = temp_file.name
-    p = subprocess.Popen([coqc, "-q", "-native-compiler", "ondemand", temp_file_name], stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
-    (stdout, stderr) = p.communicate()
-    temp_file.close()
-    clean_v_file(temp_file_name)
-    return 'The native-compiler option is deprecated' in util.s(stdout) or 'deprecated-native-compiler-option' in util.s(stdout)
+    def probe():
+        temp_file = tempfile.NamedTemporaryFile(suffix='.v', dir='.', delete=True)
+        temp_file_name = temp_file.name
+        p = subprocess.Popen([coqc, "-q", "-native-compiler", "ondemand", temp_file_name], stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
+        (stdout, stderr) = p.communicate()
+        temp_file.close()
+        clean_v_file(temp_file_name)
+        return 'The native-compiler option is deprecated' in util.s(stdout) or 'deprecated-native-compiler-option' in util.s(stdout)
+    return cached_probe('coqc-native-compiler-ondemand-errors', coqc, (), probe)
 
 def get_coq_native_compiler_ondemand_fragment(coqc_prog, **kwargs):
     help_lines = get_coqc_help(coqc_prog, **kwargs).split('\n')
@@ -116,40 +138,82 @@ def get_multiple_help_tags(coqc_help, **kwargs):
                 for i in all_help_tags(coqc_help, **kwargs)
                 if ' ' in i)
 
+class CoqOptionTable(object):
+    """The options listed in the --help text of coqc (or of
+    coq_makefile), parsed once: the options which take no arguments,
+    and the number of words (including the option itself) spanned by
+    each option which does take arguments"""
+    def __init__(self, help_text, is_coq_makefile=False):
+        self.help_text = help_text
+        self.single_tags = frozenset(get_single_help_tags(help_text, is_coq_makefile=is_coq_makefile))
+        self.multiple_tags = get_multiple_help_tags(help_text, is_coq_makefile=is_coq_makefile)
+        self.accepted_options = {}
+
+    def arity(self, tag):
+        """Returns the number of words spanned by tag, or None if tag is not a known option"""
+        if tag in self.multiple_tags: return self.multiple_tags[tag]
+        if tag in self.single_tags: return 1
+        return None
+
+    def accepts(self, option):
+        """Returns True if option is mentioned, followed by whitespace, in the help text"""
+        if option not in self.accepted_options:
+            self.accepted_options[option] = any((option + sep) in self.help_text for sep in '\t ')
+        return self.accepted_options[option]
+
+    def group_args_split_recognized(self, args, topname=None):
+        """Groups args into bindings of options to their arguments,
+        without duplicates, returning the recognized bindings and the
+        list of unrecognized arguments"""
+        args = tuple(args)
+        bindings = []
+        seen_bindings = set()
+        unrecognized_bindings = []
+        multiple_tags = self.multiple_tags
+        i = 0
+        while i < len(args):
+            n = multiple_tags.get(args[i])
+            if n is not None and len(args) - i >= n:
+                cur = args[i:i+n]
+                i += n
+            else:
+                cur = args[i:i+1]
+                i += 1
+                if cur[0] not in self.single_tags:
+                    unrecognized_bindings.append(cur[0])
+                    continue
+            if cur not in seen_bindings:
+                seen_bindings.add(cur)
+                bindings.append(cur)
+        if topname is not None and '-top' not in [i[0] for i in bindings] and '-top' in multiple_tags:
+            bindings.append(('-top', topname))
+        return (bindings, unrecognized_bindings)
+
+    def group_args(self, args, topname=None):
+        bindings, unrecognized_bindings = self.group_args_split_recognized(args, topname=topname)
+        return bindings + [tuple([v]) for v in unrecognized_bindings]
+
+@memoize
+def get_coq_option_table(coqc_help, is_coq_makefile=False):
+    # the help text of each binary is memoized, so this is built once per binary
+    return CoqOptionTable(coqc_help, is_coq_makefile=is_coq_makefile)
+
 def coq_makefile_supports_arg(coq_makefile_help):
-    tags = get_multiple_help_tags(coq_makefile_help, is_coq_makefile=True)
-    return any(tag == '-arg' for tag in tags.keys())
+    return '-arg' in get_coq_option_table(coq_makefile_help, is_coq_makefile=True).multiple_tags
 
 def group_coq_args_split_recognized(args, coqc_help, topname=None, is_coq_makefile=False):
-    args = list(args)
-    bindings = []
-    unrecognized_bindings = []
-    single_tags = get_single_help_tags(coqc_help, is_coq_makefile=is_coq_makefile)
-    multiple_tags = get_multiple_help_tags(coqc_help, is_coq_makefile=is_coq_makefile)
-    while len(args) > 0:
-        if args[0] in multiple_tags.keys() and len(args) >= multiple_tags[args[0]]:
-            cur_binding, args = tuple(args[:multiple_tags[args[0]]]), args[multiple_tags[args[0]]:]
-            if cur_binding not in bindings:
-                bindings.append(cur_binding)
-        else:
-            cur = tuple([args.pop(0)])
-            if cur[0] not in single_tags:
-                unrecognized_bindings.append(cur[0])
-            elif cur not in bindings:
-                bindings.append(cur)
-    if topname is not None and '-top' not in [i[0] for i in bindings] and '-top' in multiple_tags.keys():
-        bindings.append(('-top', topname))
-    return (bindings, unrecognized_bindings)
+    return get_coq_option_table(coqc_help, is_coq_makefile=is_coq_makefile).group_args_split_recognized(args, topname=topname)
 
 def group_coq_args(args, coqc_help, topname=None, is_coq_makefile=False):
-    bindings, unrecognized_bindings = group_coq_args_split_recognized(args, coqc_help, topname=topname, is_coq_makefile=is_coq_makefile)
-    return bindings + [tuple([v]) for v in unrecognized_bindings]
+    return get_coq_option_table(coqc_help, is_coq_makefile=is_coq_makefile).group_args(args, topname=topname)
 
 def get_proof_term_works_with_time(coqc_prog, **kwargs):
     contents = r"""Lemma foo : forall _ : Type, Type.
 Proof (fun x => x)."""
-    output, cmds, retcode = get_coq_output(coqc_prog, ('-time', '-q'), contents, 1, verbose_base=3, **kwargs)
-    return 'Error: Attempt to save an incomplete proof' not in output
+    def probe():
+        output, cmds, retcode = get_coq_output(coqc_prog, ('-time', '-q'), contents, 1, verbose_base=3, **kwargs)
+        return 'Error: Attempt to save an incomplete proof' not in output
+    return cached_probe('proof-term-works-with-time', coqc_prog, (kwargs.get('is_coqtop', False),), probe)
 
 LTAC_SUPPORT_SNIPPET = {}
 def get_ltac_support_snippet(coqc, **kwargs):
@@ -158,15 +222,63 @@ def get_ltac_support_snippet(coqc, **kwargs):
     test = r'''Inductive False := .
 Axiom proof_admitted : False.
 Tactic Notation "admit" := abstract case proof_admitted.'''
-    errinfo = {}
     native_ondemand_args = list(get_coq_native_compiler_ondemand_fragment(coqc, **kwargs))
-    for before, after in (('Declare ML Module "ltac_plugin".\n', ''),
-                          ('Require Coq.Init.Notations.\n', 'Import Coq.Init.Notations.\n')):
-        contents = '%s\n%s\n%s' % (before, after, test)
-        output, cmds, retcode = get_coq_output(coqc, tuple(['-q', '-nois'] + native_ondemand_args), contents, timeout_val=None, verbose_base=3, is_coqtop=kwargs['coqc_is_coqtop'], **kwargs)
-        if retcode == 0:
-            LTAC_SUPPORT_SNIPPET[coqc] = (before, after)
-            return (before, after)
-        else:
-            errinfo[contents] = {'output': output, 'cmds': cmds, 'retcode': retcode}
-    raise Exception('No valid ltac support snipped found.  Debugging info: %s' % repr(errinfo))
+    def probe():
+        errinfo = {}
+        for before, after in (('Declare ML Module "ltac_plugin".\n', ''),
+                              ('Require Coq.Init.Notations.\n', 'Import Coq.Init.Notations.\n')):
+            contents = '%s\n%s\n%s' % (before, after, test)
+            output, cmds, retcode = get_coq_output(coqc, tuple(['-q', '-nois'] + native_ondemand_args), contents, timeout_val=None, verbose_base=3, is_coqtop=kwargs['coqc_is_coqtop'], **kwargs)
+            if retcode == 0:
+                return (before, after)
+            else:
+                errinfo[contents] = {'output': output, 'cmds': cmds, 'retcode': retcode}
+        raise Exception('No valid ltac support snipped found.  Debugging info: %s' % repr(errinfo))
+    LTAC_SUPPORT_SNIPPET[coqc] = tuple(cached_probe('ltac-support-snippet', coqc, (kwargs['coqc_is_coqtop'], native_ondemand_args), probe))
+    return LTAC_SUPPORT_SNIPPET[coqc]
+
+def prefetch_coq_probes(coqc_progs=tuple(), coqtop_progs=tuple(), **kwargs):
+    """Runs the probes that every run needs on the given coqc and
+    coqtop programs concurrently, filling the in-memory (and on-disk)
+    caches, so that later calls return immediately.  The ltac support
+    snippet is probed on kwargs['coqc'], and the probe of whether
+    proof terms work with -time on each coqtop, as split_definitions
+    asks for them."""
+    coqcs = sorted(set(prog for prog in coqc_progs if prog))
+    coqtops = sorted(set(prog for prog in coqtop_progs if prog))
+    probes = {}
+    for coqc in coqcs:
+        probes[('version', coqc)] = (lambda coqc=coqc: get_coqc_version_helper(coqc))
+        probes[('help', coqc)] = (lambda coqc=coqc: get_coqc_help_helper(coqc))
+        probes[('config', coqc)] = (lambda coqc=coqc: get_coqc_config_helper(coqc))
+        probes[('accepts-top', coqc)] = (lambda coqc=coqc: get_coq_accepts_top(coqc))
+        probes[('native-compiler-ondemand', coqc)] = (lambda coqc=coqc: get_coqc_native_compiler_ondemand_errors(coqc))
+        probes[('fine-grained-debug', coqc)] = (lambda coqc=coqc: get_coq_accepts_fine_grained_debug(coqc, "native-compiler"))
+    if kwargs.get('coqc') in coqcs:
+        probes[('ltac-support-snippet', kwargs['coqc'])] = (lambda: get_ltac_support_snippet(**kwargs))
+    for coqtop in coqtops:
+        probes[('version', coqtop)] = (lambda coqtop=coqtop: get_coqtop_version_helper(coqtop))
+        probes[('help', coqtop)] = (lambda coqtop=coqtop: get_coqc_help_helper(coqtop))
+        probes.setdefault(('accepts-top', coqtop), (lambda coqtop=coqtop: get_coq_accepts_top(coqtop)))
+        probes[('proof-term-works-with-time', coqtop)] = (lambda coqtop=coqtop: get_coq_accepts_time(coqtop, **kwargs)
+                                                          and get_proof_term_works_with_time(coqtop, **dict(kwargs, is_coqtop=True)))
+    # the snippet and the proof term probes look at the help, and the
+    # snippet at the native compiler probe, which we do not want to
+    # run twice
+    dependencies = {}
+    for kind, prog in probes.keys():
+        if kind == 'ltac-support-snippet':
+            dependencies[(kind, prog)] = (('help', prog), ('native-compiler-ondemand', prog))
+        elif kind == 'proof-term-works-with-time':
+            dependencies[(kind, prog)] = (('help', prog),)
+    if kwargs.get('verbose', 0) >= 2:
+        kwargs['log']('Probing %s' % ', '.join(sorted(set(prog for kind, prog in probes.keys()))))
+    def run(node):
+        # the callers run the probes again, and report their errors, if
+        # they need them
+        try:
+            probes[node]()
+        except Exception:
+            pass
+    # the probes spend their time waiting on Coq, so we run them all at once
+    run_dag_in_parallel(run, sorted(probes.keys()), dependencies, jobs=max(1, len(probes)))
@@ -5,9 +5,11 @@ from memoize import memoize
 from file_util import clean_v_file
 from util import re_escape
 from custom_arguments import DEFAULT_LOG
+from probe_cache import cached_probe
+from oracle_trace import cpu_time
 import util
 
-__all__ = ["has_error", "get_error_line_number", "get_error_byte_locations", "make_reg_string", "get_coq_output", "get_coq_output_iterable", "get_error_string", "get_timeout", "reset_timeout", "reset_coq_output_cache"]
+__all__ = ["has_error", "get_error_line_number", "get_error_byte_locations", "make_reg_string", "get_coq_output", "get_coq_output_iterable", "get_error_string", "get_timeout", "set_timeout", "reset_timeout", "reset_coq_output_cache", "get_oracle_stats"]
 
 DEFAULT_PRE_PRE_ERROR_REG_STRING = 'File "[^"]+", line ([0-9]+), characters [0-9-]+:\n'
 DEFAULT_PRE_ERROR_REG_STRING = 'File "[^"]+", line ([0-9]+), characters [0-9-]+:\n(?!Warning)'
@@ -21,13 +23,15 @@ def clean_output(output):
 
 @memoize
 def get_coq_accepts_fine_grained_debug(coqc, debug_kind):
-    temp_file = tempfile.NamedTemporaryFile(suffix='.v', dir='.', delete=True)
-    temp_file_name = temp_file.name
-    p = subprocess.Popen([coqc, "-q", "-d", debug_kind, temp_file_name], stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
-    (stdout, stderr) = p.communicate()
-    temp_file.close()
-    clean_v_file(temp_file_name)
-    return 'Unknown option -d' not in util.s(stdout) and '-d: no such file or directory' not in util.s(stdout) and 'There is no debug flag' not in util.s(stdout)
+    def probe():
+        temp_file = tempfile.NamedTemporaryFile(suffix='.v', dir='.', delete=True)
+        temp_file_name = temp_file.name
+        p = subprocess.Popen([coqc, "-q", "-d", debug_kind, temp_file_name], stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
+        (stdout, stderr) = p.communicate()
+        temp_file.close()
+        clean_v_file(temp_file_name)
+        return 'Unknown option -d' not in util.s(stdout) and '-d: no such file or directory' not in util.s(stdout) and 'There is no debug flag' not in util.s(stdout)
+    return cached_probe('coq-accepts-fine-grained-debug', coqc, (debug_kind,), probe)
 
 def get_coq_debug_native_compiler_args(coqc):
     if get_coq_accepts_fine_grained_debug(coqc, "native-compiler"): return ["-d", "native-compiler"]
@@ -130,6 +134,10 @@ TIMEOUT = None
 def get_timeout():
     return TIMEOUT
 
+def set_timeout(timeout):
+    global TIMEOUT
+    TIMEOUT = timeout
+
 def reset_timeout():
     global TIMEOUT
     TIMEOUT = None
@@ -165,9 +173,30 @@ def memory_robust_timeout_Popen_communicate(log, *args, **kwargs):
             return timeout_Popen_communicate(log, *args, **kwargs)
         except OSError as e:
             log('Warning: subprocess.Popen%s%s failed with %s\nTrying again in 10s' % (repr(tuple(args)), repr(kwargs), repr(e)), force_stdout=True)
+            add_oracle_stats(calls=0, spawn_retries=1)
             time.sleep(10)
 
 COQ_OUTPUT = {}
+# running totals over all calls to get_coq_output, for profiling;
+# 'killed' counts the runs which were killed by SIGKILL (usually by the
+# OOM killer, since we stop runs which time out with SIGTERM), and
+# 'spawn_retries' the times that starting coq failed (usually for lack
+# of memory) and was retried
+ORACLE_STATS = {'calls': 0, 'runs': 0, 'coq_time': 0.0, 'timeouts': 0, 'killed': 0, 'spawn_retries': 0}
+ORACLE_STATS_LOCK = threading.Lock()
+
+def get_oracle_stats():
+    with ORACLE_STATS_LOCK:
+        return dict(ORACLE_STATS)
+
+def add_oracle_stats(calls=1, runs=0, coq_time=0.0, timeouts=0, killed=0, spawn_retries=0):
+    with ORACLE_STATS_LOCK:
+        ORACLE_STATS['calls'] += calls
+        ORACLE_STATS['runs'] += runs
+        ORACLE_STATS['coq_time'] += coq_time
+        ORACLE_STATS['timeouts'] += timeouts
+        ORACLE_STATS['killed'] += killed
+        ORACLE_STATS['spawn_retries'] += spawn_retries
 
 def sanitize_cmd(cmd):
     return re.sub(r'("/tmp/tmp)[^ "]*?(\.v")', r'\1XXXXXXXX\2', cmd)
@@ -219,15 +248,41 @@ def get_coq_output(coqc_prog, coqc_prog_args, contents, timeout_val, cwd=None, i
 
     key, file_name, cmds, input_val = prepare_cmds_for_coq_output(coqc_prog, coqc_prog_args, contents, cwd=cwd, timeout_val=timeout_val, is_coqtop=is_coqtop, pass_on_stdin=pass_on_stdin, verbose_base=verbose_base, **kwargs)
 
-    if key in COQ_OUTPUT.keys(): return COQ_OUTPUT[key][1]
-
-    start = time.time()
-    ((stdout, stderr), returncode) = memory_robust_timeout_Popen_communicate(kwargs['log'], cmds, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, stdin=subprocess.PIPE, timeout=(timeout_val if timeout_val is not None and timeout_val > 0 else None), input=input_val, cwd=cwd)
-    finish = time.time()
+    if key in COQ_OUTPUT.keys():
+        add_oracle_stats()
+        if kwargs.get('oracle_trace') is not None: kwargs['oracle_trace'].record_run(contents, cached=True, returncode=COQ_OUTPUT[key][1][2])
+        return COQ_OUTPUT[key][1]
+
+    timeout = (timeout_val if timeout_val is not None and timeout_val > 0 else None)
+    cassette = kwargs.get('oracle_cassette')
+    replayed = cassette.replay('coq', cmds, contents, file_name=file_name) if cassette is not None else None
+    ran_in_daemon = None
+    if replayed is None and kwargs.get('oracle_daemon') is not None:
+        ran_in_daemon = kwargs['oracle_daemon'].communicate(cmds, file_name, contents, input_val, timeout, cwd)
+    if replayed is not None:
+        (stdout, returncode, elapsed) = replayed
+        (stderr, cpu) = ('', None)
+    elif ran_in_daemon is not None:
+        # we only count the time that the run took, and not the time
+        # that the call spent waiting for a worker of the daemon
+        ((stdout, stderr), returncode, elapsed) = ran_in_daemon
+        cpu = None
+    else:
+        start, cpu_start = time.time(), cpu_time()
+        ((stdout, stderr), returncode) = memory_robust_timeout_Popen_communicate(kwargs['log'], cmds, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, stdin=subprocess.PIPE, timeout=timeout, input=input_val, cwd=cwd)
+        elapsed, cpu = time.time() - start, cpu_time() - cpu_start
+    if cassette is not None and replayed is None:
+        cassette.record('coq', cmds, contents, util.s(stdout), returncode, elapsed, file_name=file_name)
+    timed_out, killed = util.s(stdout).endswith('\nTimeout!'), (returncode == -9)
+    add_oracle_stats(runs=1, coq_time=elapsed, timeouts=int(timed_out), killed=int(killed))
+    if kwargs.get('oracle_trace') is not None:
+        kwargs['oracle_trace'].record_run(contents, cached=False, wall=elapsed, cpu=cpu, returncode=returncode,
+                                          timed_out=timed_out, daemon=(ran_in_daemon is not None))
+    if kwargs.get('metrics_exporter') is not None: kwargs['metrics_exporter'].record_run(elapsed)
     if kwargs['verbose'] >= verbose_base + 1:
         kwargs['log']('\nretcode: %d\nstdout:\n%s\n\nstderr:\n%s\n\n' % (returncode, util.s(stdout), util.s(stderr)))
     if TIMEOUT is None and timeout_val is not None:
-        TIMEOUT = 3 * max((1, int(math.ceil(finish - start))))
+        TIMEOUT = 3 * max((1, int(math.ceil(elapsed))))
     clean_v_file(file_name)
     COQ_OUTPUT[key] = (file_name, (clean_output(util.s(stdout)), tuple(cmds), returncode))
     if kwargs['verbose'] >= verbose_base + 2: kwargs['log']('Storing result: COQ_OUTPUT[%s]:\n%s' % (repr(key), repr(COQ_OUTPUT[key])))
@@ -244,8 +299,10 @@ def get_coq_output_iterable(coqc_prog, coqc_prog_args, contents, cwd=None, is_co
     key, file_name, cmds, input_val = prepare_cmds_for_coq_output(coqc_prog, coqc_prog_args, contents, cwd=cwd, timeout_val=None, is_coqtop=is_coqtop, pass_on_stdin=pass_on_stdin, verbose_base=verbose_base, **kwargs)
 
     if key in COQ_OUTPUT.keys():
+        add_oracle_stats()
         for i in COQ_OUTPUT[key][1].split(sep): yield i
 
+    start = time.time()
     p = Popen_async(cmds, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, stdin=subprocess.PIPE, cwd=cwd)
 
     so_far = []
@@ -277,6 +334,7 @@ def get_coq_output_iterable(coqc_prog, coqc_prog_args, contents, cwd=None, is_co
     if cur != '':
         yield cur
         so_far.append(cur)
+    add_oracle_stats(runs=1, coq_time=time.time() - start)
     clean_v_file(file_name)
     ## remove instances of the file name
     #stdout = stdout.replace(os.path.basename(file_name[:-2]), 'Top')
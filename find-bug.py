@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import tempfile, sys, os, re
+import tempfile, sys, os, re, math, time, signal
 import traceback
 import custom_arguments
 from argparse_compat import argparse
@@ -12,7 +12,15 @@ from split_definitions import split_statements_to_definitions, join_definitions
 from admit_abstract import transform_abstract_to_admit
 from import_util import lib_of_filename, clear_libimport_cache, IMPORT_ABSOLUTIZE_TUPLE, ALL_ABSOLUTIZE_TUPLE
 from memoize import memoize
-from coq_version import get_coqc_version, get_coqtop_version, get_coqc_help, get_coq_accepts_top, get_coq_native_compiler_ondemand_fragment, group_coq_args, get_ltac_support_snippet, get_coqc_coqlib
+from coq_version import get_coqc_version, get_coqtop_version, get_coqc_help, get_coq_accepts_top, get_coq_native_compiler_ondemand_fragment, group_coq_args, get_ltac_support_snippet, get_coqc_coqlib, prefetch_coq_probes, get_coq_proof_skipping_args
+from probe_cache import set_probe_cache_file, get_probe_cache_file, set_probe_cassette
+from oracle_daemon import OracleDaemonClient, OracleDaemonError
+from oracle_trace import get_oracle_trace, byte_length
+from oracle_cassette import OracleCassette, OracleCassetteError, REPLAY_MISS_POLICIES
+from pass_profiler import PassProfiler, profile_pass
+from progress import ProgressReporter
+from sampling_profiler import SamplingProfiler
+from metrics_export import MetricsExporter
 from custom_arguments import add_libname_arguments, add_passing_libname_arguments, update_env_with_libnames, update_env_with_coqpath_folders, add_logging_arguments, process_logging_arguments, DEFAULT_LOG, DEFAULT_VERBOSITY
 from binding_util import has_dir_binding, deduplicate_trailing_dir_bindings, process_maybe_list
 from file_util import clean_v_file, read_from_file, write_to_file, restore_file
@@ -20,6 +28,9 @@ from util import yes_no_prompt, PY3
 import util
 if PY3: raw_input = util.raw_input
 import diagnose_error
+import prefix_checkpoint
+from time_budget import TimeBudget, TimeBudgetExhausted, parse_duration
+from state_journal import StateJournal, JOURNAL_EXT, text_digest, definitions_digest
 
 # {Windows,Python,coqtop} is terrible; we fail to write to (or read
 # from?) coqtop.  But we can wrap it in a batch scrip, and it works
@@ -156,6 +167,107 @@ parser.add_argument('--coqtop-args', metavar='ARG', dest='coqtop_args', type=str
                           'NOTE: If you want to pass an argument to both coqc and coqtop, use --arg="-indices-matter", not --coqc-args="-indices-matter"'))
 parser.add_argument('--coq_makefile', metavar='COQ_MAKEFILE', dest='coq_makefile', type=str, default='coq_makefile',
                     help='The path to the coq_makefile program.')
+parser.add_argument('--glob-jobs', metavar='N', dest='glob_jobs', type=int, default=None,
+                    help=("The maximum number of coqc jobs to run at once when generating .glob files " +
+                          "(Default: the number of CPUs)."))
+parser.add_argument('--persist-glob-index', dest='persist_glob_index', action='store_const', const=True, default=False,
+                    help=("Store the parsed references of each .glob file next to it (in a .glob.idx file), " +
+                          "so that later runs need not re-parse unchanged .glob files."))
+parser.add_argument('--project-index', metavar='FILE', dest='project_index', type=str, default=None,
+                    help=("An sqlite database in which to store parsed .glob files and absolutized " +
+                          "file contents, keyed on the digests of the files they come from, so that " +
+                          "they can be reused across runs (and across scripts)."))
+parser.add_argument('--prefix-checkpoint', dest='prefix_checkpoint', action='store_const', const=True, default=False,
+                    help=("Once a prefix of the definitions has survived a full round of minimization passes, " +
+                          "compile it to a .vo file in a scratch directory, and check candidates which " +
+                          "start with it by [Require]ing the .vo file instead of rechecking the prefix.  " +
+                          "Candidates which keep the error are compiled a second time, in full, before being " +
+                          "accepted, and so are a sample of the candidates which lose it; the checkpoint is " +
+                          "discarded if it disagrees with the full file."))
+parser.add_argument('--no-cost-ordering', dest='cost_ordering', action='store_const', const=False, default=True,
+                    help=("When trying to remove or admit definitions one at a time, go strictly in reverse order, " +
+                          "rather than first trying the definitions which took coqtop the longest to check."))
+parser.add_argument('--fast-oracle', dest='fast_oracle', action='store_const', const=True, default=False,
+                    help=("First check each candidate with the checking of opaque proofs skipped (via -vos, or -quick " +
+                          "on older versions of Coq), and reject it without a full compile if the error is gone.  " +
+                          "This is turned off automatically if the original file does not give the error in this mode " +
+                          "(for example, because the error is inside a proof)."))
+parser.add_argument('--time-budget', metavar='DURATION', dest='time_budget', type=parse_duration, default=None,
+                    help=("Stop minimizing once this much wall-clock time (in seconds, or with a unit, such as 30m or 2h) " +
+                          "has passed, leaving the smallest file found so far in OUT_FILE.  When the time left is less than " +
+                          "the passes of a round took the last time they ran, they are run in order of how many bytes " +
+                          "per second they removed the last time they ran.  A summary of what was and was not " +
+                          "attempted is printed at the end."))
+parser.add_argument('--journal', dest='journal', action='store_const', const=True, default=False,
+                    help=("Keep a journal of the progress of minimization (in OUT_FILE%s, along with a " % JOURNAL_EXT +
+                          "snapshot of the definitions, taken at the end of each pass), so that an interrupted " +
+                          "run can be picked up with --resume."))
+parser.add_argument('--resume', dest='resume', action='store_const', const=True, default=False,
+                    help=("Resume an interrupted run which was started with --journal from OUT_FILE and its journal, " +
+                          "picking up at the pass and candidate where it stopped, with the error regex, timeout, and " +
+                          "list of [Require]s that failed to inline that it had found.  Implies --journal."))
+parser.add_argument('--probe-cache', metavar='FILE', dest='probe_cache', type=str, default=None,
+                    help=("A file in which to cache what we learn by probing the Coq binaries " +
+                          "(versions, supported options, etc.) across runs; the results are keyed on " +
+                          "the path, size, modification time, and inode of each binary " +
+                          "(Default: the value of the environment variable COQ_TOOLS_PROBE_CACHE, if set)."))
+parser.add_argument('--profile-passes', dest='profile_passes', action='store_const', const=True, default=False,
+                    help=("Print a table of what each pass of minimization cost and gained (oracle calls, accepted changes, " +
+                          "net bytes and lines removed, and time spent in coq and elsewhere) at the end, and whenever " +
+                          "find-bug.py receives SIGUSR1."))
+parser.add_argument('--progress', dest='progress', action='store_const', const=True, default=False,
+                    help=("Every --progress-interval seconds, print a status line with the current pass, the candidate " +
+                          "being checked and how many remain, the average time to check a candidate, the size of the " +
+                          "file compared to the original, and estimates of how long the pass, the round of passes, and " +
+                          "the rounds until nothing changes will take."))
+parser.add_argument('--progress-file', metavar='FILE', dest='progress_file', type=str, default=None,
+                    help="Every --progress-interval seconds, write the status (see --progress) to FILE, as JSON.")
+parser.add_argument('--progress-interval', metavar='SECONDS', dest='progress_interval', type=float, default=60.0,
+                    help="How often to print or write the status for --progress and --progress-file (Default: 60).")
+parser.add_argument('--metrics-file', metavar='FILE', dest='metrics_file', type=str, default=None,
+                    help=("Every --metrics-interval seconds, write metrics of the run to FILE, in the text format of " +
+                          "Prometheus (for the textfile collector of the node exporter): candidates checked by outcome, " +
+                          "calls for the output of coq and the cache hit ratio, a histogram of how long coq took, " +
+                          "timeouts, runs killed by the OOM killer, retries of starting coq, bytes removed, and the " +
+                          "current pass.  Every series is labeled with the absolute path of OUT_FILE."))
+parser.add_argument('--metrics-interval', metavar='SECONDS', dest='metrics_interval', type=float, default=15.0,
+                    help="How often to write the metrics for --metrics-file (Default: 15).")
+parser.add_argument('--profile', metavar='FILE', dest='profile', type=str, default=None,
+                    help=("Run the whole minimization under a sampling profiler, which charges the time spent waiting " +
+                          "on coq (and the other child processes) separately from the time spent in python.  Write the " +
+                          "sampled stacks to FILE in the collapsed format of flamegraph.pl, with the stacks waiting on " +
+                          "coq under [coq] and the others under [python], and print the functions which took the most " +
+                          "time in python at the end."))
+parser.add_argument('--profile-interval', metavar='SECONDS', dest='profile_interval', type=float, default=0.005,
+                    help="How often --profile samples the stack (Default: 0.005).")
+parser.add_argument('--profile-top', metavar='N', dest='profile_top', type=int, default=20,
+                    help="How many functions --profile lists in its summary (Default: 20).")
+parser.add_argument('--oracle-trace', metavar='FILE', dest='oracle_trace', type=str, default=None,
+                    help=("Write a JSON line to FILE for each run of coqc and for each candidate checked, with the pass, " +
+                          "the size of the candidate, whether the result was cached, the wall-clock and CPU time, the " +
+                          "return code, whether it timed out, and how the candidate was classified.  Summarize it with " +
+                          "summarize-oracle-trace.py (Default: append to the file named by the environment variable " +
+                          "COQ_TOOLS_ORACLE_TRACE, if set)."))
+parser.add_argument('--oracle-daemon', metavar='SOCKET', dest='oracle_daemon', type=str, default=None,
+                    help=("Run coqc through the oracle daemon listening on the Unix socket SOCKET (see oracle-daemon.py), " +
+                          "which shares one pool of workers, and the results of identical runs, among all of the jobs " +
+                          "using it.  Unless --probe-cache is given, the daemon's probe cache is used."))
+parser.add_argument('--record-oracle', metavar='CASSETTE', dest='record_oracle', type=str, default=None,
+                    help=("Record every run of coqc and coqtop (command, digest of the contents, output, return code, " +
+                          "and duration), every probe of the Coq binaries, and every .glob file made to the file CASSETTE, " +
+                          "for replaying with --replay-oracle."))
+parser.add_argument('--replay-oracle', metavar='CASSETTE', dest='replay_oracle', type=str, default=None,
+                    help=("Answer the runs of coqc and coqtop and the probes of the Coq binaries, and make the .glob files, " +
+                          "from the file CASSETTE written by --record-oracle, rather than running Coq.  The Coq " +
+                          "binaries must be given by the same names as when recording."))
+parser.add_argument('--replay-time-scale', metavar='X', dest='replay_time_scale', type=float, default=1.0,
+                    help=("With --replay-oracle, scale the recorded durations of the runs by X, for the timeout and the " +
+                          "statistics (and, with --replay-wait, for waiting) (Default: 1)."))
+parser.add_argument('--replay-wait', dest='replay_wait', action='store_const', const=True, default=False,
+                    help="With --replay-oracle, wait for the (scaled) recorded duration of each run, as if it ran.")
+parser.add_argument('--replay-miss', metavar='POLICY', dest='replay_miss', choices=REPLAY_MISS_POLICIES, default='error',
+                    help=("With --replay-oracle, what to do about runs which were not recorded: 'error' stops, 'reject' " +
+                          "answers as if the change did not preserve the error, and 'run' runs Coq (Default: error)."))
 parser.add_argument('--passing-coqc', metavar='COQC', dest='passing_coqc', type=str, default='',
                     help='The path to the coqc program that should compile the file successfully.')
 parser.add_argument('--base-dir', metavar='DIR', dest='base_dir', type=str, default='',
@@ -356,15 +468,49 @@ def get_header_dict(contents, old_header=None, original_line_count=0, **env):
             'coqtop_version':coqtop_version}
 
 CONTENTS_UNCHANGED, CHANGE_SUCCESS, CHANGE_FAILURE = 'contents_unchanged', 'change_success', 'change_failure'
+CHANGE_RESULT_NAMES = {CONTENTS_UNCHANGED: 'CONTENTS_UNCHANGED', CHANGE_SUCCESS: 'CHANGE_SUCCESS', CHANGE_FAILURE: 'CHANGE_FAILURE'}
+CHANGE_OUTCOME_NAMES = {CONTENTS_UNCHANGED: 'unchanged', CHANGE_SUCCESS: 'accepted', CHANGE_FAILURE: 'rejected'}
+def get_change_header_dict(old_contents, new_contents, **kwargs):
+    """Returns the header_dict to pad the contents of a change with:
+    the one in kwargs, if there is one, and otherwise one describing
+    a change from old_contents"""
+    if 'header_dict' in kwargs: return kwargs['header_dict']
+    return get_header_dict(new_contents, original_line_count=len(old_contents.split('\n')), **env)
+
 def classify_contents_change(old_contents, new_contents, ignore_coq_output_cache=False, **kwargs):
     # returns (RESULT_TYPE, PADDED_CONTENTS, OUTPUT_LIST, option BAD_INDEX, DESCRIPTION_OF_FAILURE_MODE)
-    kwargs['header_dict'] = kwargs.get('header_dict', get_header_dict(new_contents, original_line_count=len(old_contents.split('\n')), **env))
+    kwargs['header_dict'] = get_change_header_dict(old_contents, new_contents, **kwargs)
     new_padded_contents = prepend_header(new_contents, **kwargs)
     if new_contents == old_contents:
         return (CONTENTS_UNCHANGED, new_padded_contents, tuple(), None, 'No change.  ')
 
-    if ignore_coq_output_cache: diagnose_error.reset_coq_output_cache(kwargs['coqc'], kwargs['coqc_args'], new_contents, kwargs['timeout'], cwd=kwargs['base_dir'], is_coqtop=kwargs['coqc_is_coqtop'], verbose_base=2, **kwargs)
-    output, cmds, retcode = diagnose_error.get_coq_output(kwargs['coqc'], kwargs['coqc_args'], new_contents, kwargs['timeout'], cwd=kwargs['base_dir'], is_coqtop=kwargs['coqc_is_coqtop'], verbose_base=2, **kwargs)
+    coqc_args, checkpointed_contents = prefix_checkpoint.get_checkpointed_args_and_contents(kwargs['coqc'], kwargs['coqc_args'], new_contents, cwd=kwargs['base_dir'])
+    if kwargs['fast_oracle_args']:
+        # if the error is gone even without checking opaque proofs,
+        # checking them will not bring it back
+        fast_output, cmds, retcode = diagnose_error.get_coq_output(kwargs['coqc'], tuple(list(coqc_args) + list(kwargs['fast_oracle_args'])), checkpointed_contents, kwargs['timeout'], cwd=kwargs['base_dir'], is_coqtop=False, verbose_base=2, **kwargs)
+        if (not diagnose_error.has_error(fast_output, kwargs['error_reg_string']) and checkpointed_contents != new_contents
+                and prefix_checkpoint.should_confirm_rejection(kwargs['coqc'], kwargs['coqc_args'], cwd=kwargs['base_dir'])):
+            fast_output, cmds, retcode = diagnose_error.get_coq_output(kwargs['coqc'], tuple(list(kwargs['coqc_args']) + list(kwargs['fast_oracle_args'])), new_contents, kwargs['timeout'], cwd=kwargs['base_dir'], is_coqtop=False, verbose_base=2, **kwargs)
+            if diagnose_error.has_error(fast_output, kwargs['error_reg_string']):
+                prefix_checkpoint.invalidate_prefix_checkpoint(kwargs['coqc'], kwargs['coqc_args'], cwd=kwargs['base_dir'], reason='it disagreed with the full file', **kwargs)
+                coqc_args, checkpointed_contents = kwargs['coqc_args'], new_contents
+        if not diagnose_error.has_error(fast_output, kwargs['error_reg_string']):
+            extra_desc = 'The error is gone even when opaque proofs are not checked.  '
+            if kwargs['verbose'] >= 2:
+                extra_desc += 'The error was:\n%s\n' % fast_output
+            return (CHANGE_FAILURE, new_padded_contents, (fast_output,), 0, extra_desc)
+    if ignore_coq_output_cache: diagnose_error.reset_coq_output_cache(kwargs['coqc'], coqc_args, checkpointed_contents, kwargs['timeout'], cwd=kwargs['base_dir'], is_coqtop=kwargs['coqc_is_coqtop'], verbose_base=2, **kwargs)
+    output, cmds, retcode = diagnose_error.get_coq_output(kwargs['coqc'], coqc_args, checkpointed_contents, kwargs['timeout'], cwd=kwargs['base_dir'], is_coqtop=kwargs['coqc_is_coqtop'], verbose_base=2, **kwargs)
+    checkpointed_has_error = diagnose_error.has_error(output, kwargs['error_reg_string'])
+    if checkpointed_contents != new_contents and (checkpointed_has_error or prefix_checkpoint.should_confirm_rejection(kwargs['coqc'], kwargs['coqc_args'], cwd=kwargs['base_dir'])):
+        # we check the full file before accepting a change, and, on a
+        # sample, before rejecting one, discarding the prefix
+        # checkpoint if it gives a different answer
+        if ignore_coq_output_cache: diagnose_error.reset_coq_output_cache(kwargs['coqc'], kwargs['coqc_args'], new_contents, kwargs['timeout'], cwd=kwargs['base_dir'], is_coqtop=kwargs['coqc_is_coqtop'], verbose_base=2, **kwargs)
+        output, cmds, retcode = diagnose_error.get_coq_output(kwargs['coqc'], kwargs['coqc_args'], new_contents, kwargs['timeout'], cwd=kwargs['base_dir'], is_coqtop=kwargs['coqc_is_coqtop'], verbose_base=2, **kwargs)
+        if diagnose_error.has_error(output, kwargs['error_reg_string']) != checkpointed_has_error:
+            prefix_checkpoint.invalidate_prefix_checkpoint(kwargs['coqc'], kwargs['coqc_args'], cwd=kwargs['base_dir'], reason='it disagreed with the full file', **kwargs)
     if diagnose_error.has_error(output, kwargs['error_reg_string']):
         if kwargs['passing_coqc']:
             passing_output, cmds, passing_retcode = diagnose_error.get_coq_output(kwargs['passing_coqc'], kwargs['passing_coqc_args'], new_contents, kwargs['timeout'], cwd=kwargs['passing_base_dir'], is_coqtop=kwargs['passing_coqc_is_coqtop'], verbose_base=2, **kwargs)
@@ -385,16 +531,35 @@ def check_change_and_write_to_file(old_contents, new_contents, output_file_name,
                                    failure_description='make a change', changed_description='Changed file',
                                    timeout_retry_count=1, ignore_coq_output_cache=False,
                                    verbose_base=1, display_source_to_error=False,
+                                   definition_count=None,
                                    **kwargs):
+    if kwargs['time_budget'] is not None: kwargs['time_budget'].check()
     if kwargs['verbose'] >= 2 + verbose_base:
         kwargs['log']('Running coq on the file\n"""\n%s\n"""' % new_contents)
+    oracle_trace = kwargs['oracle_trace']
+    if oracle_trace is not None: oracle_trace.begin_candidate(kwargs.get('pass_description', failure_description), new_contents, definition_count=definition_count)
+    progress, start = kwargs['progress'], time.time()
     change_result, contents, outputs, output_i, error_desc = classify_contents_change(old_contents, new_contents, ignore_coq_output_cache=ignore_coq_output_cache, **kwargs)
+    # a successful candidate which leaves the output file as it was
+    # (e.g., a pass which found nothing to transform) is reported as
+    # unchanged
+    changes_file = (change_result == CHANGE_SUCCESS
+                    and contents != prepend_header(old_contents, **dict(kwargs, header_dict=get_change_header_dict(old_contents, new_contents, **kwargs))))
+    reported_result = (CONTENTS_UNCHANGED if change_result == CHANGE_SUCCESS and not changes_file else change_result)
+    if oracle_trace is not None: oracle_trace.end_candidate(CHANGE_RESULT_NAMES.get(reported_result, reported_result))
+    if progress is not None: progress.record_check(time.time() - start, definition_count=definition_count)
+    if kwargs['metrics_exporter'] is not None: kwargs['metrics_exporter'].record_candidate(CHANGE_OUTCOME_NAMES.get(reported_result, 'unchanged'))
     if change_result == CONTENTS_UNCHANGED:
         if kwargs['verbose'] >= verbose_base: kwargs['log']('\n%s' % unchanged_message)
         return False
     elif change_result == CHANGE_SUCCESS:
         if kwargs['verbose'] >= verbose_base: kwargs['log']('\n%s' % success_message)
+        if kwargs['pass_profiler'] is not None and changes_file: kwargs['pass_profiler'].record_accept()
         write_to_file(output_file_name, contents)
+        if progress is not None: progress.set_size(byte_length(contents))
+        if kwargs['metrics_exporter'] is not None: kwargs['metrics_exporter'].set_size(byte_length(contents))
+        if kwargs['journal'] is not None: kwargs['journal'].record('accept', digest=text_digest(contents))
+        prefix_checkpoint.invalidate_prefix_checkpoint_if_touched(kwargs['coqc'], kwargs['coqc_args'], new_contents, cwd=kwargs['base_dir'], **kwargs)
         return True
     elif change_result == CHANGE_FAILURE:
         if kwargs['verbose'] >= verbose_base:
@@ -412,7 +577,7 @@ def check_change_and_write_to_file(old_contents, new_contents, output_file_name,
                                                   unchanged_message=unchanged_message, success_message=success_message,
                                                   failure_description=failure_description, changed_description=changed_description,
                                                   timeout_retry_count=timeout_retry_count-1, ignore_coq_output_cache=True,
-                                                  verbose_base=verbose_base,
+                                                  verbose_base=verbose_base, definition_count=definition_count,
                                                   **kwargs)
         elif kwargs['verbose'] >= verbose_base and display_source_to_error and diagnose_error.has_error(outputs[output_i]):
             new_line = diagnose_error.get_error_line_number(outputs[output_i])
@@ -430,6 +595,33 @@ def check_change_and_write_to_file(old_contents, new_contents, output_file_name,
     return None
 
 
+# definitions which take less than this many seconds to check are
+# all equally cheap, as far as ordering candidates goes
+COST_BUCKET_MIN_TIME = 0.5
+
+def cost_bucket(definition):
+    """Returns the (logarithmic) bucket of the time it takes to check definition"""
+    time = definition.get('time', 0.0)
+    if time < COST_BUCKET_MIN_TIME: return 0
+    return 1 + int(math.log(time / COST_BUCKET_MIN_TIME, 2))
+
+def get_candidate_order(definitions, skip_n=1, **kwargs):
+    """Returns all but the last skip_n definitions, in the order in
+    which to try to transform them: the most expensive ones first
+    (since every later run of coq is cheaper without them), and
+    otherwise in reverse order"""
+    candidates = list(enumerate(definitions[:max(0, len(definitions) - skip_n)]))
+    if kwargs['cost_ordering']:
+        candidates.sort(key=(lambda candidate: (cost_bucket(candidate[1]), candidate[0])), reverse=True)
+    else:
+        candidates.reverse()
+    return [definition for i, definition in candidates]
+
+def definition_indices(definitions):
+    """Returns a dict from the id of each definition of definitions to
+    its index"""
+    return dict((id(definition), i) for i, definition in enumerate(definitions))
+
 def try_transform_each(definitions, output_file_name, transformer, skip_n=1, **kwargs):
     """Tries to apply transformer to each definition in definitions,
     additionally passing in the list of subsequent definitions.  If
@@ -437,17 +629,33 @@ def try_transform_each(definitions, output_file_name, transformer, skip_n=1, **k
     value, or if the return value is a false-y value (indicating that
     we should remove the line) then we see if the error is still
     present.  If it is, we keep the change; otherwise, we discard it.
-    The order in which definitions are passed in is guaranteed to be
-    reverse-order.
+    The definitions are passed in reverse order, except that, unless
+    cost ordering is turned off, definitions which take longer to
+    check are passed in first.
 
     Returns updated definitions."""
     if kwargs['verbose'] >= 3: kwargs['log']('try_transform_each')
     original_definitions = [dict(i) for i in definitions]
     # TODO(jgross): Use coqtop and [BackTo] to do incremental checking
     success = False
-    i = len(definitions) - 1 - skip_n
-    while i >= 0:
-        old_definition = definitions[i]
+    journal = kwargs['journal']
+    already_tried = journal.begin_pass() if journal is not None else frozenset()
+    candidates = get_candidate_order(definitions, skip_n=skip_n, **kwargs)
+    progress = kwargs['progress']
+    if progress is not None: progress.begin_candidates(len(candidates))
+    # definitions is rebuilt on each successful change, but the
+    # untouched definitions are the same objects (and the candidates
+    # keep them alive, so that their ids are not reused); we only
+    # recompute the indices and the contents on successful changes
+    indices = definition_indices(definitions)
+    contents = join_definitions(definitions)
+    for old_definition in candidates:
+        if progress is not None: progress.next_candidate()
+        i = indices.get(id(old_definition))
+        if i is None: continue
+        if already_tried and text_digest(old_definition['statement']) in already_tried:
+            if kwargs['verbose'] >= 3: kwargs['log']('Already tried (before resuming): %s' % old_definition['statement'])
+            continue
         new_definition = transformer(old_definition, definitions[i + 1:])
         if not new_definition:
             if kwargs['save_typeclasses'] and \
@@ -455,7 +663,6 @@ def try_transform_each(definitions, output_file_name, transformer, skip_n=1, **k
                 CANONICAL_STRUCTURE_REG.search(old_definition['statement']) or
                 TC_HINT_REG.search(old_definition['statement'])):
                 if kwargs['verbose'] >= 3: kwargs['log']('Ignoring Instance/Canonical Structure/Hint: %s' % old_definition['statement'])
-                i -= 1
                 continue
             new_definitions = []
         elif isinstance(new_definition, dict):
@@ -472,14 +679,20 @@ def try_transform_each(definitions, output_file_name, transformer, skip_n=1, **k
                 if kwargs['verbose'] >= 2 and len(new_definitions) > 1: kwargs['log']('Splitting definition: %s' % repr(new_definitions))
                 try_definitions = definitions[:i] + new_definitions + definitions[i + 1:]
 
-            if check_change_and_write_to_file('', join_definitions(try_definitions), output_file_name, verbose_base=2, **kwargs):
+            try_contents = join_definitions(try_definitions)
+            if check_change_and_write_to_file(contents, try_contents, output_file_name, verbose_base=2, definition_count=len(try_definitions), **kwargs):
                 success = True
-                definitions = try_definitions
+                definitions, contents = try_definitions, try_contents
+                indices = definition_indices(definitions)
                 # make a copy for saving
                 save_definitions = [dict(defn) for defn in try_definitions]
+                if journal is not None:
+                    journal.record_edit(i, new_definitions)
+                    journal.record_candidate([old_definition['statement']] + [defn['statement'] for defn in new_definitions])
+            elif journal is not None:
+                journal.record_candidate([old_definition['statement']])
         else:
             if kwargs['verbose'] >= 3: kwargs['log']('No change to %s' % old_definition['statement'])
-        i -= 1
     if success:
         if kwargs['verbose'] >= 1: kwargs['log'](kwargs['noun_description'] + ' successful')
         if join_definitions(save_definitions) != join_definitions(definitions):
@@ -527,9 +740,9 @@ def try_transform_reversed(definitions, output_file_name, transformer, skip_n=1,
                 if kwargs['verbose'] >= 2: kwargs['log']('Removing %s' % definitions[i]['statement'])
                 definitions = definitions[:i] + definitions[i + 1:]
 
-    if check_change_and_write_to_file('', join_definitions(definitions), output_file_name,
+    if check_change_and_write_to_file(join_definitions(original_definitions), join_definitions(definitions), output_file_name,
                                       success_message=kwargs['noun_description']+' successful.', failure_description=kwargs['verb_description'],
-                                      changed_description='Intermediate code', **kwargs):
+                                      changed_description='Intermediate code', definition_count=len(definitions), **kwargs):
         return definitions
 
     return original_definitions
@@ -1010,79 +1223,141 @@ End AdmitTactic.
     return '%s%s%s' % (header, tac_code, re.sub(tac_code_re, '\n', contents.replace(before, ''), flags=re.DOTALL|re.MULTILINE))
 
 
+def get_fast_oracle_args(output_file_name, **env):
+    """Returns the arguments which make coqc skip opaque proofs, if
+    they are supported and the file still gives the error with them,
+    and an empty tuple otherwise"""
+    if env['coqc_is_coqtop']:
+        if env['verbose'] >= 1: env['log']('\nWarning: --fast-oracle is not supported with --coqc-is-coqtop; not using it.')
+        return tuple()
+    fast_args = get_coq_proof_skipping_args(env['coqc'], **env)
+    if not fast_args:
+        if env['verbose'] >= 1: env['log']('\nWarning: %s has no mode for skipping proofs; not using --fast-oracle.' % env['coqc'])
+        return tuple()
+    output, cmds, retcode = diagnose_error.get_coq_output(env['coqc'], tuple(list(env['coqc_args']) + list(fast_args)), read_from_file(output_file_name), env['timeout'], cwd=env['base_dir'], is_coqtop=False, verbose_base=2, **env)
+    if not diagnose_error.has_error(output, env['error_reg_string']):
+        if env['verbose'] >= 1: env['log']('\nThe error does not show up when proofs are skipped with %s; not using --fast-oracle.' % ' '.join(fast_args))
+        if env['verbose'] >= 2: env['log']('The output was:\n%s' % output)
+        return tuple()
+    if env['verbose'] >= 1: env['log']('\nUsing %s to quickly reject candidates which lose the error.' % ' '.join(fast_args))
+    return fast_args
+
+def common_prefix_length(xs, ys):
+    n = 0
+    for x, y in zip(xs, ys):
+        if x != y: break
+        n += 1
+    return n
+
 def default_on_fatal(message):
     if message is not None: DEFAULT_LOG(message)
     sys.exit(1)
 
-def minimize_file(output_file_name, die=default_on_fatal, **env):
-    """The workhorse of bug minimization.  The only thing it doesn't handle is inlining [Require]s and other preprocesing"""
+def minimize_file(output_file_name, die=default_on_fatal, phase='minimize', resume=None, **env):
+    """The workhorse of bug minimization.  The only thing it doesn't handle is inlining [Require]s and other preprocesing
+
+    If resume is not None, it is the state (read from the journal) of
+    a run of this phase which was interrupted, and we pick up where it
+    stopped."""
+    journal = env['journal']
     contents = read_from_file(output_file_name)
 
     coqc_help = get_coqc_help(env['coqc'], **env)
     env['header_dict'] = get_header_dict(contents, **env)
+    # OUT_FILE already has the header of the interrupted run
+    if resume is not None and resume['header'] is not None: env['header_dict'].update(resume['header'])
+
+    definitions = None
+    if resume is not None and resume['split'] is not None:
+        definitions = journal.load_definitions(resume['definitions_digest'], resume['edits'])
+        if definitions is not None and join_definitions(definitions) not in contents:
+            definitions = None
+        if definitions is None:
+            env['log']('\nWarning: The saved definitions do not match %s; starting this phase over.' % output_file_name)
+        else:
+            if env['verbose'] >= 1: env['log']('\nResuming from the saved definitions...')
+            env['header_dict']['original_line_count'] = resume['split']['original_line_count']
+
+    if definitions is None:
+        if journal is not None and (resume is None or resume['split'] is not None):
+            journal.record('minimize_start', phase=phase,
+                           header=dict((key, env['header_dict'][key]) for key in ('old_header', 'original_line_count')))
+        resume = None
+
+        with profile_pass('validate all coq runs', output_file_name, **env):
+            sanity_check_passed = check_change_and_write_to_file('', contents, output_file_name,
+                                                                 unchanged_message='Invalid empty file!', success_message='Sanity check passed.',
+                                                                 failure_description='validate all coq runs', changed_description='File',
+                                                                 timeout_retry_count=SENSITIVE_TIMEOUT_RETRY_COUNT,
+                                                                 **env)
+        if not sanity_check_passed:
+            return die('Fatal error: Sanity check failed.')
+
+        if env['max_consecutive_newlines'] >= 0 or env['strip_trailing_space']:
+            if env['verbose'] >= 1: env['log']('\nNow, I will attempt to strip repeated newlines and trailing spaces from this file...')
+            with profile_pass('strip newlines and spaces', output_file_name, **env):
+                try_strip_newlines(output_file_name, pass_description='strip newlines and spaces', **env)
 
+        contents = read_from_file(output_file_name)
+        original_line_count = len(contents.split('\n'))
+        env['header_dict']['original_line_count'] = original_line_count
 
-    if not check_change_and_write_to_file('', contents, output_file_name,
-                                          unchanged_message='Invalid empty file!', success_message='Sanity check passed.',
-                                          failure_description='validate all coq runs', changed_description='File',
-                                          timeout_retry_count=SENSITIVE_TIMEOUT_RETRY_COUNT,
-                                          **env):
-        return die('Fatal error: Sanity check failed.')
-
-    if env['max_consecutive_newlines'] >= 0 or env['strip_trailing_space']:
-        if env['verbose'] >= 1: env['log']('\nNow, I will attempt to strip repeated newlines and trailing spaces from this file...')
-        try_strip_newlines(output_file_name, **env)
-
-    contents = read_from_file(output_file_name)
-    original_line_count = len(contents.split('\n'))
-    env['header_dict']['original_line_count'] = original_line_count
-
-    if env['verbose'] >= 1: env['log']('\nNow, I will attempt to strip the comments from this file...')
-    try_strip_comments(output_file_name, **env)
+        if env['verbose'] >= 1: env['log']('\nNow, I will attempt to strip the comments from this file...')
+        with profile_pass('strip comments', output_file_name, **env):
+            try_strip_comments(output_file_name, pass_description='strip comments', **env)
 
 
 
-    contents = read_from_file(output_file_name)
-    if env['verbose'] >= 1:
-        env['log']('\nIn order to efficiently manipulate the file, I have to break it into statements.  I will attempt to do this by matching on periods.')
-        strings = re.findall(r'"[^"\n\r]+"', contents)
-        bad_strings = [i for i in strings if re.search(r'(?<=[^\.]\.\.\.)\s|(?<=[^\.]\.)\s', i)]
-        if bad_strings:
-            env['log']('If you have periods in strings, and these periods are essential to generating the error, then this process will fail.  Consider replacing the string with some hack to get around having a period and then a space, like ["a. b"%string] with [("a." ++ " b")%string].')
-            env['log']('You have the following strings with periods in them:\n%s' % '\n'.join(bad_strings))
-    statements = split_coq_file_contents(contents)
-    if not check_change_and_write_to_file('', '\n'.join(statements), output_file_name,
-                                          unchanged_message='Invalid empty file!',
-                                          success_message='Splitting successful.',
-                                          failure_description='split file to statements',
-                                          changed_description='Split',
-                                          timeout_retry_count=SENSITIVE_TIMEOUT_RETRY_COUNT,
-                                          **env):
-        if env['verbose'] >= 1: env['log']('I will not be able to proceed.')
-        if env['verbose'] >= 2: env['log']('re.search(' + repr(env['error_reg_string']) + ', <output above>)')
-        return die(None)
-
-    if env['verbose'] >= 1: env['log']('\nI will now attempt to remove any lines after the line which generates the error.')
-    output, cmds, retcode = diagnose_error.get_coq_output(env['coqc'], env['coqc_args'], '\n'.join(statements), env['timeout'], is_coqtop=env['coqc_is_coqtop'], verbose_base=2, **env)
-    line_num = diagnose_error.get_error_line_number(output, env['error_reg_string'])
-    try_strip_extra_lines(output_file_name, line_num, **env)
-
-
-    if env['verbose'] >= 1: env['log']('\nIn order to efficiently manipulate the file, I have to break it into definitions.  I will now attempt to do this.')
-    contents = read_from_file(output_file_name)
-    statements = split_coq_file_contents(contents)
-    if env['verbose'] >= 3: env['log']('I am using the following file: %s' % '\n'.join(statements))
-    definitions = split_statements_to_definitions(statements, **env)
-    if not check_change_and_write_to_file('', join_definitions(definitions), output_file_name,
-                                          unchanged_message='Invalid empty file!',
-                                          success_message='Splitting to definitions successful.',
-                                          failure_description='split file to definitions',
-                                          changed_description='Split',
-                                          timeout_retry_count=SENSITIVE_TIMEOUT_RETRY_COUNT,
-                                          **env):
-        if env['verbose'] >= 1: env['log']('I will not be able to proceed.')
-        if env['verbose'] >= 2: env['log']('re.search(' + repr(env['error_reg_string']) + ', <output above>)')
-        return die(None)
+        contents = read_from_file(output_file_name)
+        if env['verbose'] >= 1:
+            env['log']('\nIn order to efficiently manipulate the file, I have to break it into statements.  I will attempt to do this by matching on periods.')
+            strings = re.findall(r'"[^"\n\r]+"', contents)
+            bad_strings = [i for i in strings if re.search(r'(?<=[^\.]\.\.\.)\s|(?<=[^\.]\.)\s', i)]
+            if bad_strings:
+                env['log']('If you have periods in strings, and these periods are essential to generating the error, then this process will fail.  Consider replacing the string with some hack to get around having a period and then a space, like ["a. b"%string] with [("a." ++ " b")%string].')
+                env['log']('You have the following strings with periods in them:\n%s' % '\n'.join(bad_strings))
+        with profile_pass('split file to statements', output_file_name, **env):
+            statements = split_coq_file_contents(contents)
+            split_passed = check_change_and_write_to_file('', '\n'.join(statements), output_file_name,
+                                                          unchanged_message='Invalid empty file!',
+                                                          success_message='Splitting successful.',
+                                                          failure_description='split file to statements',
+                                                          changed_description='Split',
+                                                          timeout_retry_count=SENSITIVE_TIMEOUT_RETRY_COUNT,
+                                                          **env)
+        if not split_passed:
+            if env['verbose'] >= 1: env['log']('I will not be able to proceed.')
+            if env['verbose'] >= 2: env['log']('re.search(' + repr(env['error_reg_string']) + ', <output above>)')
+            return die(None)
+
+        if env['verbose'] >= 1: env['log']('\nI will now attempt to remove any lines after the line which generates the error.')
+        with profile_pass('remove lines after the error', output_file_name, **env):
+            output, cmds, retcode = diagnose_error.get_coq_output(env['coqc'], env['coqc_args'], '\n'.join(statements), env['timeout'], is_coqtop=env['coqc_is_coqtop'], verbose_base=2, **env)
+            line_num = diagnose_error.get_error_line_number(output, env['error_reg_string'])
+            try_strip_extra_lines(output_file_name, line_num, pass_description='remove lines after the error', **env)
+
+
+        if env['verbose'] >= 1: env['log']('\nIn order to efficiently manipulate the file, I have to break it into definitions.  I will now attempt to do this.')
+        contents = read_from_file(output_file_name)
+        with profile_pass('split file to definitions', output_file_name, **env):
+            statements = split_coq_file_contents(contents)
+            if env['verbose'] >= 3: env['log']('I am using the following file: %s' % '\n'.join(statements))
+            definitions = split_statements_to_definitions(statements, **env)
+            split_passed = check_change_and_write_to_file('', join_definitions(definitions), output_file_name,
+                                                          unchanged_message='Invalid empty file!',
+                                                          success_message='Splitting to definitions successful.',
+                                                          failure_description='split file to definitions',
+                                                          changed_description='Split',
+                                                          timeout_retry_count=SENSITIVE_TIMEOUT_RETRY_COUNT,
+                                                          definition_count=len(definitions),
+                                                          **env)
+        if not split_passed:
+            if env['verbose'] >= 1: env['log']('I will not be able to proceed.')
+            if env['verbose'] >= 2: env['log']('re.search(' + repr(env['error_reg_string']) + ', <output above>)')
+            return die(None)
+        if journal is not None:
+            journal.record('definitions_split', original_line_count=env['header_dict']['original_line_count'])
+            journal.save_definitions(definitions)
 
     recursive_tasks = (('remove goals ending in [Abort.]', try_remove_aborted),
                        ('remove unused Ltacs', try_remove_ltac),
@@ -1124,24 +1399,71 @@ def minimize_file(output_file_name, die=default_on_fatal, **env):
                   recursive_tasks)
 
 
-    old_definitions = ''
-    while old_definitions != join_definitions(definitions):
-        old_definitions = join_definitions(definitions)
+    # the statements of the definitions before each of the last
+    # len(tasks) tasks, for finding the prefix which has survived a
+    # full round of tasks
+    recent_statements = []
+
+    # we run rounds of tasks until a round changes nothing; each
+    # round is journaled with the digest of the definitions it started
+    # from and the order of its tasks, so that it can be resumed
+    tasks_by_description = dict(tasks)
+    resume_round = resume['round'] if resume is not None else None
+    if resume_round is not None and not all(description in tasks_by_description for description in resume_round['tasks']):
+        env['log']('\nWarning: The journaled passes differ from the current ones; starting a new round.')
+        resume_round = None
+    round_number, round_digest = 0, None
+    while True:
+        if resume_round is not None:
+            round_number, round_digest = resume_round['number'], resume_round['digest']
+            round_tasks = tuple((description, tasks_by_description[description]) for description in resume_round['tasks'])
+            first_task, resume_tried = resume['task'], resume['tried']
+            resume_round = None
+            if env['verbose'] >= 1 and first_task < len(round_tasks): env['log']('\nResuming round %d at the task to %s' % (round_number + 1, round_tasks[first_task][0]))
+        else:
+            if definitions_digest(definitions) == round_digest: break
+            round_digest = definitions_digest(definitions)
+            round_tasks = tasks if env['time_budget'] is None else env['time_budget'].plan(tasks)
+            first_task, resume_tried = 0, None
+            if journal is not None: journal.record('round_start', number=round_number, digest=round_digest, tasks=[description for description, task in round_tasks])
+        if env['progress'] is not None: env['progress'].begin_round(round_number, [description for description, task in round_tasks])
         if env['verbose'] >= 2: env['log']('Definitions:')
         if env['verbose'] >= 2: env['log'](definitions)
 
-        for description, task in tasks:
+        for n in range(first_task, len(round_tasks)):
+            description, task = round_tasks[n]
+            if journal is not None:
+                journal.begin_task(n, diagnose_error.get_timeout(), tried=(resume_tried if n == first_task else None))
+            if env['time_budget'] is not None:
+                env['time_budget'].not_attempted = [cur_description for cur_description, cur_task in round_tasks[n:]]
+                start, old_size = time.time(), len(join_definitions(definitions))
+            if env['prefix_checkpoint']:
+                recent_statements = (recent_statements + [[defn['statement'] for defn in definitions]])[-len(tasks):]
             if env['verbose'] >= 1: env['log']('\nI will now attempt to %s' % description)
-            definitions = task(definitions, output_file_name, **env)
-
+            with profile_pass(description, output_file_name, task_index=n, **env):
+                definitions = task(definitions, output_file_name, pass_description=description, **env)
+            if env['time_budget'] is not None:
+                env['time_budget'].record_task(description, time.time() - start, old_size - len(join_definitions(definitions)))
+            if env['prefix_checkpoint'] and len(recent_statements) == len(tasks):
+                stable_length = min(common_prefix_length(statements, [defn['statement'] for defn in definitions])
+                                    for statements in recent_statements)
+                prefix_checkpoint.update_prefix_checkpoint(join_definitions(definitions), definitions, stable_length, **env)
+            if journal is not None: journal.end_task(n, definitions)
+        round_number += 1
+
+    if env['time_budget'] is not None: env['time_budget'].not_attempted = []
+    if env['progress'] is not None: env['progress'].end_round()
 
     if env['verbose'] >= 1: env['log']('\nI will now attempt to remove empty sections')
-    try_strip_empty_sections(output_file_name, **env)
+    with profile_pass('remove empty sections', output_file_name, **env):
+        try_strip_empty_sections(output_file_name, pass_description='remove empty sections', **env)
 
     if env['max_consecutive_newlines'] >= 0 or env['strip_trailing_space']:
         if env['verbose'] >= 1: env['log']('\nNow, I will attempt to strip repeated newlines and trailing spaces from this file...')
-        try_strip_newlines(output_file_name, **env)
+        with profile_pass('strip newlines and spaces', output_file_name, **env):
+            try_strip_newlines(output_file_name, pass_description='strip newlines and spaces', **env)
 
+    if journal is not None: journal.record('minimize_done', phase=phase)
     return True
 
 def maybe_add_coqlib_import(contents, **env):
@@ -1157,6 +1479,26 @@ if __name__ == '__main__':
             exc.reraise('\nNote that argparse does not accept arguments with leading dashes.\nTry --foo=bar or --foo " -bar", if this was your intent.\nSee Python issue 9334.')
         else:
             exc.reraise()
+    if args.record_oracle is not None and args.replay_oracle is not None:
+        parser.error('--record-oracle and --replay-oracle are incompatible')
+    try:
+        oracle_cassette = (OracleCassette(args.record_oracle or args.replay_oracle, replay=(args.replay_oracle is not None),
+                                          time_scale=args.replay_time_scale, wait=args.replay_wait, miss_policy=args.replay_miss,
+                                          log=args.log, verbose=args.verbose)
+                           if args.record_oracle is not None or args.replay_oracle is not None else None)
+    except (IOError, OSError, OracleCassetteError) as e:
+        args.log('Error: Could not open the oracle cassette: %s' % e, force_stdout=True)
+        sys.exit(1)
+    set_probe_cassette(oracle_cassette)
+    oracle_daemon = (OracleDaemonClient(args.oracle_daemon, job=os.path.abspath(args.output_file), log=args.log, verbose=args.verbose)
+                     if args.oracle_daemon is not None else None)
+    if oracle_daemon is not None and args.probe_cache is None and get_probe_cache_file() is None:
+        try:
+            set_probe_cache_file(oracle_daemon.info()['probe_cache'])
+        except (IOError, OSError, ValueError, OracleDaemonError) as e:
+            args.log('\nWarning: Could not reach the oracle daemon at %s (%s)' % (args.oracle_daemon, repr(e)), force_stdout=True)
+    else:
+        set_probe_cache_file(args.probe_cache)
     def prepend_coqbin(prog):
         if args.coqbin != '':
             return os.path.join(args.coqbin, prog)
@@ -1208,21 +1550,49 @@ if __name__ == '__main__':
                      if args.base_dir != ''
                      else None),
         'walk_tree': args.walk_tree,
+        'glob_jobs': args.glob_jobs,
+        'persist_glob_index': args.persist_glob_index,
+        'project_index': args.project_index,
         'strict_whitespace': args.strict_whitespace,
         'temp_file_name': args.temp_file,
         'coqc_is_coqtop': args.coqc_is_coqtop,
         'passing_coqc_is_coqtop': args.passing_coqc_is_coqtop,
         'inline_coqlib': args.inline_coqlib,
+        'prefix_checkpoint': args.prefix_checkpoint,
+        'cost_ordering': args.cost_ordering,
+        'time_budget': (TimeBudget(args.time_budget) if args.time_budget is not None else None),
+        'journal': (StateJournal(output_file_name + JOURNAL_EXT, log=args.log, verbose=args.verbose) if args.journal or args.resume else None),
+        'fast_oracle_args': tuple(),
+        'oracle_daemon': oracle_daemon,
+        'oracle_cassette': oracle_cassette,
+        'pass_profiler': (PassProfiler() if args.profile_passes else None),
+        'progress': (ProgressReporter(interval=args.progress_interval, status_line=args.progress, status_file=args.progress_file, log=args.log)
+                     if args.progress or args.progress_file is not None else None),
+        'metrics_exporter': (MetricsExporter(args.metrics_file, output_file_name, interval=args.metrics_interval, log=args.log)
+                             if args.metrics_file is not None else None),
+        'oracle_trace': get_oracle_trace(args.oracle_trace),
         'yes': args.yes,
         }
 
+    if env['pass_profiler'] is not None and hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, (lambda signum, frame: env['log']('\nPer-pass profile so far:\n%s' % env['pass_profiler'].table(), force_stdout=True)))
+
+    sampling_profiler = SamplingProfiler(interval=args.profile_interval) if args.profile is not None else None
+    if sampling_profiler is not None: sampling_profiler.start()
+
     if bug_file_name[-2:] != '.v':
         env['log']('\nError: BUGGY_FILE must end in .v (value: %s)' % bug_file_name, force_stdout=True)
         sys.exit(1)
     if output_file_name[-2:] != '.v':
         env['log']('\nError: OUT_FILE must end in .v (value: %s)' % output_file_name, force_stdout=True)
         sys.exit(1)
-    if os.path.exists(output_file_name):
+    resume_state = None
+    if args.resume:
+        resume_state = env['journal'].load()
+        if resume_state is None or not os.path.exists(output_file_name):
+            env['log']('\nError: Cannot resume without OUT_FILE (%s) and a valid journal (%s).' % (output_file_name, env['journal'].path), force_stdout=True)
+            sys.exit(1)
+    elif os.path.exists(output_file_name):
         env['log']('\nWarning: OUT_FILE (%s) already exists.  Would you like to overwrite?' % output_file_name, force_stdout=True)
         if not yes_no_prompt(yes=env['yes']):
             sys.exit(1)
@@ -1244,6 +1614,7 @@ if __name__ == '__main__':
     if env['passing_coqc_is_coqtop']:
         if env['passing_coqc'] == 'coqc': env['passing_coqc'] = env['coqtop']
 
+    prefetch_coq_probes(coqc_progs=(env['coqc'], env['passing_coqc']), coqtop_progs=(env['coqtop'],), **env)
     coqc_help = get_coqc_help(env['coqc'], **env)
     coqc_version = get_coqc_version(env['coqc'], **env)
 
@@ -1274,6 +1645,13 @@ if __name__ == '__main__':
             env['log']('\nError: TEMP_FILE must end in .v (value: %s)' % env['temp_file_name'], force_stdout=True)
             sys.exit(1)
 
+        if env['progress'] is not None:
+            env['progress'].set_input_size(byte_length(read_from_file(bug_file_name)))
+            env['progress'].start()
+        if env['metrics_exporter'] is not None:
+            env['metrics_exporter'].set_size(byte_length(read_from_file(bug_file_name)))
+            env['metrics_exporter'].start()
+
         if env['verbose'] >= 1: env['log']('\nCoq version: %s\n' % coqc_version)
 
         extra_args = get_coq_prog_args(get_file(bug_file_name, **env)) if args.use_coq_prog_args else []
@@ -1292,7 +1670,13 @@ if __name__ == '__main__':
                 if arg[0] == '-Q': env.get(passing_prefix + 'non_recursive_libnames', []).append((arg[1], arg[2]))
                 if arg[0] == '-I': env.get(passing_prefix + 'ocaml_dirnames', []).append(arg[1])
 
-        if env['minimize_before_inlining']:
+        if resume_state is not None:
+            if env['verbose'] >= 1: env['log']('\nResuming from %s...' % output_file_name)
+            args.bug_file.close()
+            if resume_state['last_accept'] is not None and resume_state['last_accept'] != text_digest(read_from_file(output_file_name)):
+                env['log']('\nWarning: %s has changed since the last change recorded in the journal.' % output_file_name)
+        elif env['minimize_before_inlining']:
+            if env['journal'] is not None: env['journal'].start(bug_file_name)
             if env['verbose'] >= 1: env['log']('\nFirst, I will attempt to factor out all of the [Require]s %s, and store the result in %s...' % (bug_file_name, output_file_name))
             inlined_contents = normalize_requires(bug_file_name, **env)
             args.bug_file.close()
@@ -1303,6 +1687,7 @@ if __name__ == '__main__':
             if env['inline_coqlib']:
                 env['log']('\nError: --inline-coqlib is incompatible with --no-minimize-before-inlining;\nthe Coq standard library is not suited for inlining all-at-once.', force_stdout=True)
                 sys.exit(1)
+            if env['journal'] is not None: env['journal'].start(bug_file_name)
             if env['verbose'] >= 1: env['log']('\nFirst, I will attempt to inline all of the inputs in %s, and store the result in %s...' % (bug_file_name, output_file_name))
             inlined_contents = include_imports(bug_file_name, **env)
             args.bug_file.close()
@@ -1316,13 +1701,20 @@ if __name__ == '__main__':
                 if env['verbose'] >= 1: env['log']('Failed to inline inputs.')
                 sys.exit(1)
 
+        if env['progress'] is not None: env['progress'].set_original_size(byte_length(read_from_file(output_file_name)))
+
         if env['inline_coqlib']:
             for key in ('coqc_args', 'coqtop_args', 'passing_coqc_args'):
                 env[key] = tuple(list(env[key]) + ['-nois', '-coqlib', env['inline_coqlib']])
             env['libnames'] = tuple(list(env['libnames']) + [(os.path.join(env['inline_coqlib'], 'theories'), 'Coq')])
 
-        if env['verbose'] >= 1: env['log']('\nNow, I will attempt to coq the file, and find the error...')
-        env['error_reg_string'] = get_error_reg_string(output_file_name, **env)
+        if resume_state is not None and resume_state['error_reg_string'] is not None:
+            env['error_reg_string'] = resume_state['error_reg_string']
+            if resume_state['timeout'] is not None: diagnose_error.set_timeout(resume_state['timeout'])
+        else:
+            if env['verbose'] >= 1: env['log']('\nNow, I will attempt to coq the file, and find the error...')
+            env['error_reg_string'] = get_error_reg_string(output_file_name, **env)
+            if env['journal'] is not None: env['journal'].record('error_reg_string', value=env['error_reg_string'])
 
         if args.error_log:
             if env['verbose'] >= 1: env['log']('\nNow, I will attempt to find the error message in the log...')
@@ -1331,10 +1723,23 @@ if __name__ == '__main__':
             if not diagnose_error.has_error(error_log, env['error_reg_string']):
                 default_on_fatal('The computed error message was not present in the given error log.')
 
+        if args.fast_oracle:
+            env['fast_oracle_args'] = get_fast_oracle_args(output_file_name, **env)
+
+        phases_done = resume_state['phases_done'] if resume_state is not None else []
+        in_progress = resume_state['minimize'] if resume_state is not None else None
+        def resume_for(phase):
+            return in_progress if in_progress is not None and in_progress['phase'] == phase else None
+
         # initial run before we (potentially) do fancy things with the requires
-        minimize_file(output_file_name, **env)
+        if 'initial' not in phases_done:
+            minimize_file(output_file_name, phase='initial', resume=resume_for('initial'), **env)
 
-        if env['minimize_before_inlining']: # if we've not already inlined everything
+        if resume_for('inline') is not None:
+            # finish minimizing after the inlining we were in the middle of
+            minimize_file(output_file_name, die=(lambda x: False), phase='inline', resume=resume_for('inline'), **env)
+
+        if env['minimize_before_inlining'] and 'final' not in phases_done and resume_for('final') is None: # if we've not already inlined everything
             # so long as we keep changing, we will pull all the
             # requires to the top, then try to replace them in reverse
             # order.  As soon as we succeed, we reset the list
@@ -1342,18 +1747,25 @@ if __name__ == '__main__':
             clear_libimport_cache(lib_of_filename(output_file_name, libnames=tuple(env['libnames']), non_recursive_libnames=tuple(env['non_recursive_libnames'])))
             cur_output = add_admit_tactic(normalize_requires(output_file_name, **env), **env).strip() + '\n'
             # keep a list of libraries we've already tried to inline, and don't try them again
-            libname_blacklist = []
+            libname_blacklist = list(resume_state['libname_blacklist']) if resume_state is not None else []
             first_run = True
             while cur_output != last_output or first_run:
                 first_run = False
                 last_output = cur_output
                 requires = recursively_get_requires_from_file(output_file_name, update_globs=True, **env)
 
-                for req_module in reversed(requires):
+                requires_to_try = list(reversed(requires))
+                for i, req_module in enumerate(requires_to_try):
+                    if env['progress'] is not None:
+                        env['progress'].begin_pass('inline [Require]s')
+                        env['progress'].begin_candidates(len(requires_to_try), done=i + 1)
+                    if env['time_budget'] is not None:
+                        env['time_budget'].not_attempted = ['inline %s' % r for r in requires_to_try[i:] if r not in libname_blacklist]
                     if req_module in libname_blacklist:
                         continue
                     else:
                         libname_blacklist.append(req_module)
+                        if env['journal'] is not None: env['journal'].record('blacklist', libs=libname_blacklist)
                     rep = '\nRequire %s.\n' % req_module
                     if rep not in '\n' + cur_output:
                         if env['verbose'] >= 1: env['log']('\nWarning: I cannot find Require %s.' % req_module)
@@ -1376,14 +1788,14 @@ if __name__ == '__main__':
                             unchanged_message='Invalid empty file!', success_message=('Inlining %s via an Include succeeded.' % req_module),
                             failure_description=('inline %s via Include' % req_module), changed_description='File',
                             timeout_retry_count=SENSITIVE_TIMEOUT_RETRY_COUNT, # is this the right retry count?
-                            display_source_to_error=False,
+                            display_source_to_error=False, pass_description='inline [Require]s',
                             **env):
                         if not check_change_and_write_to_file(
                                 cur_output, test_output_alt, output_file_name,
                                 unchanged_message='Invalid empty file!', success_message=('Inlining %s succeeded.' % req_module),
                                 failure_description=('inline %s' % req_module), changed_description='File',
                                 timeout_retry_count=SENSITIVE_TIMEOUT_RETRY_COUNT, # is this the right retry count?
-                                display_source_to_error=True,
+                                display_source_to_error=True, pass_description='inline [Require]s',
                                 **env):
                             # let's also display the error and source
                             # for the original failure to inline,
@@ -1394,7 +1806,7 @@ if __name__ == '__main__':
                                 unchanged_message='Invalid empty file!', success_message=('Inlining %s via an Include succeeded.' % req_module),
                                 failure_description=('inline %s via Include' % req_module), changed_description='File',
                                 timeout_retry_count=SENSITIVE_TIMEOUT_RETRY_COUNT, # is this the right retry count?
-                                display_source_to_error=True,
+                                display_source_to_error=True, pass_description='inline [Require]s',
                                 **env)
 
                             extra_blacklist = [r for r in get_recursive_require_names(req_module, **env) if r not in libname_blacklist]
@@ -1402,20 +1814,48 @@ if __name__ == '__main__':
                                 env['log']('\nWarning: Preemptively skipping recursive dependency module%s: %s\n'
                                            % (('' if len(extra_blacklist) == 1 else 's'), ', '.join(extra_blacklist)))
                             libname_blacklist.extend(extra_blacklist)
+                            if env['journal'] is not None: env['journal'].record('blacklist', libs=libname_blacklist)
                             continue
 
-                    if minimize_file(output_file_name, die=(lambda x: False), **env):
+                    if minimize_file(output_file_name, die=(lambda x: False), phase='inline', **env):
                         break
 
                 clear_libimport_cache(lib_of_filename(output_file_name, libnames=tuple(env['libnames']), non_recursive_libnames=tuple(env['non_recursive_libnames'])))
                 cur_output = add_admit_tactic(normalize_requires(output_file_name, update_globs=True, **env), **env).strip() + '\n'
 
             # and we make one final run, or, in case there are no requires, one run
-            minimize_file(output_file_name, **env)
+            minimize_file(output_file_name, phase='final', **env)
+
+        if resume_for('final') is not None:
+            minimize_file(output_file_name, phase='final', resume=resume_for('final'), **env)
+
+        if env['journal'] is not None: env['journal'].record('done')
+        if env['time_budget'] is not None: env['log']('\n' + env['time_budget'].summary())
 
+    except TimeBudgetExhausted as e:
+        env['log']('\n%s  Stopping; %s holds the smallest file found so far.' % (str(e), output_file_name), force_stdout=True)
+        env['log'](env['time_budget'].summary(), force_stdout=True)
+    except OracleCassetteError as e:
+        env['log']('\nError: %s' % e, force_stdout=True)
+        sys.exit(1)
     except Exception:
         env['log'](traceback.format_exc())
         raise
     finally:
+        if env['progress'] is not None:
+            env['progress'].stop(state=('done' if sys.exc_info()[0] is None else 'failed'))
+        if env['metrics_exporter'] is not None:
+            env['metrics_exporter'].stop()
+        if env['oracle_cassette'] is not None and env['verbose'] >= 1:
+            env['log']('\n%s' % env['oracle_cassette'].summary())
+        if env['pass_profiler'] is not None:
+            env['log']('\nPer-pass profile:\n%s' % env['pass_profiler'].table(), force_stdout=True)
+        if sampling_profiler is not None:
+            sampling_profiler.stop()
+            try:
+                sampling_profiler.write_collapsed(args.profile)
+            except (IOError, OSError) as e:
+                env['log']('\nWarning: Could not write the profile to %s (%s)' % (args.profile, repr(e)))
+            env['log']('\nProfile (stacks in %s):\n%s' % (args.profile, sampling_profiler.summary(top=args.profile_top)), force_stdout=True)
         if env['remove_temp_file']:
             clean_v_file(env['temp_file_name'])
@@ -7,6 +7,7 @@ from diagnose_error import get_coq_output, get_coq_output_iterable
 from import_util import lib_of_filename, norm_libname
 from memoize import memoize
 from coq_version import get_coqc_version, get_coqtop_version, get_coqc_help, get_coq_accepts_top, group_coq_args
+from probe_cache import set_probe_cache_file
 from custom_arguments import add_libname_arguments, update_env_with_libnames, add_logging_arguments, process_logging_arguments, DEFAULT_LOG, DEFAULT_VERBOSITY
 from binding_util import has_dir_binding, deduplicate_trailing_dir_bindings, process_maybe_list
 from file_util import clean_v_file, read_from_file, write_to_file, restore_file
@@ -29,6 +30,11 @@ parser.add_argument('--coqc-is-coqtop', dest='coqc_is_coqtop', default=False, ac
                     help="Strip the .v and pass -load-vernac-source to the coqc programs; this allows you to pass `--coqc coqtop'")
 parser.add_argument('--coqtop', metavar='COQTOP', dest='coqtop', type=str, default=DEFAULT_COQTOP,
                     help=('The path to the coqtop program (default: %s).' % DEFAULT_COQTOP))
+parser.add_argument('--probe-cache', metavar='FILE', dest='probe_cache', type=str, default=None,
+                    help=("A file in which to cache what we learn by probing the Coq binaries " +
+                          "(versions, supported options, etc.) across runs; the results are keyed on " +
+                          "the path, size, modification time, and inode of each binary " +
+                          "(Default: the value of the environment variable COQ_TOOLS_PROBE_CACHE, if set)."))
 add_libname_arguments(parser)
 add_logging_arguments(parser)
 
@@ -88,6 +94,7 @@ if __name__ == '__main__':
             exc.reraise('\nNote that argparse does not accept arguments with leading dashes.\nTry --foo=bar or --foo " -bar", if this was your intent.\nSee Python issue 9334.')
         else:
             exc.reraise()
+    set_probe_cache_file(args.probe_cache)
     def prepend_coqbin(prog):
         if args.coqbin != '':
             return os.path.join(args.coqbin, prog)
@@ -0,0 +1,167 @@
+from __future__ import with_statement
+import os, re, json
+from array import array
+from custom_arguments import DEFAULT_LOG, DEFAULT_VERBOSITY
+from project_index import get_project_index, bytes_digest
+import util
+
+__all__ = ["GlobIndex", "get_glob_index", "clear_glob_index_cache", "GLOB_INDEX_EXT"]
+
+GLOB_INDEX_EXT = '.idx'
+GLOB_INDEX_VERSION = 1
+
+REFERENCE_REG = re.compile('^R([0-9]+):([0-9]+) ([^ ]+) <> ([^ ]+) ([^ ]+)$', re.MULTILINE)
+
+class GlobIndex(object):
+    """A pre-parsed table of the references (R lines) of a .glob file.
+
+    The start and end byte locations are stored in arrays; the
+    locations, names, and types of references are interned, and each
+    row stores only indices into the interned tables.  Rows are
+    deduplicated, and sorted by start location, in descending order,
+    which is the order in which absolutization wants them.
+
+    Note that, as in the .glob file, end locations are inclusive; the
+    references method returns exclusive end locations."""
+    def __init__(self, starts, ends, locs, appends, types, loc_table, name_table, type_table):
+        self.starts = array('l', starts)
+        self.ends = array('l', ends)
+        self.locs = array('l', locs)
+        self.appends = array('l', appends)
+        self.types = array('l', types)
+        self.loc_table = tuple(loc_table)
+        self.name_table = tuple(name_table)
+        self.type_table = tuple(type_table)
+        self._rows_by_type = None
+        self._references = {}
+
+    @classmethod
+    def from_globs(cls, globs):
+        """Parses the contents of a .glob file (a string)"""
+        interned = ({}, {}, {})
+        tables = ([], [], [])
+        def intern(kind, value):
+            if value not in interned[kind]:
+                interned[kind][value] = len(tables[kind])
+                tables[kind].append(value)
+            return interned[kind][value]
+        rows = set()
+        for start, end, loc, append, ty in REFERENCE_REG.findall(globs):
+            rows.add((int(start), int(end), intern(0, loc), intern(1, append), intern(2, ty.strip())))
+        rows = sorted(rows, key=(lambda row: row[0]), reverse=True)
+        columns = tuple(zip(*rows)) if rows else ((), (), (), (), ())
+        return cls(*(columns + tables))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def rows_of_types(self, types=None):
+        """Returns the indices of the rows whose type is in types (or all rows, if types is None)"""
+        if types is None: return range(len(self))
+        if self._rows_by_type is None:
+            rows_by_type = {}
+            for i, ty in enumerate(self.types):
+                rows_by_type.setdefault(ty, array('l')).append(i)
+            self._rows_by_type = rows_by_type
+        type_ids = [i for i, ty in enumerate(self.type_table) if ty in types]
+        if len(type_ids) == 1: return self._rows_by_type[type_ids[0]]
+        return sorted(i for ty in type_ids for i in self._rows_by_type[ty])
+
+    def references(self, types=None):
+        """Returns a tuple of (start, end, location, name, type)
+        references, with exclusive end locations, in descending order
+        of start location"""
+        key = tuple(sorted(types)) if types is not None else None
+        if key not in self._references:
+            self._references[key] = tuple((self.starts[i], self.ends[i] + 1,
+                                           self.loc_table[self.locs[i]], self.name_table[self.appends[i]],
+                                           self.type_table[self.types[i]])
+                                          for i in self.rows_of_types(types))
+        return self._references[key]
+
+    def lib_references(self):
+        """Returns a tuple of (start, end, library) for the [Require]d
+        libraries, with inclusive end locations, in ascending order of
+        start location"""
+        return tuple((self.starts[i], self.ends[i], self.loc_table[self.locs[i]])
+                     for i in reversed(self.rows_of_types(('lib',)))
+                     if self.name_table[self.appends[i]] == '<>')
+
+    def to_json_dict(self):
+        return {'version': GLOB_INDEX_VERSION,
+                'starts': self.starts.tolist(), 'ends': self.ends.tolist(),
+                'locs': self.locs.tolist(), 'appends': self.appends.tolist(), 'types': self.types.tolist(),
+                'loc_table': self.loc_table, 'name_table': self.name_table, 'type_table': self.type_table}
+
+    @classmethod
+    def from_json_dict(cls, d):
+        if d.get('version') != GLOB_INDEX_VERSION: return None
+        return cls(d['starts'], d['ends'], d['locs'], d['appends'], d['types'],
+                   d['loc_table'], d['name_table'], d['type_table'])
+
+GLOB_INDEX_CACHE = {}
+
+def clear_glob_index_cache():
+    GLOB_INDEX_CACHE.clear()
+
+def glob_stamp(glob_name):
+    st = os.stat(glob_name)
+    return (st.st_mtime, st.st_size)
+
+def load_glob_index(glob_name, stamp, log=DEFAULT_LOG, verbose=DEFAULT_VERBOSITY):
+    idx_name = glob_name + GLOB_INDEX_EXT
+    if not os.path.isfile(idx_name): return None
+    try:
+        with open(idx_name, 'r') as f:
+            d = json.load(f)
+        if (d.get('mtime'), d.get('size')) != stamp: return None
+        return GlobIndex.from_json_dict(d)
+    except (IOError, OSError, ValueError, KeyError, TypeError) as e:
+        if verbose >= 2: log('WARNING: Ignoring invalid glob index %s (%s)' % (idx_name, repr(e)))
+        return None
+
+def save_glob_index(glob_name, stamp, index, log=DEFAULT_LOG, verbose=DEFAULT_VERBOSITY):
+    idx_name = glob_name + GLOB_INDEX_EXT
+    tmp_name = '%s.%d.tmp' % (idx_name, os.getpid())
+    d = index.to_json_dict()
+    d['mtime'], d['size'] = stamp
+    try:
+        with open(tmp_name, 'w') as f:
+            json.dump(d, f, separators=(',', ':'))
+        if os.path.exists(idx_name): os.remove(idx_name)
+        os.rename(tmp_name, idx_name)
+    except (IOError, OSError) as e:
+        if verbose: log('WARNING: Could not write glob index %s (%s)' % (idx_name, repr(e)))
+        if os.path.exists(tmp_name): os.remove(tmp_name)
+
+def get_glob_index(glob_name, persist_glob_index=False, log=DEFAULT_LOG, verbose=DEFAULT_VERBOSITY, **kwargs):
+    """Returns the GlobIndex of the .glob file glob_name, reusing the
+    cached index as long as the modification time and size of the file
+    are unchanged.  If persist_glob_index is True, the index is also
+    stored in (and loaded from) glob_name + GLOB_INDEX_EXT.  If a
+    project index is given (via kwargs['project_index']), the index is
+    also stored there, under the digest of the .glob file."""
+    key = os.path.abspath(glob_name)
+    stamp = glob_stamp(glob_name)
+    if key in GLOB_INDEX_CACHE and GLOB_INDEX_CACHE[key][0] == stamp:
+        return GLOB_INDEX_CACHE[key][1]
+    index = None
+    if persist_glob_index:
+        index = load_glob_index(glob_name, stamp, log=log, verbose=verbose)
+    if index is None:
+        with open(glob_name, 'rb') as f:
+            contents = f.read()
+        project_index = get_project_index(log=log, verbose=verbose, **kwargs)
+        if project_index is not None:
+            digest = bytes_digest(contents)
+            d = project_index.get_json(glob_name, 'glob_index', '', digest)
+            if d is not None: index = GlobIndex.from_json_dict(d)
+        if index is None:
+            if verbose >= 2: log('Indexing %s' % glob_name)
+            index = GlobIndex.from_globs(util.normalize_newlines(contents.decode('utf-8')))
+            if project_index is not None:
+                project_index.put_json(glob_name, 'glob_index', '', digest, index.to_json_dict())
+        if persist_glob_index:
+            save_glob_index(glob_name, stamp, index, log=log, verbose=verbose)
+    GLOB_INDEX_CACHE[key] = (stamp, index)
+    return index
@@ -1,10 +1,13 @@
 from __future__ import with_statement, print_function
-import os, subprocess, re, sys, glob, os.path, tempfile, time
-from functools import cmp_to_key
+import os, subprocess, re, sys, glob, os.path, tempfile, shutil, json
+from collections import OrderedDict
 from memoize import memoize
+from parallel_util import run_dag_in_parallel, default_job_count
+from glob_index import GlobIndex, get_glob_index
+from project_index import get_project_index, get_file_digest, bytes_digest
+import require_graph
 from coq_version import get_coqc_help, get_coq_accepts_o, group_coq_args_split_recognized, coq_makefile_supports_arg
 from custom_arguments import DEFAULT_VERBOSITY, DEFAULT_LOG
-from util import cmp_compat as cmp
 import util
 
 __all__ = ["filename_of_lib", "lib_of_filename", "get_file_as_bytes", "get_file", "make_globs", "get_imports", "norm_libname", "recursively_get_imports", "IMPORT_ABSOLUTIZE_TUPLE", "ALL_ABSOLUTIZE_TUPLE", "absolutize_has_all_constants", "run_recursively_get_imports", "clear_libimport_cache", "get_byte_references_for", "sort_files_by_dependency", "get_recursive_requires", "get_recursive_require_names"]
@@ -40,6 +43,9 @@ def fill_kwargs(kwargs):
         'walk_tree'             : True,
         'coqc_args'             : tuple(),
         'inline_coqlib'         : None,
+        'glob_jobs'             : None,
+        'persist_glob_index'    : False,
+        'project_index'         : None,
         }
     rtn.update(kwargs)
     return rtn
@@ -77,17 +83,68 @@ def os_walk(top, topdown=True, onerror=None, followlinks=False):
 def os_path_isfile(filename):
     return os.path.isfile(filename)
 
+@memoize
+def get_logical_prefix_index(libnames, non_recursive_libnames):
+    '''Returns a dict mapping each logical name (with its trailing dot)
+    to the list of (position, physical name) pairs bound to it, where
+    position is the index of the binding in libnames +
+    non_recursive_libnames'''
+    index = {}
+    for i, (physical_name, logical_name) in enumerate(list(libnames) + list(non_recursive_libnames)):
+        index.setdefault(libname_with_dot(logical_name), []).append((i, physical_name))
+    return index
+
 def filenames_of_lib_helper(lib, libnames, non_recursive_libnames, ext):
-    for physical_name, logical_name in list(libnames) + list(non_recursive_libnames):
-        if lib.startswith(libname_with_dot(logical_name)):
-            cur_lib = lib[len(libname_with_dot(logical_name)):]
-            cur_lib = os.path.join(physical_name, cur_lib.replace('.', os.sep))
-            yield fix_path(os.path.relpath(os.path.normpath(cur_lib + ext), '.'))
+    index = get_logical_prefix_index(libnames, non_recursive_libnames)
+    # the logical names which could be bound to lib are exactly the
+    # (dotted) proper prefixes of lib, so we look each of them up
+    # rather than scanning every binding
+    components = lib.split('.')
+    prefixes = [''] + ['.'.join(components[:i]) + '.' for i in range(1, len(components))]
+    matches = sorted((i, physical_name, prefix)
+                     for prefix in prefixes
+                     for i, physical_name in index.get(prefix, ()))
+    for i, physical_name, prefix in matches:
+        cur_lib = lib[len(prefix):]
+        cur_lib = os.path.join(physical_name, cur_lib.replace('.', os.sep))
+        yield fix_path(os.path.relpath(os.path.normpath(cur_lib + ext), '.'))
+
+@memoize
+def get_local_stem_index(top):
+    '''Returns a pair of a dict mapping each directory under top to its
+    position in os_walk(top), and a dict mapping the name (without
+    extension) of every file under top to the list of directories which
+    contain a file with that name'''
+    dir_positions, dirs_of_stem = {}, {}
+    for i, (dirpath, dirnames, filenames) in enumerate(os_walk(top, followlinks=True)):
+        dir_positions.setdefault(dirpath, i)
+        for stem in set(os.path.splitext(name)[0] for name in filenames):
+            dirs_of_stem.setdefault(stem, []).append(dirpath)
+    return dir_positions, dirs_of_stem
 
 def local_filenames_of_lib_helper(lib, libnames, non_recursive_libnames, ext):
     # is this the right thing to do?
+    components = lib.split('.')
     lib = lib.replace('.', os.sep)
-    for dirpath, dirname, filenames in os_walk('.', followlinks=True):
+    if '' in components or any(os.sep in component or (os.altsep and os.altsep in component) for component in components):
+        # fall back to probing every directory for unusual names
+        for dirpath, dirname, filenames in os_walk('.', followlinks=True):
+            filename = os.path.relpath(os.path.normpath(os.path.join(dirpath, lib + ext)), '.')
+            if os_path_isfile(filename):
+                yield fix_path(filename)
+        return
+    # only the directories containing a file named like the last
+    # component of lib can hold lib, so we look at those rather than
+    # probing every directory under '.'; we always probe '.' itself,
+    # so that files created there after the walk are still found
+    dir_positions, dirs_of_stem = get_local_stem_index('.')
+    top_dirs = [(dir_positions.get(os.curdir, 0), os.curdir)]
+    for dirpath in dirs_of_stem.get(components[-1], ()):
+        dir_components = dirpath.split(os.sep)
+        if len(dir_components) > len(components) - 1 and dir_components[len(dir_components) - (len(components) - 1):] == components[:-1]:
+            top_dir = os.sep.join(dir_components[:len(dir_components) - (len(components) - 1)])
+            if top_dir in dir_positions: top_dirs.append((dir_positions[top_dir], top_dir))
+    for pos, dirpath in sorted(set(top_dirs)):
         filename = os.path.relpath(os.path.normpath(os.path.join(dirpath, lib + ext)), '.')
         if os_path_isfile(filename):
             yield fix_path(filename)
@@ -130,6 +187,20 @@ def filename_of_lib(lib, ext='.v', **kwargs):
     kwargs = fill_kwargs(kwargs)
     return filename_of_lib_helper(lib, libnames=tuple(kwargs['libnames']), non_recursive_libnames=tuple(kwargs['non_recursive_libnames']), ext=ext)
 
+@memoize
+def get_physical_prefix_index(libnames, non_recursive_libnames):
+    '''Returns a dict mapping each (absolute) physical name to the
+    position of its first binding in libnames + non_recursive_libnames,
+    and the relative physical name and logical name (with its trailing
+    dot) bound to it there'''
+    index = {}
+    for i, (phys, logical) in enumerate(list(libnames) + list(non_recursive_libnames)):
+        physical_name = os.path.relpath(os.path.normpath(phys), '.')
+        key = os.path.abspath(physical_name)
+        if key not in index:
+            index[key] = (i, physical_name, libname_with_dot(logical))
+    return index
+
 @memoize
 def lib_of_filename_helper(filename, libnames, non_recursive_libnames, exts):
     filename = os.path.relpath(os.path.normpath(filename), '.')
@@ -137,10 +208,21 @@ def lib_of_filename_helper(filename, libnames, non_recursive_libnames, exts):
         if filename.endswith(ext):
             filename = filename[:-len(ext)]
             break
-    for physical_name, logical_name in ((os.path.relpath(os.path.normpath(phys), '.'), libname_with_dot(logical)) for phys, logical in list(libnames) + list(non_recursive_libnames)):
+    # the physical names which could contain filename are exactly its
+    # ancestor directories, so we look each of them up rather than
+    # scanning every binding
+    index = get_physical_prefix_index(libnames, non_recursive_libnames)
+    matches = []
+    ancestor = os.path.abspath(filename)
+    while True:
+        if ancestor in index: matches.append(index[ancestor])
+        parent = os.path.dirname(ancestor)
+        if parent == ancestor: break
+        ancestor = parent
+    if len(matches) > 0:
+        pos, physical_name, logical_name = min(matches)
         filename_rel = os.path.relpath(filename, physical_name)
-        if not filename_rel.startswith('..' + os.sep) and not os.path.isabs(filename_rel):
-            return (filename, logical_name + filename_rel.replace(os.sep, '.'))
+        return (filename, logical_name + filename_rel.replace(os.sep, '.'))
     if filename.startswith('..' + os.sep) and not os.path.isabs(filename):
         filename = os.path.abspath(filename)
     return (filename, filename.replace(os.sep, '.'))
@@ -231,21 +313,56 @@ def remove_from_require_before(contents, location):
     if before is None: return contents
     return (before + after).encode('utf-8')
 
+SPACE_BYTES = b'\n\t\r '
+
+def skip_space_bytes_before(contents, location):
+    while location > 0 and contents[location-1:location] in SPACE_BYTES:
+        location -= 1
+    return location
+
+# uses byte locations
+def get_from_require_range_before(contents, location):
+    """returns the byte range of "From ... " in things like "From ... Require ...",
+    where the required library starts at location, or None if there
+    is no such range; this is the range that remove_from_require_before removes"""
+    assert(contents is bytes(contents))
+    location = skip_space_bytes_before(contents, location)
+    for keyword in (b'Import', b'Export'):
+        if contents.endswith(keyword, 0, location):
+            location -= len(keyword)
+            break
+    location = skip_space_bytes_before(contents, location)
+    if not contents.endswith(b'Require', 0, location): return None
+    require_start = location = location - len(b'Require')
+    location = skip_space_bytes_before(contents, location)
+    while location > 0 and contents[location-1:location] not in SPACE_BYTES:
+        location -= 1
+    location = skip_space_bytes_before(contents, location)
+    if not contents.endswith(b'From', 0, location): return None
+    return (location - len(b'From'), require_start)
+
 # returns locations as bytes
 def get_references_from_globs(globs):
-    all_globs = set((int(start), int(end) + 1, loc, append, ty.strip())
-                    for start, end, loc, append, ty
-                    in re.findall('^R([0-9]+):([0-9]+) ([^ ]+) <> ([^ ]+) ([^ ]+)$', globs, flags=re.MULTILINE))
-    return tuple(sorted(all_globs, key=(lambda x: x[0]), reverse=True))
+    return GlobIndex.from_globs(globs).references()
 
-# contents should be bytes; globs should be string
+# contents should be bytes; globs should be string or a GlobIndex
 def update_with_glob(contents, globs, absolutize, libname, transform_base=(lambda x: x), **kwargs):
     assert(contents is bytes(contents))
     kwargs = fill_kwargs(kwargs)
-    for start, end, loc, append, ty in get_references_from_globs(globs):
+    index = globs if isinstance(globs, GlobIndex) else GlobIndex.from_globs(globs)
+    # We collect the edits from the end of the file to the beginning,
+    # and then splice the file together once, rather than rebuilding
+    # the file for every reference.  Since references are sorted by
+    # descending start location, no edit may touch anything at or
+    # after the start of an edit that has already been collected.
+    pieces = []
+    unchanged_end = len(contents)
+    for start, end, loc, append, ty in index.references():
         cur_code = contents[start:end].decode('utf-8')
         if ty not in absolutize or loc == libname:
             if kwargs['verbose'] >= 2: kwargs['log']('Skipping %s at %d:%d (%s), location %s %s' % (ty, start, end, cur_code, loc, append))
+        elif end > unchanged_end:
+            if kwargs['verbose'] >= 2: kwargs['log']('Skipping overlapping %s at %d:%d (%s), location %s %s' % (ty, start, end, cur_code, loc, append))
         # sanity check for correct replacement, to skip things like record builder notation
         elif append != '<>' and get_constr_name(cur_code) != append:
             if kwargs['verbose'] >= 2: kwargs['log']('Skipping invalid %s at %d:%d (%s), location %s %s' % (ty, start, end, cur_code, loc, append))
@@ -253,10 +370,17 @@ def update_with_glob(contents, globs, absolutize, libname, transform_base=(lambd
             rep = transform_base(loc) + ('.' + append if append != '<>' else '')
             if kwargs['verbose'] == 2: kwargs['log']('Qualifying %s %s to %s' % (ty, cur_code, rep))
             if kwargs['verbose'] > 2: kwargs['log']('Qualifying %s %s to %s from R%s:%s %s <> %s %s' % (ty, cur_code, rep, start, end, loc, append, ty))
-            contents = contents[:start] + rep.encode('utf-8') + contents[end:]
-            contents = remove_from_require_before(contents, start)
-
-    return contents
+            pieces.append(contents[end:unchanged_end])
+            pieces.append(rep.encode('utf-8'))
+            unchanged_end = start
+            from_range = get_from_require_range_before(contents, start)
+            if from_range is not None:
+                from_start, require_start = from_range
+                pieces.append(contents[require_start:unchanged_end])
+                unchanged_end = from_start
+    pieces.append(contents[:unchanged_end])
+
+    return b''.join(reversed(pieces))
 
 def get_all_v_files(directory, exclude=tuple()):
     all_files = []
@@ -311,17 +435,63 @@ def run_coq_makefile_and_make(v_files, targets, **kwargs):
         error("Perhaps you forgot to add COQBIN to your PATH?")
         error("Try running coqc on your files to get .glob files, to work around this.")
         sys.exit(1)
+    make_cmds = ['make', '-k', '-f', mkfile]
+    glob_jobs = get_glob_jobs(**kwargs)
+    if glob_jobs > 1:
+        make_cmds += ['-j%d' % glob_jobs]
     if kwargs['verbose']:
-        kwargs['log'](' '.join(['make', '-k', '-f', mkfile] + targets))
+        kwargs['log'](' '.join(make_cmds + targets))
     try:
-        p_make = subprocess.Popen(['make', '-k', '-f', mkfile] + targets, stdin=subprocess.PIPE, stdout=sys.stderr) #, stdout=subprocess.PIPE)
+        p_make = subprocess.Popen(make_cmds + targets, stdin=subprocess.PIPE, stdout=sys.stderr) #, stdout=subprocess.PIPE)
         return p_make.communicate()
     finally:
         for filename in (mkfile, mkfile + '.conf', mkfile + '.d', '.%s.d' % mkfile, '.coqdeps.d'):
             if os.path.exists(filename):
                 os.remove(filename)
 
-def make_one_glob_file(v_file, **kwargs):
+def get_glob_jobs(**kwargs):
+    if kwargs.get('glob_jobs') is None: return default_job_count()
+    return max(1, kwargs['glob_jobs'])
+
+glob_source_digests = {}
+
+def get_v_file_digest(v_name):
+    # we do not trust modification times here, since the .v file may
+    # have been rewritten within the granularity of the file system
+    with open(v_name, 'rb') as f:
+        return bytes_digest(f.read())
+
+def record_glob_source(glob_name, v_digest, **kwargs):
+    '''Records that glob_name was generated from a .v file whose contents had digest v_digest'''
+    st = os.stat(glob_name)
+    glob_source_digests[os.path.abspath(glob_name)] = ((st.st_mtime, st.st_size), v_digest)
+    project_index = get_project_index(**kwargs)
+    if project_index is not None:
+        project_index.put_json(glob_name, 'glob_source', '', get_file_digest(glob_name), v_digest)
+
+def get_glob_source_digest(glob_name, **kwargs):
+    '''Returns the digest of the .v file that glob_name was generated from, or None if we did not record it'''
+    st = os.stat(glob_name)
+    key = os.path.abspath(glob_name)
+    if key in glob_source_digests and glob_source_digests[key][0] == (st.st_mtime, st.st_size):
+        return glob_source_digests[key][1]
+    project_index = get_project_index(**kwargs)
+    if project_index is not None:
+        return project_index.get_json(glob_name, 'glob_source', '', get_file_digest(glob_name))
+    return None
+
+def is_glob_fresh(v_name, glob_name, **kwargs):
+    '''Returns True if glob_name is an up-to-date .glob file for
+    v_name, i.e., if it was generated from the current contents of
+    v_name.  For .glob files whose origin we did not record, we fall
+    back to comparing modification times.'''
+    if not os.path.isfile(glob_name): return False
+    source_digest = get_glob_source_digest(glob_name, **kwargs)
+    if source_digest is not None:
+        return source_digest == get_v_file_digest(v_name)
+    return os.path.getmtime(glob_name) > os.path.getmtime(v_name)
+
+def make_one_glob_file(v_file, glob_file=None, **kwargs):
     kwargs = safe_kwargs(fill_kwargs(kwargs))
     coqc_prog = get_maybe_passing_arg(kwargs, 'coqc')
     cmds = [coqc_prog, '-q']
@@ -333,19 +503,60 @@ def make_one_glob_file(v_file, **kwargs):
         cmds += ['-I', dirname]
     cmds += list(get_maybe_passing_arg(kwargs, 'coqc_args'))
     v_file_root, ext = os.path.splitext(fix_path(v_file))
-    o_file = os.path.join(tempfile.gettempdir(), os.path.basename(v_file_root) + '.vo')
+    if glob_file is None: glob_file = v_file_root + '.glob'
+    # each job gets its own output directory for the .vo file and a
+    # temporary .glob file, so that concurrent jobs never write to
+    # the same path; the .glob file is moved into place once coqc is
+    # done
+    o_dir = tempfile.mkdtemp()
+    o_file = os.path.join(o_dir, os.path.basename(v_file_root) + '.vo')
+    tmp_glob_file = os.path.join(o_dir, os.path.basename(v_file_root) + '.glob')
     if get_coq_accepts_o(coqc_prog, **kwargs):
         cmds += ['-o', o_file]
     else:
-        kwargs['log']("WARNING: Clobbering '%s' because coqc does not support -o" % o_file)
-    cmds += ['-dump-glob', v_file_root + '.glob', v_file_root + ext]
+        kwargs['log']("WARNING: Clobbering '%s' because coqc does not support -o" % (v_file_root + '.vo'))
+    cmds += ['-dump-glob', tmp_glob_file, v_file_root + ext]
     if kwargs['verbose']:
         kwargs['log'](' '.join(cmds))
+    v_digest = get_v_file_digest(v_file_root + ext)
     try:
         p = subprocess.Popen(cmds, stdout=subprocess.PIPE)
-        return p.communicate()
+        ret = p.communicate()
+        if os.path.exists(tmp_glob_file):
+            if os.path.exists(glob_file): os.remove(glob_file)
+            shutil.move(tmp_glob_file, glob_file)
+            record_glob_source(glob_file, v_digest, **kwargs)
+        return ret
     finally:
-        if os.path.exists(o_file): os.remove(o_file)
+        shutil.rmtree(o_dir, ignore_errors=True)
+
+def get_glob_dependencies(v_names, **kwargs):
+    """Returns a dict mapping each file in v_names to the files in
+    v_names that it (syntactically) Requires.  We use the fast regexp
+    method, because the .glob files are exactly what we are trying to
+    make."""
+    v_names = set(v_names)
+    ret = {}
+    for v_name in v_names:
+        contents = get_raw_file(v_name, **kwargs)
+        imports_string = re.sub('\\s+', ' ', ' '.join(IMPORT_LINE_REG.findall(contents))).strip()
+        deps = set(filename_of_lib(i, ext='.v', **kwargs) for i in imports_string.split(' ') if i != '')
+        ret[v_name] = tuple(sorted(dep for dep in deps if dep in v_names and dep != v_name))
+    return ret
+
+def make_glob_files_in_parallel(filenames_v_glob, **kwargs):
+    """Runs coqc -dump-glob on each (v_name, glob_name) pair, using at
+    most get_glob_jobs(**kwargs) concurrent jobs, and starting each
+    job only once the jobs for the files it Requires have finished."""
+    filenames_v_glob = list(filenames_v_glob)
+    if len(filenames_v_glob) == 0: return
+    glob_of_v = dict(filenames_v_glob)
+    dependencies = (get_glob_dependencies([v_name for v_name, glob_name in filenames_v_glob], **kwargs)
+                    if len(filenames_v_glob) > 1 else {})
+    run_dag_in_parallel((lambda v_name: make_one_glob_file(v_name, glob_file=glob_of_v[v_name], **kwargs)),
+                        [v_name for v_name, glob_name in filenames_v_glob],
+                        dependencies,
+                        jobs=get_glob_jobs(**kwargs))
 
 def make_globs(logical_names, **kwargs):
     kwargs = fill_kwargs(kwargs)
@@ -354,30 +565,66 @@ def make_globs(logical_names, **kwargs):
     if len(existing_logical_names) == 0: return
     filenames_vo_v_glob = [(filename_of_lib(i, ext='.vo', **kwargs), filename_of_lib(i, ext='.v', **kwargs), filename_of_lib(i, ext='.glob', **kwargs)) for i in existing_logical_names]
     filenames_vo_v_glob = [(vo_name, v_name, glob_name) for vo_name, v_name, glob_name in filenames_vo_v_glob
-                           if not (os.path.isfile(glob_name) and os.path.getmtime(glob_name) > os.path.getmtime(v_name))]
+                           if not is_glob_fresh(v_name, glob_name, **kwargs)]
     for vo_name, v_name, glob_name in filenames_vo_v_glob:
-        if os.path.isfile(glob_name) and not os.path.getmtime(glob_name) > os.path.getmtime(v_name):
+        if os.path.isfile(glob_name):
             os.remove(glob_name)
-        # if the .vo file already exists and is new enough, we assume
-        # that all dependent .vo files also exist, and just run coqc
-        # in a way that doesn't update the .vo file.  We use >= rather
-        # than > because we're using .vo being new enough as a proxy
-        # for the dependent .vo files existing, so we don't care as
-        # much about being perfectly accurate on .vo file timing
-        # (unlike .glob file timing, were we need it to be up to
-        # date), and it's better to not clobber the .vo file when
-        # we're unsure if it's new enough.
-        if os.path.exists(vo_name) and os.path.getmtime(vo_name) >= os.path.getmtime(v_name):
-            make_one_glob_file(v_name, **kwargs)
+    cassette = kwargs.get('oracle_cassette')
+    if cassette is not None:
+        filenames_vo_v_glob = [(vo_name, v_name, glob_name) for vo_name, v_name, glob_name in filenames_vo_v_glob
+                               if not replay_glob_file(cassette, v_name, glob_name, **kwargs)]
+        try:
+            make_glob_files(filenames_vo_v_glob, **kwargs)
+        finally:
+            record_glob_files(cassette, filenames_vo_v_glob)
+    else:
+        make_glob_files(filenames_vo_v_glob, **kwargs)
+
+def replay_glob_file(cassette, v_name, glob_name, **kwargs):
+    '''Writes glob_name from the oracle cassette, if it has a record of it'''
+    with open(v_name, 'rb') as f:
+        v_contents = f.read()
+    glob_contents = cassette.replay_file('glob', v_name, v_contents)
+    if glob_contents is None: return False
+    with open(glob_name, 'wb') as f:
+        f.write(glob_contents.encode('utf-8'))
+    record_glob_source(glob_name, bytes_digest(v_contents), **kwargs)
+    return True
+
+def record_glob_files(cassette, filenames_vo_v_glob):
+    for vo_name, v_name, glob_name in filenames_vo_v_glob:
+        if os.path.isfile(glob_name):
+            with open(v_name, 'rb') as f:
+                v_contents = f.read()
+            with open(glob_name, 'rb') as f:
+                cassette.record_file('glob', v_name, v_contents, util.s(f.read()))
+
+def make_glob_files(filenames_vo_v_glob, **kwargs):
+    # if the .vo file already exists and is new enough, we assume
+    # that all dependent .vo files also exist, and just run coqc in a
+    # way that doesn't update the .vo file.  We use >= rather than >
+    # because we're using .vo being new enough as a proxy for the
+    # dependent .vo files existing, so we don't care as much about
+    # being perfectly accurate on .vo file timing (unlike .glob file
+    # timing, were we need it to be up to date), and it's better to
+    # not clobber the .vo file when we're unsure if it's new enough.
+    # These runs are independent, so we do them in parallel.
+    make_glob_files_in_parallel([(v_name, glob_name) for vo_name, v_name, glob_name in filenames_vo_v_glob
+                                 if os.path.exists(vo_name) and os.path.getmtime(vo_name) >= os.path.getmtime(v_name)],
+                                **kwargs)
     filenames_vo_v_glob = [(vo_name, v_name, glob_name) for vo_name, v_name, glob_name in filenames_vo_v_glob
                            if not (os.path.exists(vo_name) and os.path.getmtime(vo_name) >= os.path.getmtime(v_name))]
     filenames_v    = [v_name    for vo_name, v_name, glob_name in filenames_vo_v_glob]
     filenames_glob = [glob_name for vo_name, v_name, glob_name in filenames_vo_v_glob]
     if len(filenames_vo_v_glob) == 0: return
     extra_filenames_v = (get_all_v_files('.', filenames_v) if kwargs['walk_tree'] else [])
+    v_digests = [get_v_file_digest(v_name) for v_name in filenames_v]
     (stdout_make, stderr_make) = run_coq_makefile_and_make(tuple(sorted(list(filenames_v) + list(extra_filenames_v))), filenames_glob, **kwargs)
+    for glob_name, v_digest in zip(filenames_glob, v_digests):
+        if os.path.isfile(glob_name):
+            record_glob_source(glob_name, v_digest, **kwargs)
 
-def get_glob_file_for(filename, update_globs=False, **kwargs):
+def get_valid_glob_name_for(filename, update_globs=False, **kwargs):
     kwargs = fill_kwargs(kwargs)
     filename = fix_path(filename)
     if filename[-2:] != '.v': filename += '.v'
@@ -387,30 +634,33 @@ def get_glob_file_for(filename, update_globs=False, **kwargs):
         file_contents[filename] = get_raw_file_as_bytes(filename, **kwargs)
         file_mtimes[filename] = os.stat(filename).st_mtime
     if update_globs:
-        if file_mtimes[filename] > time.time():
-            kwargs['log']("WARNING: The file %s comes from the future! (%d > %d)" % (filename, file_mtimes[filename], time.time()))
-        if time.time() - file_mtimes[filename] < 2:
-            if kwargs['verbose']:
-                kwargs['log']("NOTE: The file %s is very new (%d, %d seconds old), delaying until it's a bit older" % (filename, file_mtimes[filename], time.time() - file_mtimes[filename]))
-        # delay until the .v file is old enough that a .glob file will be considered newer
-        # if we just wait until they're not equal, we apparently get issues like https://gitlab.com/Zimmi48/coq/-/jobs/535005442
-        while time.time() - file_mtimes[filename] < 2:
-            time.sleep(0.1)
+        # we track which contents each .glob file was made from, so,
+        # unlike when we compared modification times, we need not wait
+        # for the .v file to be older than any new .glob file
         make_globs([libname], **kwargs)
     if os.path.isfile(globname):
-        if os.stat(globname).st_mtime > file_mtimes[filename]:
-            return get_raw_file(globname, **kwargs)
+        if is_glob_fresh(filename, globname, **kwargs):
+            return globname
         elif kwargs['verbose']:
-            kwargs['log']("WARNING: Assuming that %s is not a valid reflection of %s because %s is newer (%d >= %d)" % (globname, filename, filename, file_mtimes[filename], os.stat(globname).st_mtime))
+            kwargs['log']("WARNING: Assuming that %s is not a valid reflection of %s because %s has changed since %s was made" % (globname, filename, filename, globname))
     return None
 
+def get_glob_file_for(filename, update_globs=False, **kwargs):
+    kwargs = fill_kwargs(kwargs)
+    globname = get_valid_glob_name_for(filename, update_globs=update_globs, **kwargs)
+    if globname is None: return None
+    return get_raw_file(globname, **kwargs)
+
+def get_glob_index_for(filename, update_globs=False, **kwargs):
+    kwargs = fill_kwargs(kwargs)
+    globname = get_valid_glob_name_for(filename, update_globs=update_globs, **kwargs)
+    if globname is None: return None
+    return get_glob_index(globname, **kwargs)
 
 def get_byte_references_for(filename, types, **kwargs):
-    globs = get_glob_file_for(filename, **kwargs)
-    if globs is None: return None
-    references = get_references_from_globs(globs)
-    return tuple((start, end, loc, append, ty) for start, end, loc, append, ty in references
-                 if types is None or ty in types)
+    index = get_glob_index_for(filename, **kwargs)
+    if index is None: return None
+    return index.references(types)
 
 def get_file_as_bytes(filename, absolutize=('lib',), update_globs=False, **kwargs):
     kwargs = fill_kwargs(kwargs)
@@ -422,11 +672,30 @@ def get_file_as_bytes(filename, absolutize=('lib',), update_globs=False, **kwarg
         file_contents[filename] = get_raw_file_as_bytes(filename, **kwargs)
         file_mtimes[filename] = os.stat(filename).st_mtime
         if len(absolutize) > 0:
-            globs = get_glob_file_for(filename, update_globs=update_globs, **kwargs)
-            if globs is not None:
-                file_contents[filename] = update_with_glob(file_contents[filename], globs, absolutize, libname, **kwargs)
+            globname = get_valid_glob_name_for(filename, update_globs=update_globs, **kwargs)
+            if globname is not None:
+                file_contents[filename] = get_absolutized_contents(filename, globname, absolutize, libname, **kwargs)
     return file_contents[filename]
 
+def get_absolutized_contents(filename, globname, absolutize, libname, **kwargs):
+    '''Returns the contents of filename, absolutized according to
+    globname, reusing the result stored in the project index (if any)
+    when neither the .v file nor the .glob file has changed'''
+    kwargs = fill_kwargs(kwargs)
+    contents = file_contents[filename]
+    project_index = get_project_index(**kwargs)
+    if project_index is None:
+        return update_with_glob(contents, get_glob_index(globname, **kwargs), absolutize, libname, **kwargs)
+    v_digest = bytes_digest(contents)
+    project_index.record_file(filename, v_digest, libname)
+    digest = v_digest + ':' + get_file_digest(globname)
+    key = json.dumps([sorted(absolutize), libname])
+    rtn = project_index.get_bytes(filename, 'absolutized', key, digest)
+    if rtn is None:
+        rtn = update_with_glob(contents, get_glob_index(globname, **kwargs), absolutize, libname, **kwargs)
+        project_index.put_bytes(filename, 'absolutized', key, digest, rtn)
+    return rtn
+
 # returns string, newlines normalized
 def get_file(*args, **kwargs):
     return util.normalize_newlines(get_file_as_bytes(*args, **kwargs).decode('utf-8'))
@@ -439,14 +708,12 @@ def get_require_dict(lib, **kwargs):
     if lib not in lib_imports_slow.keys():
         make_globs([lib], **kwargs)
         if os.path.isfile(glob_name): # making succeeded
-            contents = get_raw_file(glob_name, **kwargs)
-            lines = contents.split('\n')
             lib_imports_slow[lib] = {}
-            for start, end, name in IMPORT_REG.findall(contents):
+            for start, end, name in get_glob_index(glob_name, **kwargs).lib_references():
                 name = norm_libname(name, **kwargs)
                 if name not in lib_imports_slow[lib].keys():
                     lib_imports_slow[lib][name] = []
-                lib_imports_slow[lib][name].append((int(start), int(end)))
+                lib_imports_slow[lib][name].append((start, end))
             for name in lib_imports_slow[lib].keys():
                 lib_imports_slow[lib][name] = tuple(lib_imports_slow[lib][name])
     if lib in lib_imports_slow.keys():
@@ -461,19 +728,7 @@ def get_require_locations(lib, **kwargs):
                       for loc in locs))
 
 def transitively_close(d, make_new_value=(lambda x: tuple()), reflexive=True):
-    updated = True
-    while updated:
-        updated = False
-        for key in tuple(d.keys()):
-            newv = set(d[key])
-            if reflexive: newv.add(key)
-            for v in tuple(newv):
-                if v not in d.keys(): d[v] = make_new_value(v)
-                newv.update(set(d[v]))
-            if newv != set(d[key]):
-                d[key] = newv
-                updated = True
-    return d
+    return require_graph.transitively_close(d, make_new_value=make_new_value, reflexive=reflexive)
 
 def get_recursive_requires(*libnames, **kwargs):
     requires = dict((lib, get_require_names(lib, **kwargs)) for lib in libnames)
@@ -488,20 +743,18 @@ def sort_files_by_dependency(filenames, reverse=True, **kwargs):
     filenames = map(fix_path, filenames)
     filenames = [(filename + '.v' if filename[-2:] != '.v' else filename) for filename in filenames]
     libnames = [lib_of_filename(filename, **kwargs) for filename in filenames]
-    requires = get_recursive_requires(*libnames, **kwargs)
-
-    def fcmp(f1, f2):
-        if f1 == f2: return cmp(f1, f2)
-        l1, l2 = lib_of_filename(f1, **kwargs), lib_of_filename(f2, **kwargs)
-        if l1 == l2: return cmp(f1, f2)
-        # this only works correctly if the closure is *reflexive* as
-        # well as transitive, because we require that if A requires B,
-        # then A must have strictly more requires than B (i.e., it
-        # must include itself)
-        if len(requires[l1]) != len(requires[l2]): return cmp(len(requires[l1]), len(requires[l2]))
-        return cmp(l1, l2)
-
-    filenames = sorted(filenames, key=cmp_to_key(fcmp), reverse=reverse)
+    requires = dict((lib, get_require_names(lib, **kwargs)) for lib in libnames)
+    require_graph.discover_graph(requires, (lambda lib: get_require_names(lib, **kwargs)))
+    closure_sizes = require_graph.transitive_closure_sizes(requires, reflexive=True)
+    # Among the libraries whose requires have all been placed, we
+    # place the one with the smallest (reflexive) closure first, and
+    # then go by name; when there are no cycles, this is the same as
+    # sorting by closure size and then by name, since if A requires B,
+    # then A has strictly more requires than B
+    lib_order = require_graph.topological_sort(requires, key=(lambda lib: (closure_sizes[lib], lib)))
+    lib_positions = dict((lib, i) for i, lib in enumerate(lib_order))
+
+    filenames = sorted(filenames, key=(lambda f: (lib_positions[lib_of_filename(f, **kwargs)], f)), reverse=reverse)
     return filenames
 
 def get_imports(lib, fast=False, **kwargs):
@@ -531,12 +784,13 @@ def norm_libname(lib, **kwargs):
 
 def merge_imports(imports, **kwargs):
     kwargs = fill_kwargs(kwargs)
-    rtn = []
+    rtn = OrderedDict()
+    normed = {}
     for import_list in imports:
         for i in import_list:
-            if norm_libname(i, **kwargs) not in rtn:
-                rtn.append(norm_libname(i, **kwargs))
-    return rtn
+            if i not in normed: normed[i] = norm_libname(i, **kwargs)
+            rtn[normed[i]] = None
+    return list(rtn.keys())
 
 # This is a bottleneck for more than around 10,000 lines of code total with many imports (around 100)
 @memoize
@@ -5,6 +5,7 @@ from import_util import IMPORT_ABSOLUTIZE_TUPLE, ALL_ABSOLUTIZE_TUPLE
 from custom_arguments import add_libname_arguments, update_env_with_libnames, update_env_with_coqpath_folders, add_logging_arguments, process_logging_arguments
 from coq_version import get_coqc_coqlib
 from replace_imports import include_imports
+from probe_cache import set_probe_cache_file
 
 # {Windows,Python,coqtop} is terrible; we fail to write to (or read
 # from?) coqtop.  But we can wrap it in a batch scrip, and it works
@@ -50,6 +51,21 @@ parser.add_argument('--coqtop-args', metavar='ARG', dest='coqtop_args', type=str
                     help='Arguments to pass to coqtop; e.g., " -indices-matter" (leading and trailing spaces are stripped)')
 parser.add_argument('--coq_makefile', metavar='COQ_MAKEFILE', dest='coq_makefile', type=str, default='coq_makefile',
                     help='The path to the coq_makefile program.')
+parser.add_argument('--glob-jobs', metavar='N', dest='glob_jobs', type=int, default=None,
+                    help=("The maximum number of coqc jobs to run at once when generating .glob files " +
+                          "(Default: the number of CPUs)."))
+parser.add_argument('--persist-glob-index', dest='persist_glob_index', action='store_const', const=True, default=False,
+                    help=("Store the parsed references of each .glob file next to it (in a .glob.idx file), " +
+                          "so that later runs need not re-parse unchanged .glob files."))
+parser.add_argument('--project-index', metavar='FILE', dest='project_index', type=str, default=None,
+                    help=("An sqlite database in which to store parsed .glob files and absolutized " +
+                          "file contents, keyed on the digests of the files they come from, so that " +
+                          "they can be reused across runs (and across scripts)."))
+parser.add_argument('--probe-cache', metavar='FILE', dest='probe_cache', type=str, default=None,
+                    help=("A file in which to cache what we learn by probing the Coq binaries " +
+                          "(versions, supported options, etc.) across runs; the results are keyed on " +
+                          "the path, size, modification time, and inode of each binary " +
+                          "(Default: the value of the environment variable COQ_TOOLS_PROBE_CACHE, if set)."))
 parser.add_argument('--inline-user-contrib', dest='inline_user_contrib',
                     action='store_const', const=True, default=False,
                     help=("Attempt to inline requires from the user-contrib folder"))
@@ -58,6 +74,7 @@ add_logging_arguments(parser)
 
 if __name__ == '__main__':
     args = process_logging_arguments(parser.parse_args())
+    set_probe_cache_file(args.probe_cache)
 
     env = {
         'verbose': args.verbose,
@@ -67,7 +84,10 @@ if __name__ == '__main__':
         'as_modules': args.wrap_modules,
         'fast': args.fast_merge_imports,
         'coq_makefile': args.coq_makefile,
-        'walk_tree': args.walk_tree
+        'walk_tree': args.walk_tree,
+        'glob_jobs': args.glob_jobs,
+        'persist_glob_index': args.persist_glob_index,
+        'project_index': args.project_index,
         }
     update_env_with_libnames(env, args)
     if args.inline_user_contrib: update_env_with_coqpath_folders(env, os.path.join(get_coqc_coqlib(env['coqc'], **env), 'user-contrib'))
@@ -0,0 +1,152 @@
+from __future__ import with_statement
+import os, time, threading
+import diagnose_error
+from custom_arguments import DEFAULT_LOG
+
+__all__ = ["MetricsExporter", "LATENCY_BUCKETS"]
+
+# Every interval seconds, writes the metrics of a minimization to a
+# file in the text format of Prometheus, for the textfile collector of
+# the node exporter to pick up.  The file is replaced atomically, as
+# the collector requires.  Since the collector merges all of the files
+# in its directory, every series carries an output_file label with the
+# absolute path of OUT_FILE, which tells apart the runs on one machine.
+#
+# The counters of oracle runs, timeouts, runs killed by SIGKILL (the
+# OOM killer), and retries of starting coq come from
+# diagnose_error.get_oracle_stats; the histogram of how long the runs
+# of coq took, the outcomes of the candidates checked, the bytes
+# removed, and the current pass are recorded by the exporter itself.
+# A job which is stuck shows up as a last_oracle_call_time which stops
+# moving, and one which is thrashing as a growing number of timeouts,
+# OOM kills, or spawn retries.
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+OUTCOMES = ('accepted', 'rejected', 'unchanged')
+PREFIX = 'coq_tools_'
+
+def escape_label_value(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(labels):
+    if not labels: return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, escape_label_value(value)) for key, value in labels)
+
+def format_value(value):
+    if isinstance(value, float): return repr(value)
+    return '%d' % value
+
+class MetricsExporter(object):
+    def __init__(self, path, output_file, interval=15.0, log=DEFAULT_LOG):
+        self.path = path
+        self.labels = (('output_file', os.path.abspath(output_file)),)
+        self.interval = interval
+        self.log = log
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.start_time = time.time()
+        self.running = True
+        self.description = None
+        self.size = None
+        self.bytes_removed = 0
+        self.outcomes = dict((outcome, 0) for outcome in OUTCOMES)
+        self.last_oracle_call_time = None
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.warned = False
+
+    def start(self):
+        if self.thread is not None: return
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.write()
+
+    def begin_pass(self, description, task_index=None):
+        with self.lock:
+            self.description = description
+
+    def end_pass(self):
+        with self.lock:
+            self.description = None
+
+    def set_size(self, size):
+        with self.lock:
+            if self.size is not None and size < self.size: self.bytes_removed += self.size - size
+            self.size = size
+
+    def record_candidate(self, outcome):
+        with self.lock:
+            self.outcomes[outcome] += 1
+            self.last_oracle_call_time = time.time()
+
+    def record_run(self, seconds):
+        with self.lock:
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound: self.latency_buckets[i] += 1
+            self.latency_sum += seconds
+            self.latency_count += 1
+            self.last_oracle_call_time = time.time()
+
+    def metrics(self):
+        """Returns a list of (name, type, help, samples), where each
+        sample is (suffix, extra labels, value)"""
+        stats = diagnose_error.get_oracle_stats()
+        with self.lock:
+            latency = ([('_bucket', (('le', repr(bound)),), count) for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets)] +
+                       [('_bucket', (('le', '+Inf'),), self.latency_count), ('_sum', (), self.latency_sum), ('_count', (), self.latency_count)])
+            return [('running', 'gauge', 'Whether the minimization is still running.', [('', (), int(self.running))]),
+                    ('start_time_seconds', 'gauge', 'When the minimization started, in seconds since the epoch.', [('', (), self.start_time)]),
+                    ('last_oracle_call_time_seconds', 'gauge', 'When coq was last run or a candidate last checked, in seconds since the epoch.',
+                     ([('', (), self.last_oracle_call_time)] if self.last_oracle_call_time is not None else [])),
+                    ('current_pass_info', 'gauge', 'The pass of minimization currently running.',
+                     ([('', (('pass', self.description),), 1)] if self.description is not None else [])),
+                    ('candidates_total', 'counter', 'Candidate changes checked, by outcome.',
+                     [('', (('outcome', outcome),), self.outcomes[outcome]) for outcome in OUTCOMES]),
+                    ('oracle_calls_total', 'counter', 'Calls for the output of coq, including the ones answered from the cache.', [('', (), stats['calls'])]),
+                    ('oracle_runs_total', 'counter', 'Runs of coq.', [('', (), stats['runs'])]),
+                    ('oracle_cache_hit_ratio', 'gauge', 'The fraction of the calls for the output of coq answered from the cache.',
+                     [('', (), (float(stats['calls'] - stats['runs']) / stats['calls'] if stats['calls'] else 0.0))]),
+                    ('oracle_timeouts_total', 'counter', 'Runs of coq which timed out.', [('', (), stats['timeouts'])]),
+                    ('oracle_oom_kills_total', 'counter', 'Runs of coq killed by SIGKILL, usually by the OOM killer.', [('', (), stats['killed'])]),
+                    ('oracle_spawn_retries_total', 'counter', 'Times that starting coq failed and was retried.', [('', (), stats['spawn_retries'])]),
+                    ('oracle_latency_seconds', 'histogram', 'How long the runs of coq took.', latency),
+                    ('file_bytes', 'gauge', 'The size of the output file.', ([('', (), self.size)] if self.size is not None else [])),
+                    ('bytes_removed_total', 'counter', 'Bytes removed from the output file by accepted changes.', [('', (), self.bytes_removed)])]
+
+    def text(self):
+        lines = []
+        for name, metric_type, help_text, samples in self.metrics():
+            lines.append('# HELP %s%s %s' % (PREFIX, name, help_text))
+            lines.append('# TYPE %s%s %s' % (PREFIX, name, metric_type))
+            for suffix, extra_labels, value in samples:
+                lines.append('%s%s%s%s %s' % (PREFIX, name, suffix, format_labels(self.labels + tuple(extra_labels)), format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        text = self.text()
+        tmp_name = '%s.%d.tmp' % (self.path, os.getpid())
+        try:
+            with open(tmp_name, 'w') as f:
+                f.write(text)
+            if os.name == 'nt' and os.path.exists(self.path): os.remove(self.path)
+            os.rename(tmp_name, self.path)
+        except (IOError, OSError) as e:
+            if os.path.exists(tmp_name): os.remove(tmp_name)
+            if not self.warned:
+                self.log('\nWarning: Could not write the metrics to %s (%s)' % (self.path, repr(e)))
+                self.warned = True
@@ -9,6 +9,7 @@ from memoize import memoize
 from minimizer_drivers import run_binary_search
 import diagnose_error
 import util
+from probe_cache import set_probe_cache_file
 
 # {Windows,Python,coqtop} is terrible; we fail to write to (or read
 # from?) coqtop.  But we can wrap it in a batch scrip, and it works
@@ -44,6 +45,21 @@ parser.add_argument('--coqbin', metavar='COQBIN', dest='coqbin', type=str, defau
                     help='The path to a folder containing the coqc and coqtop programs.')
 parser.add_argument('--coqc', metavar='COQC', dest='coqc', type=str, default='coqc',
                     help='The path to the coqc program.')
+parser.add_argument('--glob-jobs', metavar='N', dest='glob_jobs', type=int, default=None,
+                    help=("The maximum number of coqc jobs to run at once when generating .glob files " +
+                          "(Default: the number of CPUs)."))
+parser.add_argument('--persist-glob-index', dest='persist_glob_index', action='store_const', const=True, default=False,
+                    help=("Store the parsed references of each .glob file next to it (in a .glob.idx file), " +
+                          "so that later runs need not re-parse unchanged .glob files."))
+parser.add_argument('--project-index', metavar='FILE', dest='project_index', type=str, default=None,
+                    help=("An sqlite database in which to store parsed .glob files and absolutized " +
+                          "file contents, keyed on the digests of the files they come from, so that " +
+                          "they can be reused across runs (and across scripts)."))
+parser.add_argument('--probe-cache', metavar='FILE', dest='probe_cache', type=str, default=None,
+                    help=("A file in which to cache what we learn by probing the Coq binaries " +
+                          "(versions, supported options, etc.) across runs; the results are keyed on " +
+                          "the path, size, modification time, and inode of each binary " +
+                          "(Default: the value of the environment variable COQ_TOOLS_PROBE_CACHE, if set)."))
 add_libname_arguments(parser)
 add_logging_arguments(parser)
 
@@ -190,6 +206,7 @@ def make_save_state(filename, **kwargs):
 
 if __name__ == '__main__':
     args = process_logging_arguments(parser.parse_args())
+    set_probe_cache_file(args.probe_cache)
     env = {
         'verbose': args.verbose,
         'log': args.log,
@@ -198,6 +215,9 @@ if __name__ == '__main__':
         'coqc': (args.coqc if args.coqbin == '' else os.path.join(args.coqbin, args.coqc)),
         'coqc_args': (args.coq_args if args.coq_args else tuple()),
         'timeout': args.timeout,
+        'glob_jobs': args.glob_jobs,
+        'persist_glob_index': args.persist_glob_index,
+        'project_index': args.project_index,
         'inplace': args.suffix != '', # it's None if they passed no argument, and '' if they didn't pass -i
         'suffix': args.suffix,
         'input_files': tuple(f.name for f in args.input_files),
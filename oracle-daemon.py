@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+from __future__ import print_function
+import os, sys, json
+from argparse_compat import argparse
+from custom_arguments import add_logging_arguments, process_logging_arguments
+from parallel_util import default_job_count
+from probe_cache import get_probe_cache_file
+from oracle_daemon import OracleDaemon, OracleDaemonError, DEFAULT_CACHE_SIZE, DEFAULT_PROGRAMS, request_daemon
+
+parser = argparse.ArgumentParser(description=('Run the coqc calls of many find-bug.py jobs on one pool of workers, ' +
+                                              'sharing the results of identical calls among the jobs.  Start the daemon ' +
+                                              'with SOCKET, and then either pass --oracle-daemon SOCKET to find-bug.py, ' +
+                                              'or submit find-bug.py jobs with --submit.'))
+parser.add_argument('socket', metavar='SOCKET', type=str,
+                    help='The Unix socket to listen on (or to talk to, with --submit, --status, or --shutdown).')
+parser.add_argument('--jobs', '-j', metavar='N', dest='jobs', type=int, default=None,
+                    help='The number of coqc calls to run at once (Default: the number of CPUs, %d).' % default_job_count())
+parser.add_argument('--cache-size', metavar='N', dest='cache_size', type=int, default=DEFAULT_CACHE_SIZE,
+                    help='The number of results of coqc calls to keep for sharing among jobs (Default: %d).' % DEFAULT_CACHE_SIZE)
+parser.add_argument('--probe-cache', metavar='FILE', dest='probe_cache', type=str, default=None,
+                    help=("The file in which jobs cache what they learn by probing the Coq binaries " +
+                          "(Default: the value of the environment variable COQ_TOOLS_PROBE_CACHE, if set, and " +
+                          "otherwise SOCKET.probe-cache)."))
+parser.add_argument('--allow-program', metavar='PROG', dest='programs', action='append', default=[],
+                    help=("A program which the jobs may have the daemon run, looked up in the PATH of the daemon when it " +
+                          "starts; pass this once for each of the coqc and coqtop programs the jobs use " +
+                          "(Default: %s)." % ' and '.join(DEFAULT_PROGRAMS)))
+parser.add_argument('--submit', dest='submit', action='store_const', const=True, default=False,
+                    help=("Instead of starting a daemon, have the daemon listening on SOCKET run find-bug.py " +
+                          "with the arguments given after a -- (from the current directory), and wait for it to finish."))
+parser.add_argument('--job-log', metavar='FILE', dest='job_log', type=str, default=None,
+                    help='With --submit, the file to write the output of the job to (Default: discard it).')
+parser.add_argument('--status', dest='status', action='store_const', const=True, default=False,
+                    help='Print statistics about the daemon listening on SOCKET.')
+parser.add_argument('--shutdown', dest='shutdown', action='store_const', const=True, default=False,
+                    help='Stop the daemon listening on SOCKET.')
+add_logging_arguments(parser)
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    job_args = argv[argv.index('--') + 1:] if '--' in argv else []
+    if '--' in argv: argv = argv[:argv.index('--')]
+    args = process_logging_arguments(parser.parse_args(argv))
+    if job_args and not args.submit:
+        parser.error('arguments after -- are only allowed with --submit')
+    socket_path = os.path.abspath(args.socket)
+    try:
+        if args.submit:
+            response = request_daemon(socket_path, {'op': 'submit', 'args': job_args, 'cwd': os.getcwd(),
+                                                    'env': dict(os.environ),
+                                                    'log': (os.path.abspath(args.job_log) if args.job_log else None)})
+            sys.exit(response['returncode'])
+        elif args.status:
+            response = request_daemon(socket_path, {'op': 'status'})
+            del response['ok']
+            print(json.dumps(response, sort_keys=True, indent=2))
+        elif args.shutdown:
+            request_daemon(socket_path, {'op': 'shutdown'})
+        else:
+            probe_cache = args.probe_cache or get_probe_cache_file() or socket_path + '.probe-cache'
+            daemon = OracleDaemon(socket_path, jobs=args.jobs, cache_size=args.cache_size,
+                                  probe_cache=os.path.abspath(probe_cache), programs=(args.programs or DEFAULT_PROGRAMS),
+                                  log=args.log, verbose=args.verbose)
+            try:
+                daemon.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    except (IOError, OSError, OracleDaemonError) as e:
+        args.log('Error: %s' % e, force_stdout=True)
+        sys.exit(1)
@@ -0,0 +1,160 @@
+from __future__ import with_statement
+import os, json, time, hashlib, threading
+from custom_arguments import DEFAULT_LOG, DEFAULT_VERBOSITY
+
+__all__ = ["OracleCassette", "OracleCassetteError", "REPLAY_MISS_POLICIES"]
+
+# An oracle cassette records the interactions of a minimization run
+# with Coq, so that the run can be replayed later without Coq, and
+# deterministically.  It is a file of JSON lines, one per interaction,
+# of three kinds:
+#
+#  - 'coq' records, one per run of coqc or coqtop by
+#    diagnose_error.get_coq_output, keyed on the command (with the
+#    name of the temporary file, and the scratch directory of the
+#    prefix checkpoint, if any, abstracted away) and the digest of the
+#    contents, with the output, return code, and duration of the run;
+#
+#  - 'session' records, one per coqtop -emacs session of
+#    split_definitions.split_statements_to_definitions, keyed the
+#    same way, with the output and duration;
+#
+#  - 'probe' records, one per probe of a Coq binary (see
+#    probe_cache.py), keyed on the name of the probe, the binary, and
+#    the arguments, with the result of the probe;
+#
+#  - 'glob' records, one per .glob file made by import_util.make_globs,
+#    keyed on the name and the digest of the contents of the .v file,
+#    with the contents of the .glob file, which is written out again
+#    when replaying.
+#
+# When replaying, each interaction is answered by the last record with
+# the same key, after (optionally) waiting for its duration, scaled.
+# Interactions which were not recorded (as when replaying with a
+# different ordering of passes) are handled according to the miss
+# policy: 'run' runs Coq, 'reject' answers with an empty output and
+# return code 1 (so that the candidate change is rejected), and
+# 'error' stops the run.  Probes and .glob files which were not
+# recorded are always run and made.
+
+CASSETTE_VERSION = 1
+FILE_PLACEHOLDER = '@FILE@'
+FILE_ROOT_PLACEHOLDER = '@FILE_ROOT@'
+# the logical name under which prefix_checkpoint.py binds the
+# directory of the checkpoint, which is a fresh temporary directory
+# in each run
+CHECKPOINT_LIBNAME = 'CoqToolsCheckpoint'
+CHECKPOINT_DIR_PLACEHOLDER = '@CHECKPOINT_DIR@'
+REPLAY_MISS_POLICIES = ('error', 'reject', 'run')
+
+class OracleCassetteError(Exception):
+    pass
+
+def digest(contents):
+    if not isinstance(contents, bytes): contents = contents.encode('utf-8')
+    return hashlib.sha256(contents).hexdigest()
+
+def interaction_key(kind, cmds, contents, file_name=None):
+    if file_name is not None:
+        file_name_root = os.path.splitext(file_name)[0]
+        cmds = [(FILE_PLACEHOLDER if arg == file_name else FILE_ROOT_PLACEHOLDER if arg == file_name_root else arg) for arg in cmds]
+    cmds = [(CHECKPOINT_DIR_PLACEHOLDER if 0 < i < len(cmds) - 1 and cmds[i - 1] in ('-Q', '-R') and cmds[i + 1] == CHECKPOINT_LIBNAME else arg)
+            for i, arg in enumerate(cmds)]
+    return json.dumps([kind, list(cmds), digest(contents)])
+
+class OracleCassette(object):
+    def __init__(self, path, replay=False, time_scale=1.0, wait=False, miss_policy='error', log=DEFAULT_LOG, verbose=DEFAULT_VERBOSITY):
+        if miss_policy not in REPLAY_MISS_POLICIES:
+            raise ValueError('Unknown miss policy %s (expected one of %s)' % (miss_policy, ', '.join(REPLAY_MISS_POLICIES)))
+        self.path = path
+        self.replaying = replay
+        self.time_scale = time_scale
+        self.wait = wait
+        self.miss_policy = miss_policy
+        self.log = log
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.records = {}
+        self.stats = {'hits': 0, 'misses': 0, 'recorded': 0, 'simulated_time': 0.0}
+        if replay:
+            self.load()
+        else:
+            with open(self.path, 'w') as f:
+                f.write(json.dumps({'kind': 'header', 'version': CASSETTE_VERSION}) + '\n')
+
+    def load(self):
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue # the last line of the cassette of a killed run
+                if record.get('kind') == 'header':
+                    if record.get('version') != CASSETTE_VERSION:
+                        raise OracleCassetteError('%s is a cassette of version %s, not %d' % (self.path, record.get('version'), CASSETTE_VERSION))
+                elif 'key' in record:
+                    self.records[record['key']] = record
+
+    def write(self, record):
+        line = json.dumps(record, sort_keys=True) + '\n'
+        with self.lock:
+            self.stats['recorded'] += 1
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+    def replay(self, kind, cmds, contents, file_name=None):
+        """Returns (output, returncode, duration) of the recorded
+        interaction, or None if the interaction should be run"""
+        if not self.replaying: return None
+        record = self.records.get(interaction_key(kind, cmds, contents, file_name=file_name))
+        if record is None:
+            with self.lock:
+                self.stats['misses'] += 1
+            if self.verbose >= 2: self.log('The cassette %s has no record of "%s"' % (self.path, '" "'.join(cmds)))
+            if self.miss_policy == 'run': return None
+            if self.miss_policy == 'reject': return ('', 1, 0.0)
+            raise OracleCassetteError('The cassette %s has no record of "%s" on these contents; use --replay-miss to run Coq or reject the change instead'
+                                      % (self.path, '" "'.join(cmds)))
+        duration = record['duration'] * self.time_scale
+        with self.lock:
+            self.stats['hits'] += 1
+            self.stats['simulated_time'] += duration
+        if self.wait and duration > 0: time.sleep(duration)
+        return (record['output'], record['returncode'], duration)
+
+    def record(self, kind, cmds, contents, output, returncode, duration, file_name=None):
+        if self.replaying: return
+        self.write({'kind': kind, 'key': interaction_key(kind, cmds, contents, file_name=file_name),
+                    'output': output, 'returncode': returncode, 'duration': duration})
+
+    def lookup(self, key):
+        if not self.replaying or key not in self.records: return None
+        with self.lock:
+            self.stats['hits'] += 1
+        return self.records[key]
+
+    def probe(self, name, prog, args, compute):
+        """Returns the recorded result of the probe, or records the
+        result of compute()"""
+        key = json.dumps(['probe', name, prog, list(args)])
+        record = self.lookup(key)
+        if record is not None: return record['value']
+        value = compute()
+        if not self.replaying: self.write({'kind': 'probe', 'key': key, 'value': value})
+        return value
+
+    def replay_file(self, kind, name, contents):
+        """Returns the recorded contents of the file made from the file
+        name with the given contents, or None"""
+        record = self.lookup(json.dumps([kind, name, digest(contents)]))
+        return record['value'] if record is not None else None
+
+    def record_file(self, kind, name, contents, value):
+        if self.replaying: return
+        self.write({'kind': kind, 'key': json.dumps([kind, name, digest(contents)]), 'value': value})
+
+    def summary(self):
+        if self.replaying:
+            return ('Replayed %d interactions from %s (%d not recorded); simulated Coq time: %.1f s'
+                    % (self.stats['hits'], self.path, self.stats['misses'], self.stats['simulated_time']))
+        return 'Recorded %d interactions to %s' % (self.stats['recorded'], self.path)
@@ -0,0 +1,416 @@
+from __future__ import with_statement
+import os, sys, socket, struct, json, hashlib, threading, tempfile, subprocess, time, collections
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+import diagnose_error
+from parallel_util import default_job_count
+from custom_arguments import DEFAULT_LOG, DEFAULT_VERBOSITY
+from file_util import clean_v_file
+
+__all__ = ["OracleDaemon", "OracleDaemonClient", "OracleDaemonError", "request_daemon", "DEFAULT_CACHE_SIZE", "DEFAULT_PROGRAMS", "FILE_PLACEHOLDER"]
+
+# The oracle daemon runs the coqc/coqtop calls of many minimization
+# jobs on one machine, on a single pool of workers, so that the jobs
+# do not oversubscribe the CPUs and memory between them.  Jobs talk to
+# it over a Unix socket, one JSON line per request and per response,
+# and one connection per request.
+#
+# Pending calls are queued per job, and idle workers take calls from
+# the jobs in round-robin order, so that a job which issues many calls
+# at once does not starve the others.  Calls run in the environment of
+# the job which issued them, and calls which are identical share a
+# single run, whether they are issued at the same time or later on;
+# the results are kept in a bounded cache, keyed by a digest.  Calls
+# are identical when they run the same program on the same contents
+# with the same arguments and timeout, the same values of the
+# environment variables which affect Coq (KEYED_ENV_VARS; the rest of
+# the environment, such as OLDPWD or SHLVL, differs between jobs
+# without changing what Coq does), and the same compiled libraries in
+# the directories of the -R, -Q, and -I options.  The directories are
+# taken relative to the call's working directory, which is otherwise
+# only part of the key when some other argument names a file in it,
+# so that jobs in different directories share the calls which load
+# the same libraries.  Since the key includes the modification times
+# and sizes of the .vo files the command can load, rebuilding a
+# library invalidates the results which depended on it; the .vo files
+# of a directory are looked at most once every LIBRARY_STAMP_TTL
+# seconds, so a library rebuilt within that time of a call may be
+# missed.  The daemon also hands out a single probe cache file (see
+# probe_cache.py) to the jobs which do not have one of their own.
+#
+# The daemon can also run find-bug.py jobs itself (see
+# oracle-daemon.py --submit), in which case their output goes to a
+# log file.
+#
+# Since the daemon runs commands on behalf of whoever talks to it, the
+# socket is only accessible to the user running the daemon, connections
+# from other users are refused where the platform says who the peer
+# is, and calls may only run the programs the daemon was configured
+# with (coqc and coqtop, by default), as found when it started.
+
+# stands for the name of the file being compiled in the commands sent
+# to the daemon, which compiles a copy of the contents of its own
+FILE_PLACEHOLDER = '@FILE@'
+FILE_ROOT_PLACEHOLDER = '@FILE_ROOT@'
+# the options of coqc/coqtop whose first argument is a directory of
+# libraries which the command can load
+LOAD_PATH_OPTIONS = ('-R', '-Q', '-I', '-include')
+# the environment variables which the results of a call depend on
+KEYED_ENV_VARS = ('PATH', 'COQLIB', 'COQPATH', 'COQBIN', 'OCAMLPATH', 'OCAMLFIND_CONF')
+# how long, in seconds, the stamp of the .vo files of a directory is
+# trusted before the directory is walked again
+LIBRARY_STAMP_TTL = 1.0
+DEFAULT_CACHE_SIZE = 4096
+DEFAULT_PROGRAMS = ('coqc', 'coqtop')
+SCRIPT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+
+class OracleDaemonError(Exception):
+    pass
+
+def send_message(sock_file, message):
+    sock_file.write((json.dumps(message, sort_keys=True) + '\n').encode('utf-8'))
+    sock_file.flush()
+
+def load_path_directories(cmds, cwd):
+    """Returns the absolute paths of the directories which cmds add to
+    the load path"""
+    return [os.path.abspath(os.path.join(cwd or os.getcwd(), cmds[i + 1]))
+            for i, arg in enumerate(cmds[:-1]) if arg in LOAD_PATH_OPTIONS]
+
+def library_stamp(directory):
+    """Returns a digest of the paths, modification times, and sizes of
+    the .vo files in directory"""
+    stamp = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if not name.endswith('.vo'): continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stamp.append((path, st.st_mtime, st.st_size))
+    return hashlib.sha256(json.dumps(stamp).encode('utf-8')).hexdigest()
+
+def resolve_program(prog, cwd=None, path=None):
+    """Returns the real path of the executable which running prog from
+    cwd with the given PATH would execute, or None"""
+    if os.path.dirname(prog):
+        candidates = [os.path.join(cwd or os.getcwd(), prog)]
+    else:
+        candidates = [os.path.join(dirname, prog) for dirname in (path if path is not None else os.defpath).split(os.pathsep)]
+    for candidate in candidates:
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return os.path.realpath(candidate)
+    return None
+
+def peer_uid(sock):
+    """Returns the user id of the process at the other end of the Unix
+    socket sock, or None if the platform does not tell"""
+    if not hasattr(socket, 'SO_PEERCRED'): return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    pid, uid, gid = struct.unpack('3i', creds)
+    return uid
+
+def receive_message(sock_file):
+    line = sock_file.readline()
+    if not line: raise OracleDaemonError('The connection was closed')
+    return json.loads(line.decode('utf-8'))
+
+class FairQueue(object):
+    """A queue of calls, kept per job, which hands them out one job at
+    a time, in round-robin order"""
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.queues = {}
+        self.order = collections.deque()
+
+    def put(self, job, item):
+        with self.cond:
+            if job not in self.queues:
+                self.queues[job] = collections.deque()
+                self.order.append(job)
+            self.queues[job].append(item)
+            self.cond.notify()
+
+    def get(self):
+        with self.cond:
+            while not self.order:
+                self.cond.wait()
+            job = self.order.popleft()
+            item = self.queues[job].popleft()
+            if self.queues[job]:
+                self.order.append(job)
+            else:
+                del self.queues[job]
+            return item
+
+    def pending(self):
+        with self.cond:
+            return dict((job, len(queue)) for job, queue in self.queues.items())
+
+class Call(object):
+    def __init__(self, key, request):
+        self.key = key
+        self.request = request
+        self.done = threading.Event()
+        self.result = None
+
+class OracleDaemon(object):
+    def __init__(self, socket_path, jobs=None, cache_size=DEFAULT_CACHE_SIZE, probe_cache=None, programs=DEFAULT_PROGRAMS, log=DEFAULT_LOG, verbose=DEFAULT_VERBOSITY):
+        self.socket_path = socket_path
+        self.jobs = max(1, jobs if jobs is not None else default_job_count())
+        self.cache_size = cache_size
+        self.probe_cache = probe_cache
+        self.log = log
+        self.verbose = verbose
+        # real path -> the program as configured
+        self.programs = {}
+        for prog in programs:
+            resolved = resolve_program(prog, path=os.environ.get('PATH'))
+            if resolved is None:
+                if self.verbose >= 1: self.log('Warning: Could not find %s; calls to it will be refused' % prog)
+            else:
+                self.programs[resolved] = prog
+        self.lock = threading.Lock()
+        self.queue = FairQueue()
+        self.cache = collections.OrderedDict()
+        self.in_flight = {}
+        # directory -> (time of the walk, library_stamp)
+        self.library_stamps = {}
+        self.stamp_lock = threading.Lock()
+        self.stats = {'calls': 0, 'runs': 0, 'cache_hits': 0, 'shared_in_flight': 0, 'submitted_jobs': 0}
+        self.server = None
+
+    def cached_library_stamp(self, directory):
+        now = time.time()
+        with self.stamp_lock:
+            entry = self.library_stamps.get(directory)
+        if entry is not None and now - entry[0] < LIBRARY_STAMP_TTL:
+            return entry[1]
+        stamp = library_stamp(directory)
+        with self.stamp_lock:
+            self.library_stamps[directory] = (now, stamp)
+        return stamp
+
+    def call_key(self, request, program):
+        """Returns the digest which identifies the result of running
+        request, whose program resolves to program"""
+        cwd = request.get('cwd') or os.getcwd()
+        env = request.get('env', os.environ)
+        directories = load_path_directories(request['cmds'], cwd)
+        args = list(request['cmds'][1:])
+        for i, arg in enumerate(args[:-1]):
+            if arg in LOAD_PATH_OPTIONS: args[i + 1] = os.path.abspath(os.path.join(cwd, args[i + 1]))
+        relative_files = any(arg and not os.path.isabs(arg) and os.path.exists(os.path.join(cwd, arg))
+                             for i, arg in enumerate(args) if i == 0 or args[i - 1] not in LOAD_PATH_OPTIONS)
+        key = [program, args, request['contents'], request.get('pass_on_stdin', False), request.get('timeout'),
+               cwd if relative_files else None,
+               dict((var, env[var]) for var in KEYED_ENV_VARS if var in env),
+               [(directory, self.cached_library_stamp(directory)) for directory in directories]]
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def check_program(self, request):
+        """Returns the real path of the program which the call would
+        run, raising OracleDaemonError if it is not one of the programs
+        the daemon may run"""
+        prog = request['cmds'][0] if request['cmds'] else ''
+        resolved = resolve_program(prog, cwd=request.get('cwd'), path=request.get('env', os.environ).get('PATH'))
+        if resolved not in self.programs:
+            raise OracleDaemonError('Refusing to run %s, which is not among the programs the daemon may run (%s)'
+                                    % (repr(prog), ', '.join(sorted(self.programs.values())) or 'none'))
+        return resolved
+
+    def run_call(self, request):
+        """Compiles a copy of the contents, as coqc/coqtop would have on
+        the job's side, returning the output, return code, and the
+        time the run took"""
+        program = self.check_program(request)
+        with tempfile.NamedTemporaryFile(suffix='.v', delete=False, mode='wb') as f:
+            f.write(request['contents'].encode('utf-8'))
+            file_name = f.name
+        file_name_root = os.path.splitext(file_name)[0]
+        cmds = [(file_name if arg == FILE_PLACEHOLDER else file_name_root if arg == FILE_ROOT_PLACEHOLDER else arg)
+                for arg in request['cmds'][1:]]
+        cmds = [program] + cmds
+        env = dict(request.get('env', os.environ))
+        timeout = request.get('timeout')
+        input_val = request['contents'] if request.get('pass_on_stdin', False) else None
+        if self.verbose >= 2: self.log('Running "%s"' % '" "'.join(cmds))
+        start = time.time()
+        ((stdout, stderr), returncode) = diagnose_error.memory_robust_timeout_Popen_communicate(self.log, cmds, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, stdin=subprocess.PIPE, timeout=timeout, input=input_val, cwd=request.get('cwd'), env=env)
+        elapsed = time.time() - start
+        clean_v_file(file_name)
+        if os.path.exists(file_name): os.remove(file_name)
+        return {'stdout': stdout, 'returncode': returncode, 'elapsed': elapsed}
+
+    def handle_run(self, job, request):
+        key = self.call_key(request, self.check_program(request))
+        with self.lock:
+            self.stats['calls'] += 1
+            if key in self.cache:
+                self.stats['cache_hits'] += 1
+                result = self.cache.pop(key)
+                self.cache[key] = result
+                return dict(result, cached=True)
+            call = self.in_flight.get(key)
+            if call is not None:
+                self.stats['shared_in_flight'] += 1
+                fresh = False
+            else:
+                call = self.in_flight[key] = Call(key, request)
+                fresh = True
+        if fresh: self.queue.put(job, call)
+        call.done.wait()
+        return dict(call.result, cached=not fresh)
+
+    def worker(self):
+        while True:
+            call = self.queue.get()
+            try:
+                result = self.run_call(call.request)
+            except Exception as e:
+                result = {'error': repr(e)}
+            with self.lock:
+                self.stats['runs'] += 1
+                del self.in_flight[call.key]
+                if 'error' not in result:
+                    self.cache[call.key] = result
+                    while len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+            call.result = result
+            call.done.set()
+
+    def handle_submit(self, request):
+        """Runs find-bug.py with the given arguments, with its oracle
+        calls going through this daemon, and returns its return code
+        once it finishes"""
+        args = list(request['args'])
+        cmds = [sys.executable, os.path.join(SCRIPT_DIRECTORY, 'find-bug.py'), '--oracle-daemon', self.socket_path] + args
+        env = dict(request.get('env', os.environ))
+        if self.probe_cache: env.setdefault('COQ_TOOLS_PROBE_CACHE', self.probe_cache)
+        with self.lock:
+            self.stats['submitted_jobs'] += 1
+        if self.verbose >= 1: self.log('Starting job: "%s"' % '" "'.join(cmds))
+        log_name = request.get('log') or os.devnull
+        # the jobs cannot answer prompts
+        with open(os.devnull, 'rb') as null, open(log_name, 'ab') as log_file:
+            p = subprocess.Popen(cmds, stdin=null, stdout=log_file, stderr=subprocess.STDOUT, cwd=request.get('cwd'), env=env)
+            returncode = p.wait()
+        if self.verbose >= 1: self.log('Job "%s" finished with return code %d' % ('" "'.join(args), returncode))
+        return {'returncode': returncode}
+
+    def handle(self, request):
+        op = request.get('op')
+        if op == 'run':
+            return self.handle_run(request.get('job', ''), request)
+        elif op == 'info':
+            return {'probe_cache': self.probe_cache, 'jobs': self.jobs}
+        elif op == 'status':
+            with self.lock:
+                stats = dict(self.stats)
+                stats['in_flight'] = len(self.in_flight)
+                stats['cached'] = len(self.cache)
+            stats['pending'] = self.queue.pending()
+            return stats
+        elif op == 'submit':
+            return self.handle_submit(request)
+        elif op == 'shutdown':
+            # the server is shut down once the response is sent
+            return {}
+        raise OracleDaemonError('Unknown request: %s' % repr(op))
+
+    def serve_forever(self):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise OracleDaemonError('Unix sockets are not supported on this platform')
+        daemon = self
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                request = {}
+                try:
+                    uid = peer_uid(self.request)
+                    if uid is not None and uid != os.getuid():
+                        raise OracleDaemonError('Refusing a connection from user %d' % uid)
+                    request = receive_message(self.rfile)
+                    response = daemon.handle(request)
+                    response['ok'] = 'error' not in response
+                except Exception as e:
+                    response = {'ok': False, 'error': repr(e)}
+                try:
+                    send_message(self.wfile, response)
+                except (IOError, OSError):
+                    pass # the job went away
+                if request.get('op') == 'shutdown':
+                    daemon.server.shutdown()
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+        if os.path.exists(self.socket_path): os.remove(self.socket_path)
+        # create the socket accessible to this user only
+        old_umask = os.umask(0o077)
+        try:
+            self.server = Server(self.socket_path, Handler)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.socket_path, 0o600)
+        for i in range(self.jobs):
+            thread = threading.Thread(target=self.worker)
+            thread.daemon = True
+            thread.start()
+        if self.verbose >= 1: self.log('Serving on %s with %d workers' % (self.socket_path, self.jobs))
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.socket_path): os.remove(self.socket_path)
+
+def request_daemon(socket_path, request):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        sock_file = sock.makefile('rwb')
+        try:
+            send_message(sock_file, request)
+            response = receive_message(sock_file)
+        finally:
+            sock_file.close()
+    finally:
+        sock.close()
+    if not response.get('ok'): raise OracleDaemonError(response.get('error', 'Unknown error'))
+    return response
+
+class OracleDaemonClient(object):
+    """The job's side of the daemon: runs the commands which
+    diagnose_error.get_coq_output would have run, in the daemon"""
+    def __init__(self, socket_path, job=None, log=DEFAULT_LOG, verbose=DEFAULT_VERBOSITY):
+        self.socket_path = socket_path
+        self.job = job if job is not None else '%s:%d' % (socket.gethostname(), os.getpid())
+        self.log = log
+        self.verbose = verbose
+        self.warned = False
+
+    def info(self):
+        return request_daemon(self.socket_path, {'op': 'info'})
+
+    def communicate(self, cmds, file_name, contents, input_val, timeout, cwd):
+        """Returns ((stdout, stderr), returncode, seconds taken by the
+        run itself) for running cmds (which compile file_name, whose
+        contents are contents) in the daemon, or None if the daemon
+        cannot be reached"""
+        file_name_root = os.path.splitext(file_name)[0]
+        request = {'op': 'run', 'job': self.job,
+                   'cmds': [(FILE_PLACEHOLDER if arg == file_name else FILE_ROOT_PLACEHOLDER if arg == file_name_root else arg) for arg in cmds],
+                   'contents': contents, 'pass_on_stdin': input_val is not None,
+                   'timeout': timeout, 'cwd': (os.path.abspath(cwd) if cwd else os.getcwd()),
+                   'env': dict(os.environ)}
+        try:
+            response = request_daemon(self.socket_path, request)
+        except (IOError, OSError, ValueError, OracleDaemonError) as e:
+            if not self.warned or self.verbose >= 2:
+                self.log('Warning: Could not run the command in the oracle daemon at %s (%s); running it here' % (self.socket_path, repr(e)), force_stdout=True)
+                self.warned = True
+            return None
+        if self.verbose >= 3 and response.get('cached'): self.log('(shared result from the oracle daemon)')
+        return ((response['stdout'], ''), response['returncode'], response['elapsed'])
@@ -0,0 +1,134 @@
+from __future__ import with_statement
+import os, json, time, threading
+
+__all__ = ["ORACLE_TRACE_ENV_VAR", "OracleTrace", "get_oracle_trace", "read_trace", "summarize_trace", "format_trace_summary", "cpu_time"]
+
+# An oracle trace is a file of JSON lines, one per oracle call.  There
+# are two kinds of records:
+#
+#  - 'run' records, one per call to diagnose_error.get_coq_output,
+#    with whether the result came from the cache, the wall-clock and
+#    CPU time of the coqc process, its return code, and whether it
+#    timed out;
+#
+#  - 'classify' records, one per candidate checked by
+#    classify_contents_change in find-bug.py, with the classification
+#    of the candidate, and the total wall-clock and CPU time of the
+#    runs it took.
+#
+# Both carry the pass which issued them (or null, for calls made
+# outside of any pass) and the size of the candidate, in bytes and
+# (when known) in definitions.  CPU time is that of the child
+# processes, and is null for runs done by an oracle daemon.
+#
+# The trace file is given by --oracle-trace, or else by the
+# environment variable below.  A trace given by the environment
+# variable is appended to rather than truncated, so that scripts which
+# run find-bug.py several times (as some of the examples do) can be
+# traced as a whole.
+
+ORACLE_TRACE_ENV_VAR = 'COQ_TOOLS_ORACLE_TRACE'
+
+def cpu_time():
+    """Returns the user and system CPU time used by the finished child
+    processes of this process"""
+    times = os.times()
+    return times[2] + times[3]
+
+def byte_length(contents):
+    if not isinstance(contents, bytes): contents = contents.encode('utf-8')
+    return len(contents)
+
+class OracleTrace(object):
+    def __init__(self, path, append=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.context = threading.local()
+        with open(self.path, 'a' if append else 'w'):
+            pass
+
+    def write(self, record):
+        line = json.dumps(record, sort_keys=True) + '\n'
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+    def begin_candidate(self, pass_name, contents, definition_count=None):
+        self.context.candidate = {'pass': pass_name, 'bytes': byte_length(contents), 'definitions': definition_count,
+                                  'start': time.time(), 'cpu_start': cpu_time(), 'runs': 0}
+
+    def end_candidate(self, classification):
+        candidate = getattr(self.context, 'candidate', None)
+        if candidate is None: return
+        self.context.candidate = None
+        self.write({'kind': 'classify', 'pass': candidate['pass'], 'bytes': candidate['bytes'], 'definitions': candidate['definitions'],
+                    'classification': classification, 'runs': candidate['runs'],
+                    'wall': time.time() - candidate['start'], 'cpu': cpu_time() - candidate['cpu_start'], 'time': time.time()})
+
+    def record_run(self, contents, cached, wall=None, cpu=None, returncode=None, timed_out=False, daemon=False):
+        candidate = getattr(self.context, 'candidate', None)
+        if candidate is not None and not cached: candidate['runs'] += 1
+        self.write({'kind': 'run', 'pass': (candidate['pass'] if candidate is not None else None),
+                    'bytes': byte_length(contents), 'definitions': (candidate['definitions'] if candidate is not None else None),
+                    'cache': ('hit' if cached else 'miss'), 'wall': wall, 'cpu': cpu,
+                    'returncode': returncode, 'timeout': timed_out, 'daemon': daemon, 'time': time.time()})
+
+def get_oracle_trace(path=None):
+    """Returns the OracleTrace to write to, given the --oracle-trace
+    argument, or None if there is none"""
+    if path is not None: return OracleTrace(path)
+    if os.environ.get(ORACLE_TRACE_ENV_VAR): return OracleTrace(os.environ[ORACLE_TRACE_ENV_VAR], append=True)
+    return None
+
+def read_trace(path):
+    records = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass # the last line of the trace of a killed run
+    return records
+
+def summarize_trace(records, top=10):
+    """Returns a dict with per-pass totals of the records, in order of
+    total wall-clock time, and the top runs by wall-clock time"""
+    passes = {}
+    for record in records:
+        name = record.get('pass') or '(outside of passes)'
+        totals = passes.setdefault(name, {'pass': name, 'candidates': 0, 'classifications': {}, 'runs': 0, 'cache_hits': 0,
+                                          'timeouts': 0, 'wall': 0.0, 'cpu': 0.0, 'bytes': 0})
+        if record['kind'] == 'classify':
+            totals['candidates'] += 1
+            totals['bytes'] += record['bytes']
+            totals['classifications'][record['classification']] = totals['classifications'].get(record['classification'], 0) + 1
+        elif record['cache'] == 'hit':
+            totals['cache_hits'] += 1
+        else:
+            totals['runs'] += 1
+            totals['wall'] += record['wall'] or 0.0
+            totals['cpu'] += record['cpu'] or 0.0
+            if record['timeout']: totals['timeouts'] += 1
+    runs = [record for record in records if record['kind'] == 'run' and record['cache'] == 'miss']
+    return {'passes': sorted(passes.values(), key=(lambda totals: totals['wall']), reverse=True),
+            'top_runs': sorted(runs, key=(lambda record: record['wall'] or 0.0), reverse=True)[:top],
+            'total_wall': sum(totals['wall'] for totals in passes.values())}
+
+def format_trace_summary(summary):
+    lines = ['%-40s %10s %8s %8s %8s %10s %10s  %s' % ('pass', 'candidates', 'runs', 'hits', 'timeouts', 'wall (s)', 'cpu (s)', 'success/failure/unchanged')]
+    for totals in summary['passes']:
+        classifications = totals['classifications']
+        lines.append('%-40s %10d %8d %8d %8d %10.1f %10.1f  %d/%d/%d'
+                     % (totals['pass'][:40], totals['candidates'], totals['runs'], totals['cache_hits'], totals['timeouts'],
+                        totals['wall'], totals['cpu'], classifications.get('CHANGE_SUCCESS', 0),
+                        classifications.get('CHANGE_FAILURE', 0), classifications.get('CONTENTS_UNCHANGED', 0)))
+    lines.append('Total wall-clock time in coqc: %.1f s' % summary['total_wall'])
+    if summary['top_runs']:
+        lines.append('')
+        lines.append('Slowest runs:')
+        for record in summary['top_runs']:
+            lines.append('  %8.2f s  %-40s %8d bytes%s  returncode %s%s'
+                         % (record['wall'] or 0.0, (record['pass'] or '(outside of passes)')[:40], record['bytes'],
+                            (', %d definitions' % record['definitions'] if record['definitions'] is not None else ''),
+                            record['returncode'], ', timed out' if record['timeout'] else ''))
+    return '\n'.join(lines)
@@ -0,0 +1,91 @@
+from __future__ import with_statement
+import threading, multiprocessing
+
+__all__ = ["default_job_count", "run_in_parallel", "run_dag_in_parallel"]
+
+def default_job_count():
+    try:
+        return max(1, multiprocessing.cpu_count())
+    except NotImplementedError:
+        return 1
+
+def run_in_parallel(f, items, jobs=None):
+    """Calls f on each item of items, running at most jobs calls at
+    once, and returns the list of results in the order of items.  If
+    any call raises, the first exception (in the order of items) is
+    re-raised once all of the calls have finished."""
+    items = list(items)
+    # we schedule indices, so that items need not be hashable
+    return run_dag_in_parallel((lambda i: f(items[i])), range(len(items)), dict(), jobs=jobs)
+
+def run_dag_in_parallel(f, nodes, dependencies, jobs=None):
+    """Calls f on each node of nodes, running at most jobs calls at
+    once, such that f(node) is only started once f has finished on
+    every node in dependencies.get(node, ()).  Dependencies not
+    mentioned in nodes are ignored.  Cycles are broken by starting
+    the earliest (in the order of nodes) blocked node.
+
+    Returns the list of results in the order of nodes.  If any call
+    raises, the first exception (in the order of nodes) is re-raised
+    once all of the calls have finished."""
+    nodes = list(nodes)
+    if jobs is None: jobs = default_job_count()
+    jobs = max(1, jobs)
+    index = dict((node, i) for i, node in enumerate(nodes))
+    blockers = [set(index[dep] for dep in dependencies.get(node, ()) if dep in index and dep != node)
+                for node in nodes]
+    dependents = [[] for node in nodes]
+    for i, deps in enumerate(blockers):
+        for dep in deps:
+            dependents[dep].append(i)
+    results = [None] * len(nodes)
+    errors = [None] * len(nodes)
+    state = {'running': 0, 'done': 0}
+    pending = list(range(len(nodes)))
+    cond = threading.Condition()
+
+    def worker(i):
+        try:
+            results[i] = f(nodes[i])
+        except BaseException as e:
+            errors[i] = e
+        with cond:
+            state['running'] -= 1
+            state['done'] += 1
+            for j in dependents[i]:
+                blockers[j].discard(i)
+            cond.notify_all()
+
+    threads = []
+    with cond:
+        while state['done'] < len(nodes):
+            while pending and state['running'] < jobs:
+                ready = [i for i in pending if not blockers[i]]
+                if not ready:
+                    if state['running'] > 0: break
+                    # everything left is blocked on a cycle
+                    ready = pending[:1]
+                i = ready[0]
+                pending.remove(i)
+                state['running'] += 1
+                if jobs == 1:
+                    # run inline, so that single-job runs behave
+                    # exactly like a sequential loop
+                    cond.release()
+                    try:
+                        worker(i)
+                    finally:
+                        cond.acquire()
+                else:
+                    thread = threading.Thread(target=worker, args=(i,))
+                    thread.daemon = True
+                    threads.append(thread)
+                    thread.start()
+            if state['done'] < len(nodes):
+                cond.wait()
+    for thread in threads:
+        thread.join()
+    for e in errors:
+        if e is not None:
+            raise e
+    return results
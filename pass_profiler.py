@@ -0,0 +1,96 @@
+from __future__ import with_statement
+import time, threading, contextlib
+import diagnose_error
+from file_util import read_from_file
+from oracle_trace import byte_length
+
+__all__ = ["PassProfiler", "profile_pass"]
+
+class PassProfiler(object):
+    """Records, for each pass of minimization, how many times it ran,
+    how many oracle calls it made (and how many of them actually ran
+    coq), how many changes it got accepted, how many bytes and lines
+    it removed from the output file (net of any it added, so passes
+    which add to the header can come out negative), and how its
+    wall-clock time splits between running coq and everything else"""
+    COLUMNS = (('runs', '%d'), ('oracle calls', '%d'), ('coq runs', '%d'), ('accepted', '%d'),
+               ('net bytes removed', '%d'), ('net lines removed', '%d'), ('coq time (s)', '%.1f'), ('python time (s)', '%.1f'))
+
+    def __init__(self):
+        # reentrant, since table() is called from a signal handler
+        self.lock = threading.RLock()
+        self.stats = {}
+        self.order = []
+        self.accepted = 0
+        self.running = []
+
+    def record_accept(self):
+        with self.lock:
+            self.accepted += 1
+
+    @contextlib.contextmanager
+    def measure(self, description, output_file_name):
+        old_contents = read_from_file(output_file_name)
+        old_oracle_stats, old_accepted = diagnose_error.get_oracle_stats(), self.accepted
+        self.running.append(description)
+        start = time.time()
+        try:
+            yield
+        finally:
+            wall = time.time() - start
+            self.running.pop()
+            new_contents = read_from_file(output_file_name)
+            oracle_stats = diagnose_error.get_oracle_stats()
+            with self.lock:
+                if description not in self.stats:
+                    self.stats[description] = dict((column, 0) for column, fmt in self.COLUMNS)
+                    self.order.append(description)
+                stats = self.stats[description]
+                stats['runs'] += 1
+                stats['oracle calls'] += oracle_stats['calls'] - old_oracle_stats['calls']
+                stats['coq runs'] += oracle_stats['runs'] - old_oracle_stats['runs']
+                stats['accepted'] += self.accepted - old_accepted
+                stats['net bytes removed'] += byte_length(old_contents) - byte_length(new_contents)
+                stats['net lines removed'] += old_contents.count('\n') - new_contents.count('\n')
+                coq_time = oracle_stats['coq_time'] - old_oracle_stats['coq_time']
+                stats['coq time (s)'] += coq_time
+                stats['python time (s)'] += max(0.0, wall - coq_time)
+
+    def table(self):
+        width = max([len('pass')] + [len(description) for description in self.order])
+        lines = ['  '.join(['%-*s' % (width, 'pass')] + [column for column, fmt in self.COLUMNS])]
+        totals = dict((column, 0) for column, fmt in self.COLUMNS)
+        with self.lock:
+            for description in self.order:
+                stats = self.stats[description]
+                lines.append('  '.join(['%-*s' % (width, description)] +
+                                       [(fmt % stats[column]).rjust(len(column)) for column, fmt in self.COLUMNS]))
+                for column, fmt in self.COLUMNS:
+                    totals[column] += stats[column]
+        lines.append('  '.join(['%-*s' % (width, 'total')] +
+                               [(fmt % totals[column]).rjust(len(column)) for column, fmt in self.COLUMNS]))
+        if self.running:
+            lines.append('Currently running: %s' % ' > '.join(self.running))
+        return '\n'.join(lines)
+
+@contextlib.contextmanager
+def null_context():
+    yield
+
+@contextlib.contextmanager
+def profile_and_report_pass(description, output_file_name, pass_profiler, reporters, task_index):
+    for reporter in reporters: reporter.begin_pass(description, task_index=task_index)
+    try:
+        with (pass_profiler.measure(description, output_file_name) if pass_profiler is not None else null_context()):
+            yield
+    finally:
+        for reporter in reporters: reporter.end_pass()
+
+def profile_pass(description, output_file_name, pass_profiler=None, progress=None, metrics_exporter=None, task_index=None, **kwargs):
+    """Returns a context manager which records the pass run inside of
+    it under description, if pass_profiler is not None, and reports
+    it as the current pass (task_index of the round, if any) to
+    progress and metrics_exporter, if they are not None"""
+    reporters = [reporter for reporter in (progress, metrics_exporter) if reporter is not None]
+    if pass_profiler is None and not reporters: return null_context()
+    return profile_and_report_pass(description, output_file_name, pass_profiler, reporters, task_index)
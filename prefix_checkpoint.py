@@ -0,0 +1,189 @@
+from __future__ import with_statement
+import os, re, shutil, tempfile, subprocess, atexit
+import diagnose_error
+from custom_arguments import DEFAULT_LOG, DEFAULT_VERBOSITY
+
+__all__ = ["checkpointable_prefix", "update_prefix_checkpoint", "get_checkpointed_args_and_contents", "invalidate_prefix_checkpoint", "invalidate_prefix_checkpoint_if_touched", "should_confirm_rejection", "clear_prefix_checkpoints"]
+
+# A prefix checkpoint is a leading chunk of the file being minimized
+# which has been compiled once, to a .vo file in a scratch directory.
+# Candidates which start with the chunk are compiled with the chunk
+# replaced by a [Require Import] of the .vo file, so that each run of
+# coqc only has to check the rest of the file.  The replacement is
+# padded with newlines, so that line numbers in error messages are
+# unchanged.
+#
+# Checkpoints are keyed on the coqc program, its arguments, and the
+# directory it is run in.
+#
+# A checkpoint can be wrong in either direction (e.g., if the prefix
+# has an effect which does not survive [Require Import] and which is
+# not caught by LOCAL_REG), so the caller compiles the full file
+# before accepting a candidate, and also for a sample of the
+# candidates the checkpoint rejects (see should_confirm_rejection),
+# discarding the checkpoint if the two disagree.
+
+CHECKPOINT_LIBNAME = 'CoqToolsCheckpoint'
+CHECKPOINT_MODNAME = 'Prefix'
+# only try a new checkpoint when the stable prefix has grown by at
+# least this factor since the last one we tried
+PREFIX_GROWTH_FACTOR = 1.25
+# confirm the first rejection with a checkpoint, and then every this
+# many rejections, by compiling the full file
+CONFIRM_REJECTION_EVERY = 10
+
+BEGIN_REG = re.compile(r'^\s*(?:Section|Module(?:\s+Type)?)\s+(?:(?:Import|Export)\s+)?[^\s\.:]+[^\.:]*\.\s*$')
+MODULE_IMPORT_REG = re.compile(r'^\s*Module\s+Import\s')
+END_REG = re.compile(r'^\s*End\s+[^\.]+\.\s*$')
+# statements whose effect does not survive [Require Import]ing the
+# file they are in, but which can be repeated after the [Require
+# Import]
+REPEATABLE_REG = re.compile(r'^\s*(?:(?:Local|Global)\s+)?(?:Import|Set|Unset|Open\s+Scope|(?:From\s+\S+\s+)?Require\s+Import)\s[^\n]*\.\s*$')
+# statements whose effect does not survive [Require Import]ing the
+# file they are in, and which cannot be repeated
+LOCAL_REG = re.compile(r'^\s*(?:#\[[^\]]*local[^\]]*\]|Local\s|Set\s|Unset\s|Global\s+(?:Set|Unset)\s|Open\s+Scope\s|Close\s+Scope\s|Import\s|(?:From\s+\S+\s+)?Require\s+Import\s|Program\s|Obligation|Next\s+Obligation)')
+
+CHECKPOINTS = {}
+LAST_ATTEMPTED_PREFIXES = {}
+
+def checkpoint_key(coqc_prog, coqc_prog_args, cwd):
+    return (coqc_prog, tuple(coqc_prog_args), cwd)
+
+def checkpointable_prefix(definitions):
+    """Returns a pair of the number of leading definitions which can be
+    compiled on their own and [Require Import]ed in place of
+    themselves, and the list of statements among them which have to
+    be repeated after the [Require Import]"""
+    depth = 0
+    count, repeated, cur_repeated = 0, [], []
+    for i, definition in enumerate(definitions):
+        ok = True
+        for statement in definition['statements']:
+            if depth == 0 and REPEATABLE_REG.match(statement) and '\n' not in statement.strip():
+                cur_repeated.append(statement.strip())
+            elif depth == 0 and (LOCAL_REG.match(statement) or MODULE_IMPORT_REG.match(statement)):
+                ok = False
+            elif depth > 0 and re.match(r'^\s*(?:(?:Local|Global)\s+)?(?:Set|Unset)\s', statement):
+                ok = False
+            if not ok: break
+            if BEGIN_REG.match(statement) and ':=' not in statement:
+                depth += 1
+            elif END_REG.match(statement):
+                depth -= 1
+        if not ok or depth < 0: break
+        if depth == 0:
+            count = i + 1
+            repeated.extend(cur_repeated)
+            cur_repeated = []
+    return count, repeated
+
+class PrefixCheckpoint(object):
+    def __init__(self, prefix, repeated, directory):
+        self.prefix = prefix
+        self.directory = directory
+        self.rejections = 0
+        self.replacement = ' '.join(['Require Import %s.%s.' % (CHECKPOINT_LIBNAME, CHECKPOINT_MODNAME)] + list(repeated)) + '\n' * prefix.count('\n')
+
+    def rewrite(self, contents):
+        if not contents.startswith(self.prefix): return None
+        return self.replacement + contents[len(self.prefix):]
+
+    def coqc_args(self, coqc_prog_args):
+        return tuple(list(coqc_prog_args) + ['-Q', self.directory, CHECKPOINT_LIBNAME])
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def get_checkpointed_args_and_contents(coqc_prog, coqc_prog_args, contents, cwd=None):
+    """Returns the arguments to pass to coqc_prog and the contents to
+    compile in place of contents, which are contents with the prefix
+    checkpoint (if there is one, and if contents starts with it)
+    replaced by a [Require Import] of its .vo file"""
+    checkpoint = CHECKPOINTS.get(checkpoint_key(coqc_prog, coqc_prog_args, cwd))
+    if checkpoint is not None:
+        new_contents = checkpoint.rewrite(contents)
+        if new_contents is not None:
+            return checkpoint.coqc_args(coqc_prog_args), new_contents
+    return coqc_prog_args, contents
+
+def invalidate_prefix_checkpoint(coqc_prog, coqc_prog_args, cwd=None, reason=None, log=DEFAULT_LOG, verbose=DEFAULT_VERBOSITY, **kwargs):
+    checkpoint = CHECKPOINTS.pop(checkpoint_key(coqc_prog, coqc_prog_args, cwd), None)
+    if checkpoint is not None:
+        if verbose >= 2: log('Discarding the prefix checkpoint%s' % (' (%s)' % reason if reason else ''))
+        checkpoint.remove()
+
+def invalidate_prefix_checkpoint_if_touched(coqc_prog, coqc_prog_args, contents, cwd=None, **kwargs):
+    """Discards the prefix checkpoint if contents does not start with it"""
+    checkpoint = CHECKPOINTS.get(checkpoint_key(coqc_prog, coqc_prog_args, cwd))
+    if checkpoint is not None and not contents.startswith(checkpoint.prefix):
+        invalidate_prefix_checkpoint(coqc_prog, coqc_prog_args, cwd=cwd, reason='the prefix changed', **kwargs)
+
+def should_confirm_rejection(coqc_prog, coqc_prog_args, cwd=None):
+    """Counts a rejection of a candidate made with the prefix
+    checkpoint, and returns whether it should be confirmed by
+    compiling the full file"""
+    checkpoint = CHECKPOINTS.get(checkpoint_key(coqc_prog, coqc_prog_args, cwd))
+    if checkpoint is None: return False
+    checkpoint.rejections += 1
+    return checkpoint.rejections % CONFIRM_REJECTION_EVERY == 1
+
+def clear_prefix_checkpoints():
+    for checkpoint in CHECKPOINTS.values():
+        checkpoint.remove()
+    CHECKPOINTS.clear()
+
+atexit.register(clear_prefix_checkpoints)
+
+def compile_prefix_checkpoint(prefix, repeated, coqc_prog, coqc_prog_args, cwd=None, timeout=None, log=DEFAULT_LOG, verbose=DEFAULT_VERBOSITY, **kwargs):
+    directory = tempfile.mkdtemp(prefix='coq-tools-checkpoint-')
+    v_file = os.path.join(directory, CHECKPOINT_MODNAME + '.v')
+    with open(v_file, 'wb') as f:
+        f.write(prefix.encode('utf-8'))
+    checkpoint = PrefixCheckpoint(prefix, repeated, directory)
+    cmds = [coqc_prog] + list(checkpoint.coqc_args(coqc_prog_args)) + [v_file, '-q']
+    if verbose >= 2: log('\nCompiling the prefix checkpoint: "%s"' % '" "'.join(cmds))
+    if timeout is not None and timeout < 0: timeout = diagnose_error.get_timeout()
+    ((stdout, stderr), returncode) = diagnose_error.memory_robust_timeout_Popen_communicate(log, cmds, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, stdin=subprocess.PIPE, timeout=(timeout if timeout is not None and timeout > 0 else None), input=None, cwd=cwd)
+    if returncode != 0 or not os.path.exists(os.path.join(directory, CHECKPOINT_MODNAME + '.vo')):
+        if verbose >= 2: log('Compiling the prefix checkpoint failed:\n%s' % stdout)
+        checkpoint.remove()
+        return None
+    return checkpoint
+
+def update_prefix_checkpoint(contents, definitions, prefix_length, **kwargs):
+    """Makes a checkpoint of (a checkpointable part of) the first
+    prefix_length definitions of definitions, if it is sufficiently
+    longer than the last prefix we tried.  contents, the current file
+    (which must be join_definitions(definitions)), is used to
+    validate the checkpoint: it must give the same error with and
+    without the checkpoint, or else the checkpoint is not used."""
+    if kwargs['coqc_is_coqtop']: return
+    coqc_prog, coqc_prog_args, cwd = kwargs['coqc'], kwargs['coqc_args'], kwargs['base_dir']
+    key = checkpoint_key(coqc_prog, coqc_prog_args, cwd)
+    # we always leave at least one definition (the one with the error)
+    # out of the checkpoint
+    count, repeated = checkpointable_prefix(definitions[:min(prefix_length, len(definitions) - 1)])
+    if count == 0: return
+    prefix = '\n'.join(definition['statement'] for definition in definitions[:count]) + '\n'
+    if not contents.startswith(prefix): return
+    last_prefix = LAST_ATTEMPTED_PREFIXES.get(key)
+    if last_prefix is not None and contents.startswith(last_prefix) and len(prefix) < PREFIX_GROWTH_FACTOR * len(last_prefix):
+        return
+    LAST_ATTEMPTED_PREFIXES[key] = prefix
+    if kwargs['verbose'] >= 1: kwargs['log']('\nCompiling the first %d definitions (%d bytes) to a checkpoint...' % (count, len(prefix)))
+    checkpoint = compile_prefix_checkpoint(prefix, repeated, coqc_prog, coqc_prog_args, cwd=cwd, **kwargs)
+    if checkpoint is not None:
+        output, cmds, retcode = diagnose_error.get_coq_output(coqc_prog, coqc_prog_args, contents, kwargs['timeout'], cwd=cwd, is_coqtop=False, verbose_base=2, **kwargs)
+        new_output, cmds, retcode = diagnose_error.get_coq_output(coqc_prog, checkpoint.coqc_args(coqc_prog_args), checkpoint.rewrite(contents), kwargs['timeout'], cwd=cwd, is_coqtop=False, verbose_base=2, **kwargs)
+        if not (diagnose_error.has_error(output, kwargs['error_reg_string'])
+                and diagnose_error.has_error(new_output, kwargs['error_reg_string'])
+                and diagnose_error.get_error_line_number(output, kwargs['error_reg_string']) == diagnose_error.get_error_line_number(new_output, kwargs['error_reg_string'])):
+            if kwargs['verbose'] >= 2: kwargs['log']('The file gives a different error with the checkpoint:\n%s' % new_output)
+            checkpoint.remove()
+            checkpoint = None
+    if checkpoint is None:
+        if kwargs['verbose'] >= 1: kwargs['log']('Not using a checkpoint for these definitions.')
+        return
+    invalidate_prefix_checkpoint(coqc_prog, coqc_prog_args, cwd=cwd, reason='replacing it with a longer one', **kwargs)
+    CHECKPOINTS[key] = checkpoint
+    if kwargs['verbose'] >= 1: kwargs['log']('Using the checkpoint for candidates which start with these definitions.')
@@ -0,0 +1,101 @@
+from __future__ import with_statement
+import os, json, threading
+
+__all__ = ["PROBE_CACHE_ENV_VAR", "set_probe_cache_file", "get_probe_cache_file", "set_probe_cassette", "cached_probe", "binary_stamp"]
+
+# The results of probing the capabilities of Coq binaries (versions,
+# --help output, which options they accept, ...) are stored on disk,
+# keyed on the identity of the binary (its real path, size,
+# modification time, and inode) and on the environment variables that
+# change how Coq finds its libraries.  The cache file is given by
+# --probe-cache, or else by the environment variable below; if neither
+# is given, nothing is cached on disk.
+#
+# Probes also go through the oracle cassette (see oracle_cassette.py),
+# if one is set, so that replaying a run does not need the binaries.
+
+PROBE_CACHE_ENV_VAR = 'COQ_TOOLS_PROBE_CACHE'
+PROBE_CACHE_VERSION = 1
+
+PROBE_CACHE = {'file': None, 'loaded_file': None, 'entries': {}, 'cassette': None}
+PROBE_CACHE_LOCK = threading.RLock()
+
+def set_probe_cache_file(filename):
+    with PROBE_CACHE_LOCK:
+        PROBE_CACHE['file'] = filename
+
+def set_probe_cassette(cassette):
+    with PROBE_CACHE_LOCK:
+        PROBE_CACHE['cassette'] = cassette
+
+def get_probe_cache_file():
+    if PROBE_CACHE['file']: return PROBE_CACHE['file']
+    return os.environ.get(PROBE_CACHE_ENV_VAR) or None
+
+def find_executable(prog):
+    if os.path.dirname(prog):
+        return prog if os.path.isfile(prog) else None
+    exts = os.environ.get('PATHEXT', '').split(os.pathsep) if os.name == 'nt' else []
+    for dirname in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        for ext in [''] + exts:
+            candidate = os.path.join(dirname, prog + ext)
+            if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+                return candidate
+    return None
+
+def binary_stamp(prog):
+    """Returns a JSON-able description of the binary that running prog
+    would execute, or None if there is no such binary"""
+    path = find_executable(prog)
+    if path is None: return None
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    return [path, st.st_size, st.st_mtime, st.st_ino,
+            os.environ.get('COQLIB', ''), os.environ.get('COQPATH', '')]
+
+def load_entries(filename):
+    try:
+        with open(filename, 'r') as f:
+            d = json.load(f)
+        if d.get('version') != PROBE_CACHE_VERSION: return {}
+        return dict(d['entries'])
+    except (IOError, OSError, ValueError, KeyError, TypeError, AttributeError):
+        return {}
+
+def save_entries(filename, entries):
+    # merge with whatever other runs have stored in the meantime
+    all_entries = load_entries(filename)
+    all_entries.update(entries)
+    tmp_name = '%s.%d.tmp' % (filename, os.getpid())
+    try:
+        with open(tmp_name, 'w') as f:
+            json.dump({'version': PROBE_CACHE_VERSION, 'entries': all_entries}, f, sort_keys=True)
+        if os.name == 'nt' and os.path.exists(filename): os.remove(filename)
+        os.rename(tmp_name, filename)
+    except (IOError, OSError):
+        if os.path.exists(tmp_name): os.remove(tmp_name)
+
+def cached_probe(name, prog, args, compute):
+    """Returns compute(), which probes the binary prog, caching the
+    result on disk under name and args (which must be JSON-able).
+    Tuples in the result come back as lists."""
+    cassette = PROBE_CACHE['cassette']
+    if cassette is not None:
+        return cassette.probe(name, prog, args, (lambda: disk_cached_probe(name, prog, args, compute)))
+    return disk_cached_probe(name, prog, args, compute)
+
+def disk_cached_probe(name, prog, args, compute):
+    filename = get_probe_cache_file()
+    if filename is None: return compute()
+    stamp = binary_stamp(prog)
+    if stamp is None: return compute()
+    key = json.dumps([name, stamp, list(args)], sort_keys=True)
+    with PROBE_CACHE_LOCK:
+        if PROBE_CACHE['loaded_file'] != filename:
+            PROBE_CACHE['loaded_file'], PROBE_CACHE['entries'] = filename, load_entries(filename)
+        if key in PROBE_CACHE['entries']: return PROBE_CACHE['entries'][key]
+    value = compute()
+    with PROBE_CACHE_LOCK:
+        PROBE_CACHE['entries'][key] = value
+        save_entries(filename, PROBE_CACHE['entries'])
+    return value
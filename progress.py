@@ -0,0 +1,217 @@
+from __future__ import with_statement
+import os, json, time, threading
+from custom_arguments import DEFAULT_LOG
+
+__all__ = ["ProgressReporter", "format_duration"]
+
+# Tracks how far along a minimization is, and, every interval seconds,
+# logs a status line and/or rewrites a status file (JSON) saying so:
+# the current pass and its place in the round, the candidate being
+# checked and how many remain, the moving average of the time it takes
+# to check a candidate, the size of the output file compared to its
+# size when minimization started (after the [Require]s were factored
+# out or inlined, which can make it larger than the input), and
+# estimates of how long the pass, the round, and the loop of
+# rounds until nothing changes will take.
+#
+# The estimates are rough: the rest of the pass is the remaining
+# candidates times the average latency; a pass which does not announce
+# its candidates, or which has not started yet, is estimated from how
+# long it took in the previous round (scaled by how much the file has
+# shrunk since), or else from the number of definitions times the
+# average latency.  Since the loop only stops after a round which
+# changes nothing, the projection for the loop is the rest of this
+# round, plus one more full round if this round has changed anything.
+
+# weight of the latest candidate in the moving average of the latency
+LATENCY_SMOOTHING = 0.2
+
+def format_duration(seconds):
+    if seconds is None: return '?'
+    seconds = int(round(seconds))
+    return '%d:%02d:%02d' % (seconds // 3600, (seconds // 60) % 60, seconds % 60)
+
+class ProgressReporter(object):
+    def __init__(self, interval=30.0, status_line=True, status_file=None, log=DEFAULT_LOG):
+        self.interval = interval
+        self.status_line = status_line
+        self.status_file = status_file
+        self.log = log
+        self.lock = threading.RLock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.start_time = time.time()
+        self.state = 'running'
+        self.input_size = None
+        self.original_size = None
+        self.size = None
+        self.latency = None
+        self.definition_count = None
+        self.round_number = None
+        self.round_tasks = None
+        self.round_changed = False
+        self.task_index = None
+        self.description = None
+        self.pass_start = None
+        self.pass_size = None
+        self.candidate = 0
+        self.candidates = None
+        # description -> (seconds, size when it started) of its last run
+        self.pass_times = {}
+
+    def start(self):
+        if self.thread is not None: return
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def stop(self, state='done'):
+        with self.lock:
+            self.state = state
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.report()
+
+    def set_input_size(self, size):
+        with self.lock:
+            self.input_size = size
+
+    def set_original_size(self, size):
+        """Records size as the size of the output file when
+        minimization started, which progress is measured against"""
+        with self.lock:
+            self.original_size = self.size = size
+
+    def set_size(self, size):
+        with self.lock:
+            if self.size is not None and size != self.size: self.round_changed = True
+            self.size = size
+
+    def begin_round(self, round_number, descriptions):
+        with self.lock:
+            self.round_number = round_number
+            self.round_tasks = list(descriptions)
+            self.round_changed = False
+
+    def end_round(self):
+        with self.lock:
+            self.round_number = self.round_tasks = self.task_index = None
+
+    def begin_pass(self, description, task_index=None):
+        with self.lock:
+            self.description = description
+            self.task_index = task_index
+            self.pass_start, self.pass_size = time.time(), self.size
+            self.candidate, self.candidates = 0, None
+
+    def end_pass(self):
+        with self.lock:
+            if self.description is not None:
+                self.pass_times[self.description] = (time.time() - self.pass_start, self.pass_size)
+            self.description = self.pass_start = self.pass_size = None
+            self.candidate, self.candidates = 0, None
+
+    def begin_candidates(self, count, done=0):
+        with self.lock:
+            self.candidate, self.candidates = done, count
+
+    def next_candidate(self):
+        with self.lock:
+            self.candidate += 1
+
+    def record_check(self, seconds, definition_count=None):
+        with self.lock:
+            self.latency = seconds if self.latency is None else (LATENCY_SMOOTHING * seconds + (1 - LATENCY_SMOOTHING) * self.latency)
+            if definition_count is not None: self.definition_count = definition_count
+
+    def estimate_pass(self, description):
+        """Returns an estimate of how long a fresh run of the pass
+        description will take, or None"""
+        if description in self.pass_times:
+            seconds, size = self.pass_times[description]
+            if size and self.size: return seconds * float(self.size) / size
+            return seconds
+        if self.latency is not None and self.definition_count is not None:
+            return self.latency * self.definition_count
+        return None
+
+    def pass_eta(self):
+        if self.description is None: return None
+        if self.candidates is not None and self.latency is not None:
+            return max(0, self.candidates - self.candidate) * self.latency
+        estimate = self.estimate_pass(self.description)
+        if estimate is None: return None
+        return max(0.0, estimate - (time.time() - self.pass_start))
+
+    def round_eta(self):
+        if self.round_tasks is None or self.task_index is None: return None
+        estimates = [self.pass_eta() if self.description is not None else 0.0] + [self.estimate_pass(description) for description in self.round_tasks[self.task_index + 1:]]
+        if any(estimate is None for estimate in estimates): return None
+        return sum(estimates)
+
+    def fixpoint_eta(self):
+        eta = self.round_eta()
+        if eta is None or not self.round_changed: return eta
+        estimates = [self.estimate_pass(description) for description in self.round_tasks]
+        if any(estimate is None for estimate in estimates): return None
+        return eta + sum(estimates)
+
+    def status(self):
+        with self.lock:
+            return {'state': self.state,
+                    'pid': os.getpid(),
+                    'updated': time.time(),
+                    'elapsed': time.time() - self.start_time,
+                    'round': (self.round_number + 1 if self.round_number is not None else None),
+                    'pass': self.description,
+                    'pass_index': (self.task_index + 1 if self.task_index is not None else None),
+                    'pass_count': (len(self.round_tasks) if self.round_tasks is not None else None),
+                    'candidate': self.candidate,
+                    'candidates': self.candidates,
+                    'remaining_candidates': (max(0, self.candidates - self.candidate) if self.candidates is not None else None),
+                    'latency': self.latency,
+                    'size': self.size,
+                    'original_size': self.original_size,
+                    'input_size': self.input_size,
+                    'pass_eta': self.pass_eta(),
+                    'round_eta': self.round_eta(),
+                    'fixpoint_eta': self.fixpoint_eta()}
+
+    def status_text(self, status=None):
+        if status is None: status = self.status()
+        parts = []
+        if status['pass_index'] is not None: parts.append('round %d, pass %d/%d' % (status['round'], status['pass_index'], status['pass_count']))
+        if status['pass'] is not None: parts.append(status['pass'])
+        if status['candidates'] is not None: parts.append('candidate %d/%d' % (status['candidate'], status['candidates']))
+        if status['pass'] is not None: parts.append('pass ETA %s' % format_duration(status['pass_eta']))
+        if status['pass_index'] is not None:
+            parts.append('round ETA %s' % format_duration(status['round_eta']))
+            parts.append('fixpoint ETA %s' % format_duration(status['fixpoint_eta']))
+        if status['latency'] is not None: parts.append('%.1fs per candidate' % status['latency'])
+        if status['size'] is not None and status['original_size']:
+            if status['size'] <= status['original_size']:
+                parts.append('%d/%d bytes (%d%%)' % (status['size'], status['original_size'], 100 * status['size'] // status['original_size']))
+            else:
+                parts.append('%d bytes (up from %d)' % (status['size'], status['original_size']))
+        return '[%s %s] %s' % (status['state'], format_duration(status['elapsed']), '; '.join(parts))
+
+    def report(self):
+        status = self.status()
+        if self.status_line:
+            self.log('\n%s' % self.status_text(status), force_stdout=True)
+        if self.status_file is not None:
+            tmp_name = '%s.%d.tmp' % (self.status_file, os.getpid())
+            try:
+                with open(tmp_name, 'w') as f:
+                    json.dump(dict(status, text=self.status_text(status)), f, sort_keys=True)
+                    f.write('\n')
+                if os.name == 'nt' and os.path.exists(self.status_file): os.remove(self.status_file)
+                os.rename(tmp_name, self.status_file)
+            except (IOError, OSError):
+                if os.path.exists(tmp_name): os.remove(tmp_name)
@@ -0,0 +1,105 @@
+from __future__ import with_statement
+import os, sqlite3, hashlib, json, threading
+from custom_arguments import DEFAULT_LOG, DEFAULT_VERBOSITY
+
+__all__ = ["ProjectIndex", "get_project_index", "get_file_digest", "bytes_digest"]
+
+PROJECT_INDEX_VERSION = 1
+
+def bytes_digest(contents):
+    return hashlib.sha1(contents).hexdigest()
+
+FILE_DIGESTS = {}
+
+def get_file_digest(filename):
+    """Returns the digest of the contents of filename, rehashing the
+    file only when its modification time or size changes"""
+    key = os.path.abspath(filename)
+    st = os.stat(filename)
+    stamp = (st.st_mtime, st.st_size)
+    if key not in FILE_DIGESTS or FILE_DIGESTS[key][0] != stamp:
+        with open(filename, 'rb') as f:
+            FILE_DIGESTS[key] = (stamp, bytes_digest(f.read()))
+    return FILE_DIGESTS[key][1]
+
+class ProjectIndex(object):
+    """An sqlite database of facts about the files of a project, which
+    is shared between runs (and between scripts).  Each fact is stored
+    under a file, a kind, and a key, together with the digest of the
+    inputs it was computed from; a fact is only returned when it is
+    looked up with the same digest, so stale facts are never used."""
+    def __init__(self, path, log=DEFAULT_LOG, verbose=DEFAULT_VERBOSITY):
+        self.path = path
+        self.log = log
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        try:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.Error:
+            pass
+        with self.lock:
+            version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+            with self.conn:
+                if version != PROJECT_INDEX_VERSION:
+                    self.conn.execute('DROP TABLE IF EXISTS files')
+                    self.conn.execute('DROP TABLE IF EXISTS facts')
+                    self.conn.execute('PRAGMA user_version = %d' % PROJECT_INDEX_VERSION)
+                self.conn.execute('CREATE TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY, digest TEXT NOT NULL, libname TEXT)')
+                self.conn.execute('CREATE TABLE IF NOT EXISTS facts (filename TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL, '
+                                  'digest TEXT NOT NULL, value BLOB NOT NULL, PRIMARY KEY (filename, kind, key))')
+
+    def warn(self, e):
+        self.log('WARNING: Error accessing the project index %s (%s)' % (self.path, repr(e)))
+
+    def record_file(self, filename, digest, libname):
+        try:
+            with self.lock:
+                with self.conn:
+                    self.conn.execute('INSERT OR REPLACE INTO files (filename, digest, libname) VALUES (?, ?, ?)',
+                                      (os.path.abspath(filename), digest, libname))
+        except sqlite3.Error as e:
+            self.warn(e)
+
+    def get_bytes(self, filename, kind, key, digest):
+        try:
+            with self.lock:
+                row = self.conn.execute('SELECT digest, value FROM facts WHERE filename = ? AND kind = ? AND key = ?',
+                                        (os.path.abspath(filename), kind, key)).fetchone()
+        except sqlite3.Error as e:
+            self.warn(e)
+            return None
+        if row is None or row[0] != digest: return None
+        if self.verbose >= 3: self.log('Using %s %s of %s from the project index' % (kind, key, filename))
+        return bytes(row[1])
+
+    def put_bytes(self, filename, kind, key, digest, value):
+        try:
+            with self.lock:
+                with self.conn:
+                    self.conn.execute('INSERT OR REPLACE INTO facts (filename, kind, key, digest, value) VALUES (?, ?, ?, ?, ?)',
+                                      (os.path.abspath(filename), kind, key, digest, sqlite3.Binary(value)))
+        except sqlite3.Error as e:
+            self.warn(e)
+
+    def get_json(self, filename, kind, key, digest):
+        value = self.get_bytes(filename, kind, key, digest)
+        if value is None: return None
+        return json.loads(value.decode('utf-8'))
+
+    def put_json(self, filename, kind, key, digest, value):
+        self.put_bytes(filename, kind, key, digest, json.dumps(value, separators=(',', ':')).encode('utf-8'))
+
+PROJECT_INDICES = {}
+
+def get_project_index(project_index=None, log=DEFAULT_LOG, verbose=DEFAULT_VERBOSITY, **kwargs):
+    """Returns the ProjectIndex stored at the path project_index, or
+    None if project_index is None or the index cannot be opened"""
+    if project_index is None: return None
+    if project_index not in PROJECT_INDICES:
+        try:
+            PROJECT_INDICES[project_index] = ProjectIndex(project_index, log=log, verbose=verbose)
+        except sqlite3.Error as e:
+            log('WARNING: Could not open the project index %s (%s); not using it.' % (project_index, repr(e)))
+            PROJECT_INDICES[project_index] = None
+    return PROJECT_INDICES[project_index]
@@ -0,0 +1,159 @@
+import heapq
+
+__all__ = ["discover_graph", "strongly_connected_components", "transitive_closure", "transitive_closure_sizes", "transitively_close", "topological_sort"]
+
+# Graphs are dicts mapping each node to an iterable of its successors
+# (for require graphs, the libraries that it requires).
+
+def discover_graph(graph, successors):
+    """Adds every node reachable from the nodes of graph, mapping each
+    new node v to successors(v), which is called once per node.
+    Returns graph, which is modified in place."""
+    stack = list(graph.keys())
+    while stack:
+        for v in graph[stack.pop()]:
+            if v not in graph:
+                graph[v] = successors(v)
+                stack.append(v)
+    return graph
+
+def strongly_connected_components(graph):
+    """Returns the list of strongly connected components (lists of
+    nodes) of graph, in which every component comes after all of the
+    components that it reaches.  Successors which are not nodes of
+    graph are ignored.
+
+    This is Tarjan's algorithm, with an explicit stack, so that long
+    chains of requires do not hit the recursion limit."""
+    index, lowlink = {}, {}
+    on_stack = set()
+    stack, components = [], []
+    for root in graph.keys():
+        if root in index: continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+        while work:
+            v, successors = work[-1]
+            descended = False
+            for w in successors:
+                if w not in graph: continue
+                if w not in index:
+                    index[w] = lowlink[w] = len(index)
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(graph[w])))
+                    descended = True
+                    break
+                elif w in on_stack:
+                    lowlink[v] = min(lowlink[v], index[w])
+            if descended: continue
+            work.pop()
+            if work:
+                u = work[-1][0]
+                lowlink[u] = min(lowlink[u], lowlink[v])
+            if lowlink[v] == index[v]:
+                component = []
+                while True:
+                    w = stack.pop()
+                    on_stack.discard(w)
+                    component.append(w)
+                    if w == v: break
+                components.append(component)
+    return components
+
+def transitive_closure_bitsets(graph, reflexive=True):
+    """Returns a triple of the list of nodes of graph, its strongly
+    connected components (as returned by strongly_connected_components),
+    and a dict mapping each node to its closure, as an integer whose
+    bit i is set if the node reaches the i-th node.  Each component
+    shares one closure, so this takes time linear in the size of the
+    graph times the number of machine words in a bitset."""
+    components = strongly_connected_components(graph)
+    nodes = [v for component in components for v in component]
+    position = dict((v, i) for i, v in enumerate(nodes))
+    component_of = {}
+    for n, component in enumerate(components):
+        for v in component:
+            component_of[v] = n
+    reach = [0] * len(components) # reflexive closure of each component
+    closure = {}
+    for n, component in enumerate(components):
+        bits = 0
+        on_cycle = len(component) > 1
+        for v in component:
+            bits |= 1 << position[v]
+            for w in graph[v]:
+                if w not in component_of: continue
+                if component_of[w] == n:
+                    on_cycle = True
+                else:
+                    bits |= reach[component_of[w]]
+        reach[n] = bits
+        for v in component:
+            closure[v] = bits if (reflexive or on_cycle) else bits & ~(1 << position[v])
+    return nodes, components, closure
+
+def bitset_to_set(nodes, bits):
+    rtn = set()
+    while bits:
+        low = bits & -bits
+        rtn.add(nodes[low.bit_length() - 1])
+        bits ^= low
+    return rtn
+
+def transitive_closure(graph, reflexive=True):
+    """Returns a dict mapping each node of graph to the set of nodes
+    that it reaches (including itself if reflexive is True)"""
+    nodes, components, closure = transitive_closure_bitsets(graph, reflexive=reflexive)
+    sets = {}
+    for bits in closure.values():
+        if bits not in sets: sets[bits] = frozenset(bitset_to_set(nodes, bits))
+    return dict((v, set(sets[bits])) for v, bits in closure.items())
+
+def transitive_closure_sizes(graph, reflexive=True):
+    """Returns a dict mapping each node of graph to the number of nodes
+    that it reaches (including itself if reflexive is True)"""
+    nodes, components, closure = transitive_closure_bitsets(graph, reflexive=reflexive)
+    return dict((v, bin(bits).count('1')) for v, bits in closure.items())
+
+def transitively_close(d, make_new_value=(lambda x: tuple()), reflexive=True):
+    """Replaces the value of each key of d by the set of keys that it
+    reaches, adding a key for every node reachable from a key of d,
+    with initial value make_new_value(node).  Returns d."""
+    discover_graph(d, make_new_value)
+    d.update(transitive_closure(d, reflexive=reflexive))
+    return d
+
+def topological_sort(graph, key=(lambda v: v)):
+    """Returns the nodes of graph ordered so that every node comes
+    after its successors, with the nodes of each cycle adjacent.
+    Among the nodes that are ready to be placed, the one with the
+    least key comes first."""
+    components = strongly_connected_components(graph)
+    component_of = {}
+    for n, component in enumerate(components):
+        for v in component:
+            component_of[v] = n
+    blockers = [set() for component in components]
+    dependents = [[] for component in components]
+    for n, component in enumerate(components):
+        for v in component:
+            for w in graph[v]:
+                m = component_of.get(w, n)
+                if m != n and m not in blockers[n]:
+                    blockers[n].add(m)
+                    dependents[m].append(n)
+    component_keys = [min(key(v) for v in component) for component in components]
+    ready = [(component_keys[n], n) for n in range(len(components)) if not blockers[n]]
+    heapq.heapify(ready)
+    rtn = []
+    while ready:
+        k, n = heapq.heappop(ready)
+        rtn.extend(sorted(components[n], key=key))
+        for m in dependents[n]:
+            blockers[m].discard(n)
+            if not blockers[m]:
+                heapq.heappush(ready, (component_keys[m], m))
+    return rtn
@@ -0,0 +1,157 @@
+from __future__ import with_statement
+import os, sys, time, threading
+
+__all__ = ["SamplingProfiler", "is_waiting_on_coq"]
+
+# A sampling profiler for the Python side of minimization: a
+# background thread looks at the stack of the profiled thread every
+# interval seconds, and charges the wall-clock time since the previous
+# look to that stack.  Samples taken while the thread is waiting on a
+# child process (coqc, coqtop, coq_makefile, make, or a worker of the
+# oracle daemon) are put under [coq], and all others under [python],
+# so that the time the tool itself spends between oracle calls (on
+# regexes, joining strings, copying dicts, logging, ...) stands out.
+#
+# The result is written as collapsed stacks, one line per distinct
+# stack with its time in microseconds, as flamegraph.pl and speedscope
+# read them, and summarized as the functions which took the most time
+# under [python], by their own time and including their callees, along
+# with the CPU time of the process and of its children.
+
+# (file, function) pairs whose frames mean that the thread is waiting
+# on a child process; a function of None matches the whole file
+WAIT_POINTS = (('subprocess.py', None),
+               ('Popen_noblock.py', None),
+               ('diagnose_error.py', 'timeout_Popen_communicate'),
+               ('oracle_daemon.py', 'communicate'))
+# files in which a thread blocks on other threads
+BLOCKING_FILES = ('threading.py', 'queue.py', 'Queue.py')
+# functions which, when blocked on other threads, are waiting on child
+# processes: the jobs of run_dag_in_parallel run coq, and the reader
+# thread of get_coq_output_iterable reads the output of coqtop
+JOIN_POINTS = (('parallel_util.py', 'run_dag_in_parallel'),
+               ('diagnose_error.py', 'get_coq_output_iterable'))
+
+COQ_CATEGORY = '[coq]'
+PYTHON_CATEGORY = '[python]'
+
+def frame_label(code):
+    return '%s (%s)' % (code.co_name, os.path.basename(code.co_filename))
+
+def is_waiting_on_coq(codes):
+    """Returns whether a stack, given as a sequence of code objects
+    from the outermost to the innermost, is waiting on a child
+    process"""
+    locations = [(os.path.basename(code.co_filename), code.co_name) for code in codes]
+    for file_name, function in locations:
+        for wait_file, wait_function in WAIT_POINTS:
+            if file_name == wait_file and (wait_function is None or function == wait_function):
+                return True
+    blocked = False
+    while locations and locations[-1][0] in BLOCKING_FILES:
+        locations.pop()
+        blocked = True
+    return blocked and bool(locations) and locations[-1] in JOIN_POINTS
+
+def process_cpu_times():
+    times = os.times()
+    return (times[0] + times[1], times[2] + times[3])
+
+class SamplingProfiler(object):
+    def __init__(self, interval=0.005, thread_ident=None):
+        self.interval = interval
+        self.thread_ident = thread_ident
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.stacks = {} # (category, label, ...) -> seconds
+        self.labels = {} # code -> label
+        self.samples = 0
+        self.start_time = self.stop_time = None
+        self.start_cpu = self.stop_cpu = None
+
+    def start(self):
+        if self.thread is not None: return
+        if self.thread_ident is None: self.thread_ident = threading.current_thread().ident
+        self.start_time, self.start_cpu = time.time(), process_cpu_times()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.stop_time, self.stop_cpu = time.time(), process_cpu_times()
+
+    def run(self):
+        last = time.time()
+        while not self.stopped.is_set():
+            time.sleep(self.interval)
+            now = time.time()
+            self.sample(now - last)
+            last = now
+
+    def label(self, code):
+        if code not in self.labels: self.labels[code] = frame_label(code)
+        return self.labels[code]
+
+    def sample(self, seconds):
+        frame = sys._current_frames().get(self.thread_ident)
+        if frame is None: return
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+        category = COQ_CATEGORY if is_waiting_on_coq(codes) else PYTHON_CATEGORY
+        stack = (category,) + tuple(self.label(code) for code in codes)
+        with self.lock:
+            self.stacks[stack] = self.stacks.get(stack, 0.0) + seconds
+            self.samples += 1
+
+    def category_times(self):
+        times = {COQ_CATEGORY: 0.0, PYTHON_CATEGORY: 0.0}
+        with self.lock:
+            for stack, seconds in self.stacks.items():
+                times[stack[0]] += seconds
+        return times
+
+    def function_times(self, category=PYTHON_CATEGORY):
+        """Returns dicts mapping each function to its own time, and to
+        its time including its callees, in the samples under
+        category"""
+        self_times, total_times = {}, {}
+        with self.lock:
+            for stack, seconds in self.stacks.items():
+                if stack[0] != category or len(stack) < 2: continue
+                self_times[stack[-1]] = self_times.get(stack[-1], 0.0) + seconds
+                for label in set(stack[1:]):
+                    total_times[label] = total_times.get(label, 0.0) + seconds
+        return self_times, total_times
+
+    def write_collapsed(self, path):
+        with self.lock:
+            stacks = sorted(self.stacks.items())
+        with open(path, 'w') as f:
+            for stack, seconds in stacks:
+                micros = int(round(seconds * 1e6))
+                if micros > 0: f.write('%s %d\n' % (';'.join(label.replace(';', ':') for label in stack), micros))
+
+    def summary(self, top=20):
+        wall = (self.stop_time if self.stop_time is not None else time.time()) - self.start_time
+        stop_cpu = self.stop_cpu if self.stop_cpu is not None else process_cpu_times()
+        cpu, children_cpu = stop_cpu[0] - self.start_cpu[0], stop_cpu[1] - self.start_cpu[1]
+        times = self.category_times()
+        sampled = max(times[COQ_CATEGORY] + times[PYTHON_CATEGORY], 1e-9)
+        lines = ['Wall-clock time: %.1f s (%d samples)' % (wall, self.samples),
+                 '  waiting on coq: %.1f s (%.0f%%)' % (times[COQ_CATEGORY], 100 * times[COQ_CATEGORY] / sampled),
+                 '  in python:      %.1f s (%.0f%%)' % (times[PYTHON_CATEGORY], 100 * times[PYTHON_CATEGORY] / sampled),
+                 'CPU time: %.1f s in this process, %.1f s in its children' % (cpu, children_cpu)]
+        self_times, total_times = self.function_times()
+        for title, function_times in (('own time', self_times), ('time including callees', total_times)):
+            lines.append('Top %d functions in python by %s:' % (top, title))
+            for label, seconds in sorted(function_times.items(), key=(lambda item: (-item[1], item[0])))[:top]:
+                lines.append('  %8.2f s  %5.1f%%  %s' % (seconds, 100 * seconds / sampled, label))
+        return '\n'.join(lines)
@@ -4,6 +4,7 @@ import split_definitions_old
 from split_file import postprocess_split_proof_term
 from coq_version import get_coq_accepts_time, get_proof_term_works_with_time
 from custom_arguments import DEFAULT_LOG, DEFAULT_VERBOSITY
+import diagnose_error
 import util
 
 __all__ = ["join_definitions", "split_statements_to_definitions"]
@@ -37,6 +38,17 @@ def get_definitions_diff(previous_definition_string, new_definition_string):
                 tuple(i for i in old_definitions if i in new_definitions),
                 tuple(i for i in new_definitions if i not in old_definitions))
 
+TIME_REG = re.compile(r'^\s*([0-9]*\.?[0-9]*)\s*secs')
+
+def get_time(response_text):
+    """Returns the number of seconds reported by -time at the start
+    of response_text, or 0.0 if there is no (parsable) time"""
+    match = TIME_REG.match(response_text)
+    try:
+        return float(match.group(1)) if match else 0.0
+    except ValueError:
+        return 0.0
+
 def strip_newlines(string):
     if not string: return string
     if string[0] == '\n': return string[1:]
@@ -45,7 +57,8 @@ def strip_newlines(string):
 
 def split_statements_to_definitions(statements, verbose=DEFAULT_VERBOSITY, log=DEFAULT_LOG, coqtop='coqtop', coqtop_args=tuple(), **kwargs):
     """Splits a list of statements into chunks which make up
-    independent definitions/hints/etc."""
+    independent definitions/hints/etc.  Each definition records, under
+    'time', the number of seconds coqtop took on its statements."""
     def fallback():
         if verbose: log("Your version of coqtop doesn't support -time.  Falling back to more error-prone method.")
         return split_definitions_old.split_statements_to_definitions(statements, verbose=verbose, log=log, coqtop=coqtop, coqtop_args=coqtop_args)
@@ -54,7 +67,7 @@ def split_statements_to_definitions(statements, verbose=DEFAULT_VERBOSITY, log=D
         return fallback()
     if not get_proof_term_works_with_time(coqtop, is_coqtop=True, verbose=verbose, log=log, **kwargs):
         statements = postprocess_split_proof_term(statements, log=log, verbose=verbose, **kwargs)
-    p = Popen([coqtop, '-q', '-emacs', '-time'] + list(coqtop_args), stdout=PIPE, stderr=STDOUT, stdin=PIPE)
+    cmds = [coqtop, '-q', '-emacs', '-time'] + list(coqtop_args)
     split_reg = re.compile(r'Chars ([0-9]+) - ([0-9]+) [^\s]+ (.*?)(?=Chars [0-9]+ - [0-9]+|$)'.replace(' ', r'\s*'),
                            flags=re.DOTALL)
     prompt_reg = re.compile(r'^(.*?)<prompt>([^<]*?) < ([0-9]+) ([^<]*?) ([0-9]+) < ([^<]*?)</prompt>'.replace(' ', r'\s*'),
@@ -65,8 +78,19 @@ def split_statements_to_definitions(statements, verbose=DEFAULT_VERBOSITY, log=D
     statements_bytes = statements_string.encode('utf-8')
     if verbose: log('Sending statements to coqtop...')
     if verbose >= 3: log(statements_string)
-    (stdout, stderr) = p.communicate(input=statements_bytes)
-    stdout = util.s(stdout)
+    cassette = kwargs.get('oracle_cassette')
+    replayed = cassette.replay('session', cmds, statements_bytes) if cassette is not None else None
+    if replayed is not None:
+        (stdout, returncode, elapsed) = replayed
+        diagnose_error.add_oracle_stats()
+    else:
+        start = time.time()
+        p = Popen(cmds, stdout=PIPE, stderr=STDOUT, stdin=PIPE)
+        (stdout, stderr) = p.communicate(input=statements_bytes)
+        stdout = util.s(stdout)
+        elapsed = time.time() - start
+        diagnose_error.add_oracle_stats(runs=1, coq_time=elapsed)
+        if cassette is not None: cassette.record('session', cmds, statements_bytes, stdout, p.returncode, elapsed)
     if 'know what to do with -time' in stdout.strip().split('\n')[0]:
         # we're using a version of coqtop that doesn't support -time
         return fallback()
@@ -92,6 +116,7 @@ def split_statements_to_definitions(statements, verbose=DEFAULT_VERBOSITY, log=D
             continue
         response_text, cur_name, line_num1, cur_definition_names, line_num2, unknown = match.groups()
         statement = strip_newlines(statements_bytes[last_char_end:char_end].decode('utf-8'))
+        statement_time = get_time(response_text)
         last_char_end = char_end
 
         terms_defined = defined_reg.findall(response_text)
@@ -101,7 +126,7 @@ def split_statements_to_definitions(statements, verbose=DEFAULT_VERBOSITY, log=D
         # first, to be on the safe side, we add the new
         # definitions key to the dict, if it wasn't already there.
         if cur_definition_names.strip('|') and cur_definition_names not in cur_definition:
-            cur_definition[cur_definition_names] = {'statements':[], 'terms_defined':[]}
+            cur_definition[cur_definition_names] = {'statements':[], 'terms_defined':[], 'time':0.0}
 
 
         if verbose >= 2: log((statement, (char_start, char_end), definitions_removed, terms_defined, 'last_definitions:', last_definitions, 'cur_definition_names:', cur_definition_names, cur_definition.get(last_definitions, []), cur_definition.get(cur_definition_names, []), response_text))
@@ -116,6 +141,7 @@ def split_statements_to_definitions(statements, verbose=DEFAULT_VERBOSITY, log=D
         if definitions_removed:
             cur_definition[last_definitions]['statements'].append(statement)
             cur_definition[last_definitions]['terms_defined'] += terms_defined
+            cur_definition[last_definitions]['time'] += statement_time
             if cur_definition_names.strip('|'):
                 # we are still inside a definition.  For now, we
                 # flatten all definitions.
@@ -124,13 +150,15 @@ def split_statements_to_definitions(statements, verbose=DEFAULT_VERBOSITY, log=D
                 # nested definitions.
                 cur_definition[cur_definition_names]['statements'] += cur_definition[last_definitions]['statements']
                 cur_definition[cur_definition_names]['terms_defined'] += cur_definition[last_definitions]['terms_defined']
+                cur_definition[cur_definition_names]['time'] += cur_definition[last_definitions]['time']
                 del cur_definition[last_definitions]
             else:
                 # we're at top-level, so add this as a new
                 # definition
                 rtn.append({'statements':tuple(cur_definition[last_definitions]['statements']),
                             'statement':'\n'.join(cur_definition[last_definitions]['statements']),
-                            'terms_defined':tuple(cur_definition[last_definitions]['terms_defined'])})
+                            'terms_defined':tuple(cur_definition[last_definitions]['terms_defined']),
+                            'time':cur_definition[last_definitions]['time']})
                 del cur_definition[last_definitions]
                 # print('Adding:')
                 # print(rtn[-1])
@@ -143,12 +171,14 @@ def split_statements_to_definitions(statements, verbose=DEFAULT_VERBOSITY, log=D
                 # nested definitions.
                 cur_definition[cur_definition_names]['statements'].append(statement)
                 cur_definition[cur_definition_names]['terms_defined'] += terms_defined
+                cur_definition[cur_definition_names]['time'] += statement_time
             else:
                 # we're at top level, so add this as a new
                 # definition
                 rtn.append({'statements':(statement,),
                             'statement':statement,
-                            'terms_defined':tuple(terms_defined)})
+                            'terms_defined':tuple(terms_defined),
+                            'time':statement_time})
 
         # now we handle the case where we have just opened a fresh
         # definition.  We've already added the key to the
@@ -156,16 +186,19 @@ def split_statements_to_definitions(statements, verbose=DEFAULT_VERBOSITY, log=D
         elif definitions_added:
             # print(definitions_added)
             cur_definition[cur_definition_names]['statements'].append(statement)
+            cur_definition[cur_definition_names]['time'] += statement_time
         else:
             # if we're in a definition, append the statement to
             # the queue, otherwise, just add it as it's own
             # statement
             if cur_definition_names.strip('|'):
                 cur_definition[cur_definition_names]['statements'].append(statement)
+                cur_definition[cur_definition_names]['time'] += statement_time
             else:
                 rtn.append({'statements':(statement,),
                             'statement':statement,
-                            'terms_defined':tuple()})
+                            'terms_defined':tuple(),
+                            'time':statement_time})
 
         last_definitions = cur_definition_names
 
@@ -173,7 +206,8 @@ def split_statements_to_definitions(statements, verbose=DEFAULT_VERBOSITY, log=D
     if last_definitions.strip('||'):
         rtn.append({'statements':tuple(cur_definition[cur_definition_names]['statements']),
                     'statement':'\n'.join(cur_definition[cur_definition_names]['statements']),
-                    'terms_defined':tuple(cur_definition[cur_definition_names]['terms_defined'])})
+                    'terms_defined':tuple(cur_definition[cur_definition_names]['terms_defined']),
+                    'time':cur_definition[cur_definition_names]['time']})
         del cur_definition[last_definitions]
 
     if last_char_end + 1 < len(statements_bytes):
@@ -0,0 +1,193 @@
+from __future__ import with_statement
+import os, json, time
+from custom_arguments import DEFAULT_LOG, DEFAULT_VERBOSITY
+from project_index import bytes_digest
+
+__all__ = ["StateJournal", "JOURNAL_EXT", "text_digest", "definitions_digest"]
+
+# The journal is a file of JSON lines, one per event, which is only
+# ever appended to (except that a fresh run truncates it).  Replaying
+# it tells a resumed run where the previous run stopped: which
+# minimization phases are done, which round and task of the current
+# phase were running, and which candidates of that task were already
+# tried, as well as the error regex, the timeout, and the [Require]s
+# which we have already tried to inline.
+#
+# The definitions of the phase being minimized change with every
+# accepted change, so rather than journaling them, we keep a snapshot
+# of them in a separate file (written atomically, at the end of each
+# task), and journal only its digest.  The changes accepted since the
+# snapshot are journaled as edits (the index of the definition which
+# was replaced, and what it was replaced with), which are replayed on
+# top of the snapshot when resuming.  The header of the output file
+# is journaled when a phase starts, so that a resumed run does not
+# describe the lines it removed twice.
+
+JOURNAL_EXT = '.journal'
+SNAPSHOT_EXT = '.definitions'
+JOURNAL_VERSION = 1
+
+def text_digest(text):
+    if not isinstance(text, bytes): text = text.encode('utf-8')
+    return bytes_digest(text)
+
+def definitions_digest(definitions):
+    return text_digest('\n'.join(definition['statement'] for definition in definitions))
+
+def decode_definitions(definitions):
+    """Restores the tuples in definitions read back from JSON"""
+    for definition in definitions:
+        for key in ('statements', 'terms_defined'):
+            if key in definition: definition[key] = tuple(definition[key])
+    return definitions
+
+class StateJournal(object):
+    def __init__(self, path, log=DEFAULT_LOG, verbose=DEFAULT_VERBOSITY):
+        self.path = path
+        self.snapshot_path = path + SNAPSHOT_EXT
+        self.log = log
+        self.verbose = verbose
+        self.last_timeout = None
+        self.pass_number = 0
+        self.resume_tried = None
+
+    def start(self, bug_file_name):
+        """Truncates the journal, for a fresh run"""
+        with open(self.path, 'w') as f:
+            f.write(json.dumps({'event': 'start', 'version': JOURNAL_VERSION, 'bug_file': bug_file_name, 'time': time.time()}) + '\n')
+        if os.path.exists(self.snapshot_path): os.remove(self.snapshot_path)
+
+    def record(self, event, **fields):
+        fields['event'] = event
+        fields['time'] = time.time()
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(fields, sort_keys=True) + '\n')
+                f.flush()
+        except (IOError, OSError) as e:
+            self.log('WARNING: Could not write to the journal %s (%s)' % (self.path, repr(e)))
+
+    def record_timeout(self, timeout):
+        if timeout is not None and timeout != self.last_timeout:
+            self.last_timeout = timeout
+            self.record('timeout', value=timeout)
+
+    def events(self):
+        events = []
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # the last line may have been cut off when the
+                    # previous run was killed
+                    if self.verbose >= 1: self.log('WARNING: Ignoring invalid journal line: %s' % repr(line))
+        if events and not line.endswith('\n'):
+            # make sure that the events we append start on a fresh line
+            with open(self.path, 'a') as f:
+                f.write('\n')
+        return events
+
+    def load(self):
+        """Replays the journal, returning a dict describing the state
+        of the run which wrote it, or None if there is no (valid)
+        journal"""
+        if not os.path.isfile(self.path): return None
+        events = self.events()
+        if not events or events[0].get('event') != 'start' or events[0].get('version') != JOURNAL_VERSION:
+            return None
+        state = {'error_reg_string': None, 'timeout': None, 'libname_blacklist': [],
+                 'phases_done': [], 'minimize': None, 'last_accept': None, 'done': False}
+        for event in events[1:]:
+            kind, cur = event.get('event'), state['minimize']
+            if kind == 'error_reg_string':
+                state['error_reg_string'] = event['value']
+            elif kind == 'timeout':
+                state['timeout'] = event['value']
+            elif kind == 'blacklist':
+                state['libname_blacklist'] = list(event['libs'])
+            elif kind == 'accept':
+                state['last_accept'] = event['digest']
+            elif kind == 'done':
+                state['done'] = True
+            elif kind == 'minimize_start':
+                state['minimize'] = {'phase': event['phase'], 'header': event.get('header'), 'split': None, 'definitions_digest': None,
+                                     'edits': [], 'round': None, 'task': None, 'tried': {}}
+            elif cur is None:
+                continue
+            elif kind == 'definitions_split':
+                cur['split'] = {'original_line_count': event['original_line_count']}
+            elif kind == 'definitions':
+                cur['definitions_digest'], cur['edits'] = event['digest'], []
+            elif kind == 'edit':
+                cur['edits'].append((event['index'], event['definitions']))
+            elif kind == 'round_start':
+                cur['round'] = {'number': event['number'], 'digest': event['digest'], 'tasks': event['tasks']}
+                cur['task'], cur['tried'] = 0, {}
+            elif kind == 'task_start':
+                cur['task'], cur['tried'] = event['task'], {}
+            elif kind == 'candidate':
+                cur['tried'].setdefault(event['pass'], set()).update(event['digests'])
+            elif kind == 'task_done':
+                cur['task'], cur['tried'] = event['task'] + 1, {}
+            elif kind == 'minimize_done':
+                state['phases_done'].append(cur['phase'])
+                state['minimize'] = None
+        return state
+
+    def save_definitions(self, definitions):
+        """Atomically replaces the snapshot of the definitions, and
+        journals its digest"""
+        tmp_name = '%s.%d.tmp' % (self.snapshot_path, os.getpid())
+        try:
+            with open(tmp_name, 'w') as f:
+                json.dump(definitions, f, separators=(',', ':'))
+            if os.name == 'nt' and os.path.exists(self.snapshot_path): os.remove(self.snapshot_path)
+            os.rename(tmp_name, self.snapshot_path)
+        except (IOError, OSError) as e:
+            self.log('WARNING: Could not write the definitions snapshot %s (%s)' % (self.snapshot_path, repr(e)))
+            if os.path.exists(tmp_name): os.remove(tmp_name)
+            return
+        self.record('definitions', digest=definitions_digest(definitions))
+
+    def record_edit(self, index, new_definitions):
+        """Journals the replacement of the definition at index by
+        new_definitions"""
+        self.record('edit', index=index, definitions=new_definitions)
+
+    def load_definitions(self, digest, edits=()):
+        """Returns the snapshot of the definitions, with edits applied,
+        if the digest of the snapshot is digest, and None otherwise"""
+        try:
+            with open(self.snapshot_path, 'r') as f:
+                definitions = decode_definitions(json.load(f))
+        except (IOError, OSError, ValueError) as e:
+            if self.verbose >= 1: self.log('WARNING: Could not read the definitions snapshot %s (%s)' % (self.snapshot_path, repr(e)))
+            return None
+        if definitions_digest(definitions) != digest: return None
+        for index, new_definitions in edits:
+            if not 0 <= index < len(definitions): return None
+            definitions[index:index + 1] = decode_definitions(new_definitions)
+        return definitions
+
+    def begin_task(self, task, timeout, tried=None):
+        self.record_timeout(timeout)
+        self.record('task_start', task=task)
+        self.pass_number = 0
+        self.resume_tried = tried
+
+    def end_task(self, task, definitions):
+        self.save_definitions(definitions)
+        self.record('task_done', task=task)
+        self.resume_tried = None
+
+    def begin_pass(self):
+        """Returns the set of digests of the statements which were
+        already tried by the pass which is starting, if we are resuming
+        it"""
+        self.pass_number += 1
+        if self.resume_tried is None: return frozenset()
+        return frozenset(self.resume_tried.get(self.pass_number, ()))
+
+    def record_candidate(self, statements):
+        self.record('candidate', digests=[text_digest(statement) for statement in statements], **{'pass': self.pass_number})
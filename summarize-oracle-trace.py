@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+from __future__ import print_function
+import json
+from argparse_compat import argparse
+from oracle_trace import read_trace, summarize_trace, format_trace_summary
+
+parser = argparse.ArgumentParser(description='Summarize an oracle trace written by find-bug.py --oracle-trace')
+parser.add_argument('trace', metavar='TRACE', type=str,
+                    help='The trace file to summarize.')
+parser.add_argument('--top', metavar='N', dest='top', type=int, default=10,
+                    help='The number of slowest coqc runs to list (Default: 10).')
+parser.add_argument('--json', dest='json', action='store_const', const=True, default=False,
+                    help='Print the summary as JSON, rather than as a table.')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    summary = summarize_trace(read_trace(args.trace), top=args.top)
+    if args.json:
+        print(json.dumps(summary, sort_keys=True, indent=2))
+    else:
+        print(format_trace_summary(summary))
@@ -0,0 +1,93 @@
+import time, re
+
+__all__ = ["TimeBudget", "TimeBudgetExhausted", "parse_duration"]
+
+DURATION_REG = re.compile(r'^\s*([0-9]*\.?[0-9]+)\s*([smhd]?)\s*$')
+DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+def parse_duration(string):
+    """Parses a number of seconds, optionally with a unit (s, m, h, or
+    d), such as 90, 1.5h, or 30m"""
+    match = DURATION_REG.match(string)
+    if not match: raise ValueError('Invalid duration: %s' % repr(string))
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+class TimeBudgetExhausted(Exception):
+    pass
+
+class TimeBudget(object):
+    """A wall-clock deadline for minimization, together with a record
+    of how much time each pass took and how many bytes it removed,
+    which is used to plan the passes and to summarize the run"""
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.start = time.time()
+        self.deadline = self.start + seconds
+        self.task_stats = {} # description -> [runs, seconds, bytes removed]
+        self.last_runs = {} # description -> (seconds, bytes removed) of its last run
+        self.task_order = []
+        self.not_attempted = []
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.time())
+
+    def exhausted(self):
+        return time.time() >= self.deadline
+
+    def check(self):
+        """Raises TimeBudgetExhausted if the budget has run out"""
+        if self.exhausted():
+            raise TimeBudgetExhausted('The time budget of %d seconds has run out.' % self.seconds)
+
+    def record_task(self, description, seconds, bytes_removed):
+        if description not in self.task_stats:
+            self.task_stats[description] = [0, 0.0, 0]
+            self.task_order.append(description)
+        stats = self.task_stats[description]
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] += bytes_removed
+        self.last_runs[description] = (seconds, bytes_removed)
+
+    def rate(self, description):
+        """Returns the number of bytes that description removed per
+        second when it was last run, or None if it has not been run"""
+        if description not in self.last_runs: return None
+        seconds, bytes_removed = self.last_runs[description]
+        return bytes_removed / max(seconds, 1e-3)
+
+    def projected_seconds(self, tasks):
+        """Returns how long the (description, task) pairs in tasks took
+        when they were last run, or None if some of them have not been
+        run"""
+        if any(description not in self.last_runs for description, task in tasks): return None
+        return sum(self.last_runs[description][0] for description, task in tasks)
+
+    def plan(self, tasks):
+        """Returns tasks as they are if there is time left to run them
+        all (going by how long they took when they were last run), and
+        otherwise orders the (description, task) pairs in tasks by the
+        number of bytes they removed per second when they were last
+        run; tasks which have not been run come first, in their
+        original order"""
+        projected = self.projected_seconds(tasks)
+        if projected is None or projected <= self.remaining(): return tuple(tasks)
+        def key(indexed_task):
+            i, (description, task) = indexed_task
+            rate = self.rate(description)
+            return (0, 0, i) if rate is None else (1, -rate, i)
+        return tuple(task for i, task in sorted(enumerate(tasks), key=key))
+
+    def summary(self):
+        lines = ['Time budget: %d seconds, %d seconds used.' % (self.seconds, time.time() - self.start)]
+        if self.task_order:
+            lines.append('Attempted:')
+            for description in self.task_order:
+                runs, seconds, bytes_removed = self.task_stats[description]
+                lines.append('  %s: %d time%s, %.1f seconds, %d bytes removed'
+                             % (description, runs, '' if runs == 1 else 's', seconds, bytes_removed))
+        if self.not_attempted:
+            lines.append('Not attempted:')
+            for description in self.not_attempted:
+                lines.append('  %s' % description)
+        return '\n'.join(lines)